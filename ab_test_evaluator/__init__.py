@@ -1,2 +1,22 @@
-from .ab_test import ABTest
-from .dash_data_helper import DashDataHelper
+import importlib
+import sys
+
+# the lazy attributes below need a module-level __getattr__ (PEP 562)
+if sys.version_info < (3, 7):
+    raise ImportError('ab_test_evaluator needs Python 3.7 or later')
+
+# ABTest pulls in pandas, scipy and statsmodels, so the public names are
+# imported on first use instead of with the package
+_LAZY_ATTRIBUTES = {'ABTest': '.ab_test',
+                    'DashDataHelper': '.dash_data_helper'}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        return getattr(module, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
@@ -1,28 +1,85 @@
+import functools
 import logging
+import os
+import zlib
 
 import yaml
 import pandas as pd
 import numpy as np
 
 from . import sql_writer
-from .stats import ContinuousTestEval, BinaryTestEval
+from .executors import create_executor
+from .sketches import build_sketches
+from .kernels import poisson_accumulate
+from .result_cache import ResultCache, chained_input_hashes, result_key
+from .sources import open_source
+from .stats import ContinuousMultiTestEval, PoissonBootstrap, PoissonBootstrapTestEval
+from .suffstats import SEGMENT_KEYS, evaluate_cells, segment_stats
 
 logger = logging.getLogger(__name__)
 
+# State shared with rolling_stats worker processes, set by _init_stats_worker
+_worker_state = {}
+
+
+def _ratio(numerator, denominator, x):
+    """Ratio of two summed columns, or None if the denominator is empty"""
+    return x[numerator] / x[denominator] if x[denominator] > 0 else None
+
+
+def _init_stats_worker(test, df):
+    """Executor initializer: keep the test and event-level data in the worker"""
+    _worker_state['test'] = test
+    _worker_state['df'] = df
+    _worker_state['date'] = None
+
+
+def _run_stats_task(task):
+    """Runs a single (day, metric) task in a rolling_stats worker process"""
+    date, metric, seed = task
+    # tasks are chunked, so consecutive tasks often share a day
+    if _worker_state['date'] != date:
+        df = _worker_state['df']
+        _worker_state['run'] = df[df['DT'] <= date]
+        _worker_state['date'] = date
+    return date, metric, _worker_state['test']._run_cont_stat(_worker_state['run'], metric, seed)
+
 
 class ABTest(object):
 
-    def __init__(self, config_file, csv_file):
+    def __init__(self, config_file, csv_file, processes=None, storage=None, result_cache=None, hosts=None):
         """Creates a test defined in config_file using data from csv_file.
 
+        Without a csv_file, the data comes from the source section of the config,
+        see sources.SQLSource and sources.PartitionedCSVSource.
+
         Args:
             config_file (str): The filepath of the YAML config file for this test
-            csv_file (str): The filepath of the CSV file containing the event-level data for this test
+            csv_file (str): The filepath of the CSV file containing the event-level data for this test,
+                            a glob, directory or list of CSV files partitioned by date (read
+                            concurrently, see sources.PartitionedCSVSource), or None to use the
+                            config's source
+            processes (int): The number of worker processes used for the rolling stats.
+                             Defaults to the number of CPUs
+            storage (StorageBackend): Where to store the results. Defaults to the
+                                      SQLite file sql_writer.DATABASE_FILE
+            result_cache (ResultCache): Where to look up and save the per-day stats
+                                        of binary and continuous metrics, or a path
+                                        to open one at. Defaults to no cache
+            hosts (list): The addresses of run_worker.py workers to run the rolling
+                          stats on instead of local processes, see
+                          executors.parse_hosts. Defaults to local processes
         """
 
         logger.info("Parsing config file {}".format(config_file))
         self.config_file = config_file
         self.csv_file = csv_file
+        self.processes = processes or os.cpu_count() or 1
+        self.storage = sql_writer.get_backend(storage)
+        if isinstance(result_cache, str):
+            result_cache = ResultCache(result_cache)
+        self.result_cache = result_cache
+        self.hosts = hosts
 
         # validate the required fields are in the config file
         # then load the values
@@ -31,10 +88,15 @@ class ABTest(object):
         assert 'test_name' in y
         assert 'description' in y
         assert 'metrics' in y
+        assert y.get('bootstrap', 'resample') in ['resample', 'poisson']
         for metric, metric_dict in y['metrics'].items():
             assert 'type' in metric_dict
             assert 'function' in metric_dict
-            assert metric_dict['type'] in ['continuous', 'binary']
+            assert metric_dict['type'] in ['continuous', 'binary', 'ratio']
+        for segment, segment_dict in y.get('segments', {}).items():
+            assert 'column' in segment_dict
+        if 'source' in y:
+            assert 'query' in y['source'] or 'path' in y['source']
 
         # required
         self.test_name = y['test_name']
@@ -44,7 +106,14 @@ class ABTest(object):
 
         # optional, use defaults if it's not in there 
         self.date_field = y.get('date_field', 'DT')
-        self.test_cell_field = y.get('test_cell_field', 'TEST_CELL')        
+        self.test_cell_field = y.get('test_cell_field', 'TEST_CELL')
+        self.seed = y.get('seed', 0)
+        self.bootstrap_iterations = y.get('bootstrap_iterations', 1000)
+        self.bootstrap = y.get('bootstrap', 'resample')
+        self.row_id_field = y.get('row_id_field')
+        self.segments = y.get('segments', {})
+        self.control_cell = y.get('control_cell')
+        self.source = open_source(csv_file, y.get('source'), self.processes, self.result_cache)
 
 
     def _get_metric_function(self, metric_dict):
@@ -75,39 +144,153 @@ class ABTest(object):
         data['numerator_column'] = tok[0]
         if len(tok) > 1:
             data['denominator_column'] = tok[1]
-            data['function'] = lambda x: x[tok[0]] / x[tok[1]] if x[tok[1]] > 0 else None
         else: # this is an average
             data['denominator_column'] = 'COUNT'
-            data['function'] = lambda x: x[tok[0]] / x['COUNT'] if x['COUNT'] > 0 else None
+        # a partial (not a lambda) so the test can be sent to worker processes
+        data['function'] = functools.partial(_ratio, data['numerator_column'],
+                                             data['denominator_column'])
 
         return data
 
 
     def load_test_data(self):
         """Performs a complete refresh of the test's data using the CSV file sent.
+
+        Aggregated sources go through load_aggregated_data instead.
         """
-        df = pd.read_csv(self.csv_file)
+        if self.source.aggregated:
+            return self.load_aggregated_data()
+
+        df = self.read_events()
+        self.test_cells = self._order_cells(df['TEST_CELL'].unique())
+
+        logger.info('Aggregating sufficient statistics')
+        suffstats = self.daily_suffstats(df)
+
+        logger.info('Creating daily rollup')
+        daily_df = self.daily_rollup(df, suffstats)
+        sql_writer.insert_daily_rollup_data(daily_df, self, self.storage)
+
+        logger.info('Creating rolling stats')
+        stats_df = self.rolling_stats(df, suffstats)
+        self._insert_stats(stats_df, suffstats)
+
+        logger.info('Creating quantile sketches')
+        sketch_df = self.daily_sketches(df)
+        sql_writer.insert_sketch_data(sketch_df, self, self.storage)
+
+        if self.segments:
+            logger.info('Creating segment breakdowns')
+            self._insert_segments(self.segment_suffstats(df))
+        else:
+            sql_writer.drop_segment_data(self, self.storage)
+
+        sql_writer.bump_load_version(self, self.storage)
+
+
+    def read_events(self):
+        """Reads the source's events, with the DT, TEST_CELL and COUNT columns the stats expect"""
+        df = self.source.read_events()
         # standardize the column names and add count
         df['COUNT'] = 1
         df = df.rename({self.date_field: 'DT',
                         self.test_cell_field: 'TEST_CELL'},
                        axis=1)
         df['DT'] = pd.to_datetime(df['DT'])
+        return df
 
-        # get test cells, check that there's only 2 now
-        self.test_cells = df['TEST_CELL'].unique()
-        assert self.test_cells.shape == (2,)
+
+    def load_aggregated_data(self):
+        """Performs a complete refresh of the test's data from an aggregated source.
+
+        The source sums the per-day sufficient statistics itself (see
+        sources.SQLSource), so the events never leave it. Without the events,
+        every metric gets the closed-form stats of window_stats: continuous
+        metrics use a normal approximation instead of the bootstrap, there are
+        no quantile sketches, and segments can't have a pattern.
+        """
+        for segment, segment_dict in self.segments.items():
+            if 'pattern' in segment_dict:
+                raise ValueError('Segment {} has a pattern, which needs the events. Set aggregate: '
+                                 'false in the source to read them'.format(segment))
+
+        logger.info('Reading sufficient statistics from {}'.format(self.source))
+        columns, products = self._suffstat_columns()
+        suffstats = self.source.read_suffstats(self.date_field, self.test_cell_field, columns, products)
+
+        self.test_cells = self._order_cells(suffstats['TEST_CELL'].unique())
 
         logger.info('Creating daily rollup')
-        daily_df = self.daily_rollup(df)
-        sql_writer.insert_daily_rollup_data(daily_df, self)
+        sql_writer.insert_daily_rollup_data(self.daily_rollup(None, suffstats), self, self.storage)
 
         logger.info('Creating rolling stats')
-        stats_df = self.rolling_stats(df)
-        sql_writer.insert_rolling_stats_data(stats_df, self)
+        self._insert_stats(self.suffstats_rolling_stats(suffstats), suffstats)
+        sql_writer.drop_sketch_data(self, self.storage)
+
+        if self.segments:
+            logger.info('Creating segment breakdowns')
+            frames = []
+            for segment, segment_dict in self.segments.items():
+                segment_df = self.source.read_suffstats(self.date_field, self.test_cell_field, columns, products,
+                                                        {'SEGMENT_VALUE': segment_dict['column']})
+                segment_df['SEGMENT_VALUE'] = segment_df['SEGMENT_VALUE'].astype(str).where(
+                    segment_df['SEGMENT_VALUE'].notna(), '(none)')
+                segment_df.insert(2, 'SEGMENT_NAME', segment)
+                frames.append(segment_df)
+            self._insert_segments(pd.concat(frames, ignore_index=True))
+        else:
+            sql_writer.drop_segment_data(self, self.storage)
 
+        sql_writer.bump_load_version(self, self.storage)
 
-    def daily_rollup(self, df):
+
+    def _order_cells(self, cells):
+        """Puts the control cell first, then the other cells in order of appearance.
+
+        The control is the config's control_cell. Without one, a test with two
+        cells uses the first one to appear in the data, as before multi-cell
+        tests were supported.
+
+        Args:
+            cells (array): The distinct test cells in the data
+        Returns:
+            array: The test cells, control first
+        """
+        if len(cells) < 2:
+            raise ValueError('Test {} needs at least 2 test cells, found {}'.format(
+                self.test_name, list(cells)))
+        if self.control_cell is None:
+            if len(cells) > 2:
+                raise ValueError('Test {} has {} test cells, set control_cell in its config '
+                                 'to compare them with'.format(self.test_name, len(cells)))
+            return np.asarray(cells)
+
+        # compare as strings, YAML may have parsed the cell as a number
+        control = [cell for cell in cells if str(cell) == str(self.control_cell)]
+        if not control:
+            raise ValueError('The control cell {} of test {} is not in the data, found {}'.format(
+                self.control_cell, self.test_name, list(cells)))
+        return np.asarray(control + [cell for cell in cells if cell != control[0]])
+
+
+    def _insert_stats(self, stats_df, suffstats):
+        """Writes the rolling stats, the latest results, the sufficient statistics, the metrics and the cells"""
+        sql_writer.insert_rolling_stats_data(stats_df, self, self.storage)
+        sql_writer.update_latest_results(stats_df, self, self.storage)
+        sql_writer.insert_suffstats_data(suffstats, self, self.storage)
+        sql_writer.insert_metric_definitions(self, self.storage)
+        sql_writer.insert_cell_definitions(self, self.storage)
+
+
+    def _insert_segments(self, segment_suffstats):
+        """Writes the segment sufficient statistics, rollup and stats"""
+        sql_writer.insert_segment_suffstats_data(segment_suffstats, self, self.storage)
+        sql_writer.insert_segment_rollup_data(self.segment_rollup(segment_suffstats), self, self.storage)
+        sql_writer.insert_segment_stats_data(
+            segment_stats(segment_suffstats, self.metric_definitions, self.test_cells), self, self.storage)
+
+
+    def daily_rollup(self, df, suffstats=None):
         """Turns the event-level DataFrame into a daily rollup.
         
         Takes the event-level DataFrame and the metric definitions and
@@ -117,18 +300,14 @@ class ABTest(object):
         
         Args:
             df (DataFrame): The event-level DataFrame
+            suffstats (DataFrame): The output of daily_suffstats, if it's
+                                   already been computed
         Returns:
             DataFrame: The daily rollup DataFrame
         """
-        # copy dataframe so we don't modify the original
-        df = df.copy()
-
-        # grouping by day, so trunc
-        df['DT'] = df['DT'].dt.floor('d')
-        df = df.groupby(['DT', 'TEST_CELL']).sum().reset_index()
-        
-        for k, v in self.metric_definitions.items():
-            df[k] = df.apply(v['function'], axis=1)
+        if suffstats is None:
+            suffstats = self.daily_suffstats(df)
+        df = self._metric_values(suffstats)
             
         # Limit to metrics and DT/TEST_CELL
         columns_to_keep = [k for k in self.metric_definitions.keys()]
@@ -139,16 +318,145 @@ class ABTest(object):
         return df
 
 
-    def rolling_stats(self, df):
+    def segment_rollup(self, segment_suffstats):
+        """Turns the per-segment sufficient statistics into a daily rollup per segment.
+
+        Args:
+            segment_suffstats (DataFrame): The output of segment_suffstats
+        Returns:
+            DataFrame: The daily rollup with SEGMENT_NAME and SEGMENT_VALUE columns
+        """
+        df = self._metric_values(segment_suffstats)
+        return df[list(self.metric_definitions.keys()) + ['DT', 'TEST_CELL'] + SEGMENT_KEYS]
+
+
+    def _metric_values(self, suffstats):
+        """Adds every metric, a ratio of the summed columns, to a copy of suffstats"""
+        df = suffstats.copy()
+        for k, v in self.metric_definitions.items():
+            numerator = suffstats['SUM_' + v['numerator_column']]
+            denominator = suffstats['SUM_' + v['denominator_column']]
+            df[k] = (numerator / denominator).where(denominator > 0)
+        return df
+
+
+    def daily_suffstats(self, df):
+        """Turns the event-level DataFrame into per-day sufficient statistics.
+
+        The result has one row per DT*TEST_CELL with the number of events (COUNT)
+        and, for every column used by a metric, its sum (SUM_<column>) and sum of
+        squares (SUMSQ_<column>). Ratio metrics also get the sum of the numerator *
+        denominator cross-product (SUMXY_<numerator>_<denominator>). The aggregation
+        runs in the storage backend, inside its engine if it has one.
+
+        Args:
+            df (DataFrame): The event-level DataFrame
+        Returns:
+            DataFrame: The per-day sufficient statistics
+        """
+        columns, products = self._suffstat_columns()
+        return self.storage.aggregate_suffstats(df, columns, products)
+
+
+    def segment_suffstats(self, df):
+        """Turns the event-level DataFrame into per-day sufficient statistics by segment.
+
+        Each segment in the config is a column of the events, optionally with a
+        regular expression whose first group extracts the segment value, e.g.
+
+            segments:
+              site:
+                column: ACTION
+                pattern: SITE-(\\d+)
+
+        Every segment is aggregated in one grouped pass over the events, so the
+        cost grows with the number of events and segments, not the number of
+        segment values. Events with no match get the value "(none)".
+
+        Args:
+            df (DataFrame): The event-level DataFrame
+        Returns:
+            DataFrame: The sufficient statistics of daily_suffstats, with one row
+                       per DT*TEST_CELL*SEGMENT_NAME*SEGMENT_VALUE
+        """
+        columns, products = self._suffstat_columns()
+        frames = []
+        for segment, segment_dict in self.segments.items():
+            values = df[segment_dict['column']].astype(str)
+            if 'pattern' in segment_dict:
+                values = values.str.extract(segment_dict['pattern'], expand=False)
+            keep = ['DT', 'TEST_CELL', 'COUNT'] + [c for c in columns if c != 'COUNT']
+            events = df[keep].assign(SEGMENT_VALUE=values.fillna('(none)'))
+
+            segment_df = self.storage.aggregate_suffstats(events, columns, products, ['SEGMENT_VALUE'])
+            segment_df.insert(2, 'SEGMENT_NAME', segment)
+            frames.append(segment_df)
+
+        return pd.concat(frames, ignore_index=True)
+
+
+    def _suffstat_columns(self):
+        """Returns the columns and (numerator, denominator) products the metrics need"""
+        columns = []
+        products = []
+        for m_dict in self.metric_definitions.values():
+            for col in [m_dict['numerator_column'], m_dict['denominator_column']]:
+                if col not in columns:
+                    columns.append(col)
+            pair = (m_dict['numerator_column'], m_dict['denominator_column'])
+            if m_dict['type'] == 'ratio' and pair not in products:
+                products.append(pair)
+
+        return columns, products
+
+
+    def daily_sketches(self, df):
+        """Builds a quantile sketch per day, test cell and continuous metric.
+
+        The sketches merge into any date window, so quantiles don't need the
+        raw events. See sketches.QuantileSketch for the error bounds.
+
+        Args:
+            df (DataFrame): The event-level DataFrame
+        Returns:
+            DataFrame: The sketch buckets, one row per DT, TEST_CELL, METRIC_NAME
+                       and bucket
+        """
+        metric_columns = {k: v['numerator_column'] for k, v in self.metric_definitions.items()
+                          if v['type'] == 'continuous'}
+        return build_sketches(df, metric_columns)
+
+
+    def rolling_stats(self, df, suffstats=None):
         """Turns the event-level DataFrame into a rolling stat table.
 
         Takes the event-level DataFrame and turns it into a DataFrame which has cumulative
         stats per day. The resulting table will have columns for DT, TEST_CELL, METRIC_NAME, 
         METRIC_VALUE, P_VALUE, LOWER_CI, and UPPER_CI. The granularity of the result is one
-        row per day*test cell*metric.
+        row per day*test cell*metric. Every cell but the control is compared with the
+        control; the control's rows have a NaN P_VALUE and CIs.
+
+        Every (day, metric) pair is an independent task. Tasks are ordered by their
+        estimated cost, most expensive first, and spread across self.processes worker
+        processes, or across the run_worker.py workers in self.hosts. Each task gets its
+        own seed derived from the test's seed, the day and the metric name, and the
+        results are merged by (day, metric), so they don't depend on the number of
+        workers or on which host ran a task.
+
+        Binary and ratio metrics don't need tasks: their cumulative sufficient
+        statistics give the closed-form stats of every day and test cell at once, see
+        _run_closed_form_stats. Neither do continuous metrics when the config sets
+        bootstrap: poisson, see _run_poisson_stats.
+
+        With a result cache, every task is first looked up by a hash of everything
+        its result depends on (see _result_keys), and only the misses are run. So
+        re-importing a test after changing one metric only reruns that metric, and
+        appending a day of data only runs the new day.
 
         Args:
             df (DataFrame): The event-level DataFrame
+            suffstats (DataFrame): The output of daily_suffstats, if it's
+                                   already been computed
         Returns:
             DataFrame: The rolling stat DataFrame, with one row per day per test
                        cell per metric
@@ -156,28 +464,89 @@ class ABTest(object):
         # don't modify the original
         df = df.copy()
 
-        df['DT'] = df['DT'].dt.floor('d')
-        start_date = df['DT'].min()
-        end_date = df['DT'].max()
-        end_dates = np.arange(start_date, end_date, np.timedelta64(1, 'D'))
+        df['DT'] = df['DT'].dt.floor('D')
+        end_dates = np.sort(df['DT'].unique())
+        rows_to_date = df.groupby('DT').size().sort_index().cumsum()
 
-        df_list = []
-        for date in end_dates:
-            run = df[df['DT'] <= date]
-            df_list.append(self._run_stats(run))
-            
-        return pd.concat(df_list).reset_index(drop=True)
-        
+        closed_form_metrics = [k for k, v in self.metric_definitions.items() if v['type'] != 'continuous']
+        results = []
+        if closed_form_metrics:
+            if suffstats is None:
+                suffstats = self.daily_suffstats(df)
+            results.extend(self._run_closed_form_stats(suffstats, closed_form_metrics))
 
-    def _run_stats(self, df):
-        """Creates a stats table from the event-level DataFrame for a single time range.
+        poisson_metrics = []
+        if self.bootstrap == 'poisson':
+            poisson_metrics = [k for k, v in self.metric_definitions.items() if v['type'] == 'continuous']
+            results.extend(self._run_poisson_stats(df, poisson_metrics))
+
+        tasks = []
+        for date in end_dates:
+            for metric in self._ordered_metrics():
+                if metric not in closed_form_metrics + poisson_metrics:
+                    tasks.append((date, metric, self._task_seed(date, metric)))
+
+        if self.result_cache is not None:
+            keys = self._result_keys(df, tasks)
+            cached = self.result_cache.get_many(keys.values())
+            results.extend((date, metric, cached[key]) for (date, metric), key in keys.items()
+                           if key in cached)
+            tasks = [t for t in tasks if keys[t[:2]] not in cached]
+        tasks.sort(key=lambda t: self._task_cost(t[1], rows_to_date[t[0]]), reverse=True)
+
+        if tasks and (self.hosts or (self.processes > 1 and len(tasks) > 1)):
+            processes = min(self.processes, len(tasks))
+            with create_executor(self.hosts, processes, _init_stats_worker, (self, df)) as executor:
+                workers = getattr(executor, 'max_workers', processes)
+                # a few chunks per worker keeps the IPC overhead low while still
+                # letting idle workers pick up the cheap tasks at the end
+                chunksize = max(1, len(tasks) // (workers * 4))
+                computed = list(executor.map(_run_stats_task, tasks, chunksize=chunksize))
+        else:
+            _init_stats_worker(self, df)
+            computed = [_run_stats_task(task) for task in tasks]
+        results.extend(computed)
+
+        if self.result_cache is not None:
+            self.result_cache.put_many({keys[(date, metric)]: stat_df for date, metric, stat_df in computed})
+            stats = self.result_cache.stats()
+            logger.info('Result cache: {} of {} lookups hit, {} entries, {:.1f} MB'.format(
+                stats['hits'], stats['hits'] + stats['misses'], stats['entries'], stats['bytes'] / 2 ** 20))
+
+        return self._combine_stats(results, end_dates)
+
+
+    def suffstats_rolling_stats(self, suffstats):
+        """Turns the per-day sufficient statistics into a rolling stat table.
+
+        Like rolling_stats, but every metric gets the closed-form stats of its
+        cumulative sufficient statistics, for sources that don't return events.
 
         Args:
-            df (DataFrame): The event-level DataFrame, limited to the relevant date range
+            suffstats (DataFrame): The output of daily_suffstats
         Returns:
-            DataFrame: The rolling stat DataFrame, with DT set to the max DT of the event-
-                       level DataFrame
+            DataFrame: The rolling stat DataFrame, with one row per day per test
+                       cell per metric
         """
+        results = self._run_closed_form_stats(suffstats, list(self.metric_definitions.keys()))
+        return self._combine_stats(results, np.sort(suffstats['DT'].unique()))
+
+
+    def _combine_stats(self, results, end_dates):
+        """Stacks (day, metric, DataFrame) results in day and metric order"""
+        results = {(date, metric): stat_df for date, metric, stat_df in results}
+        df_list = []
+        for date in end_dates:
+            output = pd.concat([results[(date, metric)] for metric in self._ordered_metrics()])
+            # set the date to the day, since this is a cumulative calculation
+            output['DT'] = date
+            df_list.append(output)
+
+        return pd.concat(df_list).reset_index(drop=True)
+
+
+    def _ordered_metrics(self):
+        """Returns the metric names in output order: binary and ratio metrics, then continuous"""
         binary_metrics = []
         cont_metrics = []
 
@@ -186,91 +555,184 @@ class ABTest(object):
                 cont_metrics.append(metric)
             else:
                 binary_metrics.append(metric)
-                    
-        metric_dfs = []
-        for metric in binary_metrics:
-            metric_dfs.append(self._run_binary_stat(df, metric))
-        for metric in cont_metrics:
-            metric_dfs.append(self._run_cont_stat(df, metric))
-        
-        output = pd.concat(metric_dfs).reset_index(drop=True)
-        # set the date to the max date, since this is a cumulative calculation
-        output['DT'] = df['DT'].max()
-        return output
 
+        return binary_metrics + cont_metrics
 
-    def _run_binary_stat(self, df, metric):
-        # decide later how to actually define which cell is test and
-        # which is control
-        test = self.test_cells[0]
-        ctrl = self.test_cells[1]
 
-        numerator = self.metric_definitions[metric]['numerator_column']
-        denominator = self.metric_definitions[metric]['denominator_column']
-
-        data = {'TEST_CELL': [],
-                'METRIC_NAME': [],
-                'METRIC_VALUE': []}
-        trial_data = {}
-        for cell in [test, ctrl]:
-            successes = df[df['TEST_CELL'] == cell][numerator].sum()
-            trials = df[df['TEST_CELL'] == cell][denominator].sum()
-            failures = trials - successes
-
-            # save data
-            data['TEST_CELL'].append(cell)
-            data['METRIC_NAME'].append(metric)
-            data['METRIC_VALUE'].append(successes / trials)
-            
-            # convert to 0s and 1s for BinaryTestEval
-            trial_data[cell] = np.concatenate((np.ones(successes), np.zeros(failures)))
-
-        # send to stats
-        b = BinaryTestEval(trial_data[test], trial_data[ctrl])
-        # calculate p-val, append to both test and control rows
-        p_val = b.binary_pval()
-        data['P_VALUE'] = [p_val, p_val]
-        lower, upper = b.binary_ci()
-        # calculate CIs, append to both
-        data['LOWER_CI'] = [lower, lower]
-        data['UPPER_CI'] = [upper, upper]
-
-        return pd.DataFrame(data)
-
-    def _run_cont_stat(self, df, metric):
-        # assumes denominator is COUNT
-        test = self.test_cells[0]
-        ctrl = self.test_cells[1]
+    def _task_cost(self, metric, n_rows):
+        """Estimates the relative cost of computing a metric over n_rows events"""
+        if self.metric_definitions[metric]['type'] == 'continuous':
+            # two bootstraps per test cell, each resampling every row per iteration
+            return 2 * (len(self.test_cells) - 1) * self.bootstrap_iterations * n_rows
+        return n_rows
+
+
+    def _task_seed(self, date, metric):
+        """Creates the seed for a (day, metric) task.
+
+        The seed only depends on the test's seed, the day and the metric name, so
+        adding a metric or a day doesn't change the random draws of the others.
+        """
+        day_number = int(np.datetime64(date, 'D').astype(np.int64))
+        metric_key = zlib.crc32(metric.encode('utf-8'))
+        return np.random.SeedSequence(self.seed, spawn_key=(day_number, metric_key))
+
+
+    def _result_keys(self, df, tasks):
+        """Creates the result cache key of every (day, metric) task.
 
+        Only continuous metrics with the resampling bootstrap become tasks, the
+        others are computed for every day at once and never cached. A key hashes
+        the metric's definition and name (which the task seed is derived from),
+        the test cells, a hash of the metric's columns for every event up to the
+        day, the bootstrap iterations and the test's seed.
+
+        Args:
+            df (DataFrame): The event-level DataFrame, with DT truncated to the day
+            tasks (list): The (day, metric, seed) tasks
+        Returns:
+            dict: {(day, metric): key}
+        """
+        input_hashes = {}
+        keys = {}
+        for date, metric, seed in tasks:
+            m_dict = self.metric_definitions[metric]
+            columns = ['TEST_CELL', m_dict['numerator_column'], m_dict['denominator_column']]
+            if metric not in input_hashes:
+                input_hashes[metric] = chained_input_hashes(df, list(dict.fromkeys(columns)))
+
+            keys[(date, metric)] = result_key(
+                metric=metric,
+                definition=[m_dict['type'], m_dict['numerator_column'], m_dict['denominator_column']],
+                test_cells=[str(c) for c in self.test_cells],
+                inputs=input_hashes[metric][pd.Timestamp(date)],
+                method='bootstrap',
+                iterations=self.bootstrap_iterations,
+                seed=self.seed)
+        return keys
+
+
+    def _stat_frame(self, metric, values, p_vals, lower, upper):
+        """Builds the stats of one (day, metric), one row per test cell, control first.
+
+        Args:
+            metric (str): The name of the metric
+            values (list): The metric's value in every test cell, control first
+            p_vals, lower, upper (list): The P_VALUE, LOWER_CI and UPPER_CI of every
+                                         test cell but the control
+        Returns:
+            DataFrame: The stats, with NaN for the control's P_VALUE and CIs
+        """
+        return pd.DataFrame({'TEST_CELL': self.test_cells,
+                             'METRIC_NAME': metric,
+                             'METRIC_VALUE': values,
+                             'P_VALUE': np.append(np.nan, p_vals),
+                             'LOWER_CI': np.append(np.nan, lower),
+                             'UPPER_CI': np.append(np.nan, upper)})
+
+
+    def _run_closed_form_stats(self, suffstats, metrics):
+        """Runs the closed-form stats of evaluate_cells on every day at once.
+
+        This is the two-proportion z-test for binary metrics and the delta method
+        for ratio metrics, which need no tasks. All the days and test cells of a
+        metric are compared with the control in one batched call.
+
+        Args:
+            suffstats (DataFrame): The per-day sufficient statistics from daily_suffstats
+            metrics (list): The names of the metrics
+        Returns:
+            list: (day, metric, DataFrame) tuples, like the rolling_stats tasks
+        """
+        cumulative = self.storage.cumulate_suffstats(suffstats)
+        days = np.sort(cumulative['DT'].unique())
+        cell_stats = [cumulative[cumulative['TEST_CELL'] == cell].set_index('DT').loc[days]
+                      for cell in self.test_cells]
+
+        results = []
+        for metric in metrics:
+            r = evaluate_cells(self.metric_definitions[metric], cell_stats)
+            for i, date in enumerate(days):
+                results.append((date, metric, self._stat_frame(
+                    metric, r['METRIC_VALUE'][:, i], r['P_VALUE'][1:, i],
+                    r['LOWER_CI'][1:, i], r['UPPER_CI'][1:, i])))
+
+        return results
+
+
+    def _row_ids(self, df):
+        """Returns a stable integer id per event for the Poisson bootstrap weights.
+
+        Hashes the row_id_field column if the config has one, otherwise uses the
+        row's position in the CSV file.
+        """
+        if self.row_id_field is not None:
+            return pd.util.hash_pandas_object(df[self.row_id_field], index=False).values
+        return df.index.values
+
+
+    def _run_poisson_stats(self, df, metrics):
+        """Runs the Poisson bootstrap stats for continuous metrics in a single pass.
+
+        Each day's events are added to a running PoissonBootstrap per cell and
+        metric, so every cumulative day reuses the previous day's replicates
+        instead of resampling all the events up to it. The weights of each day's
+        events are drawn once and shared by all the metrics.
+
+        Args:
+            df (DataFrame): The event-level DataFrame, with DT truncated to the day
+            metrics (list): The names of the continuous metrics
+        Returns:
+            list: (day, metric, DataFrame) tuples, like the rolling_stats tasks
+        """
+        control = self.test_cells[0]
+        treatments = self.test_cells[1:]
+
+        row_ids = self._row_ids(df)
+        values = df[[self.metric_definitions[m]['numerator_column'] for m in metrics]].values.astype(float)
+        state = {cell: {m: PoissonBootstrap(self.bootstrap_iterations, self.seed) for m in metrics}
+                 for cell in self.test_cells}
+        groups = df.groupby(['DT', 'TEST_CELL']).indices
+
+        results = []
+        for date in np.sort(df['DT'].unique()):
+            for cell in self.test_cells:
+                rows = groups.get((pd.Timestamp(date), cell))
+                if rows is None:
+                    continue
+                sums, weights = poisson_accumulate(values[rows], row_ids[rows],
+                                                   self.bootstrap_iterations, self.seed)
+                for i, m in enumerate(metrics):
+                    state[cell][m].add_replicates(sums[i], weights, values[rows, i])
+
+            for m in metrics:
+                # the control's replicates are shared by every comparison
+                evals = [PoissonBootstrapTestEval(state[control][m], state[cell][m]) for cell in treatments]
+                cis = np.array([b.mean_diff_ci() for b in evals]).reshape(-1, 2)
+                results.append((date, m, self._stat_frame(
+                    m, [state[cell][m].mean for cell in self.test_cells],
+                    [b.bootstrap_pval() for b in evals], cis[:, 0], cis[:, 1])))
+
+        return results
+
+
+    def _run_cont_stat(self, df, metric, seed=None):
+        """Runs the bootstrapped stats of a continuous metric for every test cell.
+
+        The control's events are split out once and its CI replicates are shared
+        by every comparison, see stats.ContinuousMultiTestEval.
+        """
+        # assumes denominator is COUNT
         numerator = self.metric_definitions[metric]['numerator_column']
+        events = [df.loc[df['TEST_CELL'] == cell, numerator] for cell in self.test_cells]
 
-        data = {'TEST_CELL': [],
-                'METRIC_NAME': [],
-                'METRIC_VALUE': []}
-        trial_data = {}
-        for cell in [test, ctrl]:
-            individ_events = df[df['TEST_CELL'] == cell][numerator]
-            # save data
-            data['TEST_CELL'].append(cell)
-            data['METRIC_NAME'].append(metric)
-            data['METRIC_VALUE'].append(individ_events.mean())
-            
-            # convert to 0s and 1s for BinaryTestEval
-            trial_data[cell] = individ_events
-
-        # send to stats
-        b = ContinuousTestEval(trial_data[test], trial_data[ctrl])
-        # calculate p-val, append to both test and control rows
-        p_val = b.continuous_pval()
-        data['P_VALUE'] = [p_val, p_val]
-        lower, upper = b.mean_diff_continuous_ci()
-        # calculate CIs, append to both
-        data['LOWER_CI'] = [lower, lower]
-        data['UPPER_CI'] = [upper, upper]
-
-        return pd.DataFrame(data)
-        
+        b = ContinuousMultiTestEval(events[0], events[1:], seed)
+        p_vals = b.continuous_pvals(self.bootstrap_iterations)
+        lower, upper = b.mean_diff_continuous_cis(self.bootstrap_iterations)
+
+        return self._stat_frame(metric, [e.mean() for e in events], p_vals, lower, upper)
         
+
     
 if __name__ == '__main__':
     t = ABTest('tests/test_config.yaml')
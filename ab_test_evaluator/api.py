@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+from flask import Blueprint, Response, abort, request
+
+from .dash_data_helper import DashDataHelper
+
+
+# Responses smaller than this aren't worth compressing
+MIN_GZIP_SIZE = 500
+
+
+def to_columnar(df):
+    """Converts a DataFrame to {column: [values]}, with dates as YYYY-MM-DD and NaN as null"""
+    data = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_datetime64_any_dtype(values):
+            values = values.dt.strftime('%Y-%m-%d')
+        values = values.astype(object).where(values.notna(), None)
+        data[col] = [v.item() if isinstance(v, np.generic) else v for v in values]
+    return data
+
+
+def _etag(*parts):
+    return hashlib.sha1(json.dumps(parts, default=str).encode('utf-8')).hexdigest()[:20]
+
+
+def _json_response(payload, etag):
+    """Builds a JSON response with an ETag, gzipped if the client accepts it"""
+    body = json.dumps(payload, separators=(',', ':'), allow_nan=False).encode('utf-8')
+    response = Response(body, mimetype='application/json')
+    response.headers['Vary'] = 'Accept-Encoding'
+    if len(body) >= MIN_GZIP_SIZE and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response.set_data(gzip.compress(body))
+        response.headers['Content-Encoding'] = 'gzip'
+        etag += '-gzip'
+    response.set_etag(etag)
+    return response
+
+
+def _not_modified(etag):
+    """Returns a 304 response if the client already has etag, otherwise None"""
+    for tag in [etag, etag + '-gzip']:
+        if request.if_none_match.contains(tag):
+            response = Response(status=304)
+            response.headers['Vary'] = 'Accept-Encoding'
+            response.set_etag(tag)
+            return response
+    return None
+
+
+def create_api(backend=None, url_prefix='/api'):
+    """Creates the read-only JSON API as a Flask blueprint.
+
+    Routes:
+        /tests: The active tests, with their description and load version
+        /tests/<test_name>/daily: The test's daily rollup
+        /tests/<test_name>/stats?metric=<metric>: The test's rolling stats, for
+                                                   one metric or all of them
+
+    Tables are returned as {"columns": {column: [values]}}. Every test's ETag
+    is derived from its load version, which each import bumps once, so a client
+    sending If-None-Match gets a 304 after a single read of the test list
+    instead of the test's tables.
+
+    Args:
+        backend (StorageBackend): The storage backend to read from. Defaults to
+                                  the SQLite file sql_writer.DATABASE_FILE
+        url_prefix (str): Where to mount the routes
+    Returns:
+        Blueprint: The API, to register on the Flask server
+    """
+    api = Blueprint('ab_test_api', __name__, url_prefix=url_prefix)
+
+    # one helper for every request, so its SQLite connections are reused
+    helper = DashDataHelper(backend=backend)
+
+    def get_version(test_name):
+        version = helper.get_load_version(test_name)
+        if version is None:
+            abort(404)
+        return version
+
+    @api.route('/tests')
+    def tests():
+        df = helper.get_active_test_list()[['test_name', 'description', 'load_version']]
+        etag = _etag('tests', df.values.tolist())
+        return _not_modified(etag) or _json_response({'columns': to_columnar(df)}, etag)
+
+    @api.route('/tests/<test_name>/daily')
+    def daily(test_name):
+        version = get_version(test_name)
+        etag = _etag('daily', test_name, version)
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+
+        df = helper.get_daily_rollup(test_name)
+        payload = {'test_name': test_name, 'load_version': version, 'columns': to_columnar(df)}
+        return _json_response(payload, etag)
+
+    @api.route('/tests/<test_name>/stats')
+    def stats(test_name):
+        version = get_version(test_name)
+        metric = request.args.get('metric')
+        etag = _etag('stats', test_name, version, metric)
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+
+        df = helper.get_rolling_stats(test_name)
+        if metric is not None:
+            df = df[df['METRIC_NAME'] == metric]
+            if df.empty:
+                abort(404)
+        payload = {'test_name': test_name, 'load_version': version, 'columns': to_columnar(df)}
+        return _json_response(payload, etag)
+
+    return api
@@ -1,37 +1,149 @@
-import sqlite3
 import pandas as pd
 
 from . import sql_writer
+from .planning import metric_baselines
+from .sketches import window_quantiles
+from .stats import QUANTILES
+from .suffstats import SEGMENT_KEYS, window_stats
 
 
 class DashDataHelper(object):
 
-    def __init__(self, db_path=sql_writer.DATABASE_FILE):
+    def __init__(self, db_path=sql_writer.DATABASE_FILE, backend=None):
+        """Reads test data for the dashboard.
+
+        Args:
+            db_path (str): The SQLite file to read from, if no backend is given. It's
+                           read through pooled read-only connections, so keep one
+                           helper rather than creating one per read
+            backend (StorageBackend): The storage backend to read from
+        """
         self.db_path = db_path
+        self.backend = backend if backend is not None else sql_writer.SQLiteBackend(db_path, read_only=True)
 
     def get_active_test_list(self):
-        query = "select * from {} where active_fg = 'Y'".format(sql_writer.TEST_LIST_TABLE)
-        with sql_writer.sqlite_connection(self.db_path) as conn:
-            df = pd.read_sql(query, conn)
-        return df
+        df = self.backend.read_test_list()
+        return df[df['active_fg'] == 'Y'].reset_index(drop=True)
+
+    def get_load_version(self, test_name):
+        """Returns the test's load version, or None if the test isn't in the list"""
+        df = self.backend.read_test_list()
+        versions = df.loc[df['test_name'] == test_name, 'load_version']
+        return int(versions.iloc[0]) if len(versions) else None
+
+    def get_latest_results(self):
+        """Returns the last day's stats of every active test, one row per test, metric and cell"""
+        return self.backend.read_latest_results()
 
-    def get_daily_rollup(self, test_name):
+    def get_daily_rollup(self, test_name, segment=None):
         # At some point, we might want to cache test data. That way, we only
         # need to query the DB when it requests a test we've never seen. The 
         # trick would be to figure out how to decide when to refresh the cache.
+        if segment is not None:
+            return self._get_segment_table(test_name + sql_writer.SEGMENT_DAILY_EXT, segment)
         table_name = test_name + sql_writer.DAILY_ROLLUP_EXT
-        query = "select * from {}".format(table_name)
-        with sql_writer.sqlite_connection(self.db_path) as conn:
-            df = pd.read_sql(query, conn, parse_dates=['DT'])
-        return df
+        return self.backend.read_table(table_name, parse_dates=['DT'])
 
-    def get_rolling_stats(self, test_name):
+    def get_rolling_stats(self, test_name, segment=None):
         # Same caching possibility as above
+        if segment is not None:
+            return self._get_segment_table(test_name + sql_writer.SEGMENT_STATS_EXT, segment)
         table_name = test_name + sql_writer.STATS_EXT
-        query = "select * from {}".format(table_name)
-        with sql_writer.sqlite_connection(self.db_path) as conn:
-            df = pd.read_sql(query, conn, parse_dates=['DT'])
-        return df
+        return self.backend.read_table(table_name, parse_dates=['DT'])
+
+    def get_segments(self, test_name):
+        """Returns the test's (SEGMENT_NAME, SEGMENT_VALUE) pairs, empty if it has no segments"""
+        table_name = test_name + sql_writer.SEGMENT_DAILY_EXT
+        if not self.backend.table_exists(table_name):
+            return pd.DataFrame(columns=SEGMENT_KEYS)
+        df = self.backend.read_table(table_name)
+        return df[SEGMENT_KEYS].drop_duplicates().sort_values(SEGMENT_KEYS).reset_index(drop=True)
+
+    def _get_segment_table(self, table_name, segment):
+        """Reads one segment's rows of a segment table, without the segment columns"""
+        df = self.backend.read_table(table_name, parse_dates=['DT'])
+        segment_name, segment_value = segment
+        df = df[(df['SEGMENT_NAME'] == segment_name) & (df['SEGMENT_VALUE'] == segment_value)]
+        return df.drop(columns=SEGMENT_KEYS).reset_index(drop=True)
+
+    def get_suffstats(self, test_name):
+        table_name = test_name + sql_writer.SUFFSTATS_EXT
+        return self.backend.read_table(table_name, parse_dates=['DT'])
+
+    def get_metric_definitions(self, test_name):
+        """Returns the test's metric definitions, in the format of ABTest.metric_definitions"""
+        table_name = test_name + sql_writer.METRICS_EXT
+        df = self.backend.read_table(table_name)
+        return {row.METRIC_NAME: {'type': row.METRIC_TYPE,
+                                  'numerator_column': row.NUMERATOR_COLUMN,
+                                  'denominator_column': row.DENOMINATOR_COLUMN}
+                for row in df.itertuples()}
+
+    def get_test_cells(self, test_name):
+        """Returns the test's cells, control first.
+
+        Tests imported before the cells were saved get the order of their rolling
+        stats, which list every day's cells in the order the import compared them.
+        Without rolling stats, the cells come in the order of the suffstats, which
+        every backend stores sorted.
+        """
+        table_name = test_name + sql_writer.CELLS_EXT
+        if not self.backend.table_exists(table_name):
+            if self.backend.table_exists(test_name + sql_writer.STATS_EXT):
+                return self.get_rolling_stats(test_name)['TEST_CELL'].unique().tolist()
+            return self.get_suffstats(test_name)['TEST_CELL'].unique().tolist()
+        df = self.backend.read_table(table_name)
+        return df.sort_values('IS_CONTROL', ascending=False, kind='stable')['TEST_CELL'].tolist()
+
+    def get_window_stats(self, test_name, start_date=None, end_date=None):
+        """Computes every metric's stats for the days between start_date and end_date.
+
+        Uses the sufficient statistics saved by the import, so any window takes a
+        single read of a table with one row per day and test cell. The tests are
+        closed-form: delta method for ratio and continuous metrics, two-proportion
+        z-test for binary metrics. For continuous metrics this is a normal
+        approximation of the bootstrap used in the rolling stats.
+
+        Args:
+            test_name (str): The name of the test
+            start_date (datetime): The first day of the window, or None for the first day
+            end_date (datetime): The last day of the window, or None for the last day
+        Returns:
+            DataFrame: One row per test cell per metric with METRIC_VALUE, P_VALUE,
+                       LOWER_CI and UPPER_CI of the cell against the control
+        """
+        return window_stats(self.get_suffstats(test_name), self.get_metric_definitions(test_name),
+                            self.get_test_cells(test_name), start_date, end_date)
+
+    def get_metric_baselines(self, test_name):
+        """Returns each metric's baseline, per-unit variance and daily traffic in a past test.
+
+        See planning.metric_baselines; the result feeds planning.planning_grid.
+        """
+        return metric_baselines(self.get_suffstats(test_name), self.get_metric_definitions(test_name))
+
+    def get_quantiles(self, test_name, start_date=None, end_date=None, quantiles=QUANTILES):
+        """Estimates quantiles of the continuous metrics for a date window.
+
+        Merges the per-day quantile sketches saved by the import, so memory
+        is bounded by the number of sketch buckets, not the number of events.
+        Each estimate is within 1% (relative) of the exact quantile.
+
+        Args:
+            test_name (str): The name of the test
+            start_date (datetime): The first day of the window, or None for the first day
+            end_date (datetime): The last day of the window, or None for the last day
+            quantiles (array): Quantiles between 0 and 1
+        Returns:
+            DataFrame: One row per metric, test cell and quantile with the estimated
+                       VALUE and the QUANTILE_DIFF between the cell and the control
+        """
+        table_name = test_name + sql_writer.SKETCHES_EXT
+        if not self.backend.table_exists(table_name):
+            # loaded from an aggregated source, without events to sketch
+            return pd.DataFrame(columns=['METRIC_NAME', 'TEST_CELL', 'QUANTILE', 'VALUE', 'QUANTILE_DIFF'])
+        sketches = self.backend.read_table(table_name, parse_dates=['DT'])
+        return window_quantiles(sketches, self.get_test_cells(test_name), quantiles, start_date, end_date)
 
 
     
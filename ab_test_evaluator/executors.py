@@ -0,0 +1,266 @@
+"""Executors the stats tasks run on, behind the concurrent.futures interface.
+
+The local backend is a ProcessPoolExecutor. The multi-host backend,
+SocketExecutor, sends the tasks to worker processes started with
+run_worker.py on any number of hosts, over authenticated
+multiprocessing.connection sockets. Functions and their arguments are pickled,
+so the workers need the same version of the package installed, and the
+functions must be importable (defined at the top level of a module).
+
+Both backends return map() results in task order, so as long as every task is
+seeded on its own (see ABTest._task_seed) the results don't depend on which
+backend, host or worker ran a task.
+"""
+import concurrent.futures
+import functools
+import itertools
+import logging
+from multiprocessing.connection import Client, Listener
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+# The shared secret of the workers and the executors that connect to them
+AUTHKEY_ENV = 'AB_TEST_WORKER_KEY'
+DEFAULT_WORKER_PORT = 6000
+
+
+def worker_authkey(authkey=None):
+    """Returns the key workers and executors authenticate each other with.
+
+    Args:
+        authkey (str): The key, or None to read it from the AB_TEST_WORKER_KEY
+                       environment variable
+    Returns:
+        bytes: The key
+    """
+    authkey = authkey or os.environ.get(AUTHKEY_ENV)
+    if not authkey:
+        raise ValueError('Workers run pickled tasks, so they need a shared key: set {}'.format(AUTHKEY_ENV))
+    return authkey.encode('utf-8') if isinstance(authkey, str) else authkey
+
+
+def parse_hosts(hosts):
+    """Parses worker addresses.
+
+    Args:
+        hosts (list): "host:port" strings, or "host:first_port-last_port" for the
+                      workers a run_worker.py --processes N started on one host.
+                      A single comma-separated string works too
+    Returns:
+        list: (host, port) addresses, one per worker
+    """
+    if isinstance(hosts, str):
+        hosts = hosts.split(',')
+    addresses = []
+    for spec in hosts:
+        host, _, ports = spec.strip().rpartition(':')
+        if not host:
+            raise ValueError('Worker address {} should be host:port'.format(spec))
+        first, _, last = ports.partition('-')
+        addresses.extend((host, port) for port in range(int(first), int(last or first) + 1))
+    return addresses
+
+
+def create_executor(hosts=None, processes=None, initializer=None, initargs=(), authkey=None):
+    """Creates the executor for a batch of tasks.
+
+    Args:
+        hosts (list): Worker addresses (see parse_hosts) for a SocketExecutor,
+                      or None for a local ProcessPoolExecutor
+        processes (int): The number of local worker processes. Defaults to the number of CPUs
+        initializer (callable): Called with initargs in every worker before its first task
+        initargs (tuple): The arguments of initializer
+        authkey (str): The workers' key, see worker_authkey
+    Returns:
+        concurrent.futures.Executor: The executor
+    """
+    if hosts:
+        return SocketExecutor(parse_hosts(hosts), initializer, initargs, authkey)
+    return concurrent.futures.ProcessPoolExecutor(processes or os.cpu_count() or 1,
+                                                  initializer=initializer, initargs=initargs)
+
+
+def _close_connection(conn):
+    """Tells the worker the executor is done with it, then closes the connection"""
+    try:
+        conn.send(('close',))
+    except OSError:
+        pass
+    conn.close()
+
+
+def _process_chunk(fn, chunk):
+    """Runs a chunk of map() calls in one round trip"""
+    return [fn(*args) for args in chunk]
+
+
+class SocketExecutor(concurrent.futures.Executor):
+
+    def __init__(self, addresses, initializer=None, initargs=(), authkey=None):
+        """Runs tasks on run_worker.py workers, one connection per worker.
+
+        Every connection has a thread that sends it the next task from a shared
+        queue as soon as its previous result is back, so faster hosts take more
+        tasks. If a worker goes away, its task goes back on the queue for the
+        others; once every worker is gone, the remaining tasks fail.
+
+        Args:
+            addresses (list): (host, port) of every worker
+            initializer (callable): Called with initargs on every worker before
+                                    its first task, e.g. to send it the data
+                                    the tasks share once
+            initargs (tuple): The arguments of initializer
+            authkey (str): The workers' key, see worker_authkey
+        """
+        authkey = worker_authkey(authkey)
+        self.addresses = list(addresses)
+        self._tasks = queue.Queue()
+        self._lock = threading.Lock()
+        self._shutdown = False
+        self._connections = [Client(tuple(address), authkey=authkey) for address in self.addresses]
+        self._alive = len(self._connections)
+
+        if initializer is not None:
+            for conn in self._connections:
+                conn.send(('call', initializer, tuple(initargs), {}))
+            replies = [conn.recv() for conn in self._connections]
+            errors = [value for status, value in replies if status == 'error']
+            if errors:
+                for conn in self._connections:
+                    _close_connection(conn)
+                raise errors[0]
+
+        self._threads = [threading.Thread(target=self._dispatch, args=(conn, address), daemon=True)
+                         for conn, address in zip(self._connections, self.addresses)]
+        for thread in self._threads:
+            thread.start()
+
+    def __repr__(self):
+        return 'SocketExecutor({} workers)'.format(len(self.addresses))
+
+    @property
+    def max_workers(self):
+        return len(self.addresses)
+
+    def submit(self, fn, *args, **kwargs):
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError('cannot schedule new futures after shutdown')
+            if not self._alive:
+                raise RuntimeError('every worker of {} is gone'.format(self))
+            future = concurrent.futures.Future()
+            self._tasks.put((future, fn, args, kwargs))
+        return future
+
+    def map(self, fn, *iterables, timeout=None, chunksize=1):
+        """Like Executor.map, sending chunksize calls per round trip"""
+        calls = zip(*iterables)
+        chunks = iter(lambda: list(itertools.islice(calls, chunksize)), [])
+        results = super().map(functools.partial(_process_chunk, fn), chunks, timeout=timeout)
+        return itertools.chain.from_iterable(results)
+
+    def _dispatch(self, conn, address):
+        """Feeds one worker tasks until shutdown or until the worker goes away"""
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                _close_connection(conn)
+                return
+            future, fn, args, kwargs = task
+            # a task put back by a lost worker is already running
+            if not future.running() and not future.set_running_or_notify_cancel():
+                continue
+            try:
+                conn.send(('call', fn, args, kwargs))
+                status, value = conn.recv()
+            except (EOFError, OSError) as e:
+                logger.warning('Lost worker {}:{}: {}'.format(address[0], address[1], e))
+                _close_connection(conn)
+                self._lose_worker(task, e)
+                return
+            if status == 'error':
+                future.set_exception(value)
+            else:
+                future.set_result(value)
+
+    def _lose_worker(self, task, error):
+        with self._lock:
+            self._alive -= 1
+            if self._alive:
+                self._tasks.put(task)
+                return
+        # that was the last worker, fail everything still waiting
+        task[0].set_exception(error)
+        self._fail_queued(error)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+            if cancel_futures:
+                while True:
+                    try:
+                        task = self._tasks.get_nowait()
+                    except queue.Empty:
+                        break
+                    if not task[0].cancel():
+                        # put back by a lost worker, already running
+                        task[0].set_exception(concurrent.futures.CancelledError())
+            for _ in self._threads:
+                self._tasks.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+            # tasks put back by a worker lost after the others had stopped
+            self._fail_queued(RuntimeError('{} shut down before running the task'.format(self)))
+
+    def _fail_queued(self, error):
+        while True:
+            try:
+                task = self._tasks.get_nowait()
+            except queue.Empty:
+                return
+            if task is not None:
+                task[0].set_exception(error)
+
+
+def _serve_connection(conn):
+    """Runs the tasks sent over one connection until it's closed"""
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        if message[0] == 'close':
+            return
+        _, fn, args, kwargs = message
+        try:
+            reply = ('ok', fn(*args, **kwargs))
+        except Exception as e:
+            logger.exception('Task {} failed'.format(getattr(fn, '__name__', fn)))
+            reply = ('error', e)
+        conn.send(reply)
+
+
+def serve(address, authkey=None):
+    """Runs a worker: accepts one executor connection at a time and runs its tasks.
+
+    Args:
+        address (tuple): The (host, port) to listen on
+        authkey (str): The workers' key, see worker_authkey
+    """
+    with Listener(tuple(address), authkey=worker_authkey(authkey)) as listener:
+        logger.info('Worker listening on {}:{}'.format(*listener.address))
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # e.g. a client with the wrong key
+                logger.warning('Refused a connection: {}'.format(e))
+                continue
+            with conn:
+                _serve_connection(conn)
@@ -0,0 +1,232 @@
+import concurrent.futures
+import html
+import json
+import logging
+import os
+import string
+import time
+
+import plotly.graph_objs as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+from plotly.utils import PlotlyJSONEncoder
+
+from . import figures
+from . import sql_writer
+from .dash_data_helper import DashDataHelper
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ['html', 'json']
+MANIFEST_FILE = 'manifest.json'
+PLOTLY_JS_FILE = 'plotly.min.js'
+VIEWER_FILE = 'viewer.html'
+INDEX_FILE = 'index.html'
+
+RES_DIR = os.path.join(os.path.dirname(__file__), 'res')
+REPORT_TEMPLATE_FILENAME = os.path.join(RES_DIR, 'report_template.html')
+VIEWER_TEMPLATE_FILENAME = os.path.join(RES_DIR, 'report_viewer.html')
+INDEX_TEMPLATE_FILENAME = os.path.join(RES_DIR, 'report_index.html')
+
+
+def _read_text(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+
+def _write_text(path, text):
+    """Writes text to path through a temporary file, so readers never see half a report"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def report_file(test_name, fmt):
+    """Returns the file name of a test's report"""
+    return '{}.{}'.format(test_name, fmt)
+
+
+def report_figures(helper, test_name):
+    """Builds the figures of a test's report, the same ones the dashboard shows.
+
+    Tests imported before the metric definitions were saved get their metrics
+    from the rolling stats, without the quantile figures, which need the type.
+
+    Args:
+        helper (DashDataHelper): Where to read the test's tables
+        test_name (str): The name of the test
+    Returns:
+        list: (metric name, [figure dicts]) pairs, one per metric
+    """
+    daily = helper.get_daily_rollup(test_name)
+    stats = helper.get_rolling_stats(test_name)
+    quantiles = None
+    if helper.backend.table_exists(test_name + sql_writer.SKETCHES_EXT):
+        quantiles = helper.get_quantiles(test_name)
+
+    if helper.backend.table_exists(test_name + sql_writer.METRICS_EXT):
+        types = {metric: m_dict['type'] for metric, m_dict in helper.get_metric_definitions(test_name).items()}
+    else:
+        types = dict.fromkeys(stats['METRIC_NAME'].unique())
+
+    metrics = []
+    for metric, metric_type in types.items():
+        metric_figures = [figures.daily_metric_figure(daily, metric),
+                          figures.p_value_figure(stats, metric),
+                          figures.ci_figure(stats, metric)]
+        if quantiles is not None and metric_type == 'continuous':
+            metric_figures.append(figures.quantile_figure(quantiles, metric))
+        metrics.append((metric, metric_figures))
+    return metrics
+
+
+def export_test(backend, out_dir, test_name, description, load_version, fmt='html'):
+    """Writes one test's report to out_dir.
+
+    With fmt html, the report is a page with the Plotly JSON of every figure
+    embedded. With fmt json, it's the figures as JSON, for the shared viewer.
+
+    Args:
+        backend (StorageBackend): Where to read the test's tables
+        out_dir (str): The directory to write the report to
+        test_name (str): The name of the test
+        description (str): The test's description
+        load_version (int): The test's load version, shown in the report
+        fmt (str): "html" or "json"
+    Returns:
+        str: The path of the report
+    """
+    helper = DashDataHelper(backend=backend)
+    metrics = report_figures(helper, test_name)
+    title = test_name.replace('_', ' ')
+    exported_at = time.strftime('%Y-%m-%d %H:%M:%S')
+    path = os.path.join(out_dir, report_file(test_name, fmt))
+
+    if fmt == 'json':
+        report = {'test_name': test_name, 'title': title, 'description': description,
+                  'load_version': load_version, 'exported_at': exported_at,
+                  'metrics': [{'metric_name': metric, 'title': metric.title().replace('_', ' '),
+                               'figures': metric_figures}
+                              for metric, metric_figures in metrics]}
+        _write_text(path, json.dumps(report, cls=PlotlyJSONEncoder))
+        return path
+
+    body = []
+    for metric, metric_figures in metrics:
+        body.append('<h2>{}</h2>'.format(html.escape(metric.title().replace('_', ' '))))
+        for figure in metric_figures:
+            body.append('<div class="chart">{}</div>'.format(
+                pio.to_html(go.Figure(figure), include_plotlyjs=False, full_html=False,
+                            default_height='400px')))
+
+    page = string.Template(_read_text(REPORT_TEMPLATE_FILENAME)).substitute(
+        title=html.escape(title), description=html.escape(description or ''),
+        load_version=load_version, exported_at=exported_at, body='\n'.join(body))
+    _write_text(path, page)
+    return path
+
+
+def _read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_index(out_dir, tests, fmt):
+    rows = []
+    for row in tests.itertuples():
+        link = report_file(row.test_name, fmt) if fmt == 'html' else \
+            '{}?test={}'.format(VIEWER_FILE, row.test_name)
+        rows.append('<tr><td><a href="{}">{}</a></td><td>{}</td><td>{}</td></tr>'.format(
+            html.escape(link, quote=True), html.escape(row.test_name.replace('_', ' ')),
+            html.escape(row.description or ''), row.load_version))
+    page = string.Template(_read_text(INDEX_TEMPLATE_FILENAME)).substitute(
+        exported_at=time.strftime('%Y-%m-%d %H:%M:%S'), rows='\n'.join(rows))
+    _write_text(os.path.join(out_dir, INDEX_FILE), page)
+
+
+def export_reports(backend, out_dir, fmt='html', processes=None, force=False):
+    """Exports a static report of every active test.
+
+    The load version of every exported test is saved in out_dir/manifest.json,
+    and a test is only exported again once its load version changes (every
+    import bumps it), so a nightly export only renders the tests imported since
+    the last one. The stale tests are rendered in parallel worker processes.
+    Reports of tests that are no longer active are removed, and index.html
+    links to the rest.
+
+    The load version is read before a test is rendered, so a test imported
+    during the export is exported again next time, never skipped.
+
+    Args:
+        backend (StorageBackend): Where to read the tests from
+        out_dir (str): The directory to write the reports to
+        fmt (str): "html" for self-contained pages with the figures embedded,
+                   or "json" for JSON files rendered by a shared viewer.html
+        processes (int): The number of worker processes. Defaults to the number of CPUs
+        force (bool): Export every test, even the unchanged ones
+    Returns:
+        dict: The names of the tests that were exported, skipped, failed and removed
+    """
+    assert fmt in EXPORT_FORMATS
+    os.makedirs(out_dir, exist_ok=True)
+    processes = processes or os.cpu_count() or 1
+
+    manifest = _read_manifest(out_dir)
+    previous = manifest.get('tests', {}) if manifest.get('format') == fmt else {}
+    tests = DashDataHelper(backend=backend).get_active_test_list()
+    tests['load_version'] = tests['load_version'].astype(int)
+
+    stale = [row for row in tests.itertuples()
+             if force or previous.get(row.test_name) != row.load_version
+             or not os.path.exists(os.path.join(out_dir, report_file(row.test_name, fmt)))]
+    versions = {name: version for name, version in previous.items()
+                if name in set(tests['test_name']) - {row.test_name for row in stale}}
+
+    # shared by every report, written once
+    if not os.path.exists(os.path.join(out_dir, PLOTLY_JS_FILE)):
+        _write_text(os.path.join(out_dir, PLOTLY_JS_FILE), get_plotlyjs())
+    if fmt == 'json':
+        _write_text(os.path.join(out_dir, VIEWER_FILE), _read_text(VIEWER_TEMPLATE_FILENAME))
+
+    failed = []
+    jobs = [(backend, out_dir, row.test_name, row.description, row.load_version, fmt) for row in stale]
+    if processes > 1 and len(jobs) > 1:
+        with concurrent.futures.ProcessPoolExecutor(min(processes, len(jobs))) as executor:
+            futures = {executor.submit(export_test, *job): job for job in jobs}
+            done = [(futures[f], f.exception()) for f in concurrent.futures.as_completed(futures)]
+    else:
+        done = []
+        for job in jobs:
+            try:
+                export_test(*job)
+                done.append((job, None))
+            except Exception as e:
+                done.append((job, e))
+
+    for job, error in done:
+        test_name, load_version = job[2], job[4]
+        if error is not None:
+            logger.error('Export of {} failed: {}'.format(test_name, error))
+            failed.append(test_name)
+        else:
+            versions[test_name] = load_version
+
+    removed = [name for name in previous if name not in set(tests['test_name'])]
+    for name in removed:
+        path = os.path.join(out_dir, report_file(name, fmt))
+        if os.path.exists(path):
+            os.remove(path)
+
+    _write_index(out_dir, tests[tests['test_name'].isin(versions)], fmt)
+    _write_text(os.path.join(out_dir, MANIFEST_FILE),
+                json.dumps({'format': fmt, 'tests': versions}, indent=2, sort_keys=True))
+
+    exported = sorted(set(row.test_name for row in stale) - set(failed))
+    return {'exported': exported,
+            'skipped': sorted(set(tests['test_name']) - {row.test_name for row in stale}),
+            'failed': sorted(failed),
+            'removed': sorted(removed)}
@@ -0,0 +1,149 @@
+"""Builds the dashboard's Plotly figures from the tables the import writes.
+
+Shared by dash_server.py and the static export, so a report looks the same
+as the live dashboard. Every function returns a {'data': ..., 'layout': ...}
+figure dict. The stats tables list the control's rows first, so every cell
+after the first one is compared with it.
+"""
+import plotly.graph_objs as go
+
+
+# one per test cell, control first, repeated past 8 cells
+CELL_COLORS = ['#9A9EAB', '#EC96A4', '#7CAFC4', '#F1A34C', '#83B271', '#B58DB6', '#E3C567', '#6C8EAD']
+P_VALUE_COLORS = ['#5D535E', '#A8577E', '#3E7C8C', '#B0662B']
+
+
+def _cell_color(i, colors=CELL_COLORS):
+    return colors[i % len(colors)]
+
+
+def daily_metric_figure(df, metric):
+    """The metric's daily value per test cell.
+
+    Args:
+        df (DataFrame): The test's daily rollup
+        metric (str): The metric to plot
+    """
+    traces = []
+    for i, cell in enumerate(df['TEST_CELL'].unique()):
+        cell_df = df.loc[df['TEST_CELL'] == cell]
+        traces.append(go.Scatter(x = cell_df['DT'],
+                                 y = cell_df[metric],
+                                 line = dict(color = _cell_color(i)),
+                                 name = cell))
+
+    layout = go.Layout(yaxis = {'hoverformat':'.3f'},
+                       title = metric.title().replace('_',' '),)
+
+    return {'data': traces, 'layout':layout}
+
+
+def p_value_figure(df, metric):
+    """The metric's cumulative p-value by day, one line per cell compared with the control.
+
+    Args:
+        df (DataFrame): The test's rolling stats
+        metric (str): The metric to plot
+    """
+    df = df.loc[df['METRIC_NAME'] == metric]
+
+    traces = []
+    for i, cell in enumerate(df['TEST_CELL'].unique()[1:]):
+        cell_df = df.loc[df['TEST_CELL'] == cell]
+        traces.append(go.Scatter(x = cell_df['DT'],
+                                 y = cell_df['P_VALUE'],
+                                 line = dict(color = _cell_color(i, P_VALUE_COLORS)),
+                                 name = cell))
+
+    layout = go.Layout(title = 'Significance (P-Value)',
+                       shapes = [{'type': 'line',
+                                'x0': df['DT'].min(),
+                                'y0': .05,
+                                'x1': df['DT'].max(),
+                                'y1': .05,
+                                'line': {
+                                    'color': '#DFE166',
+                                    'width': 3,
+                                    'dash': 'dash'}}],
+                        yaxis = dict(hoverformat = '.3f',
+                                     range=[0,1])
+                        )
+
+    return {'data': traces, 'layout':layout}
+
+
+def ci_figure(df, metric):
+    """The metric's value per test cell on the last day, with the CI of the difference.
+
+    Args:
+        df (DataFrame): The test's rolling stats
+        metric (str): The metric to plot
+    """
+    df = df.loc[df['METRIC_NAME'] == metric]
+    last_day = df.loc[df['DT'] == df['DT'].max()]
+
+    y_val = last_day['METRIC_VALUE']
+
+    # the control has no CI of its own, so no error bar
+    trace1 = go.Bar(x = last_day['TEST_CELL'],
+                    y = y_val,
+                    marker = dict(color = [_cell_color(i) for i in range(len(last_day))]),
+                    error_y = dict(type = 'data',
+                                   symmetric = False,
+                                   array = last_day['UPPER_CI'] - last_day['METRIC_VALUE'],
+                                   arrayminus = last_day['METRIC_VALUE'] - last_day['LOWER_CI']
+                                   )
+                    )
+
+    layout = go.Layout(title = 'Avg Performance To-Date',
+                       yaxis=dict(range=[y_val.min() * .6, y_val.max() * 1.3],
+                                  hoverformat = '.3f')
+                       )
+
+    return {'data': [trace1], 'layout':layout}
+
+
+def quantile_figure(df, metric):
+    """Quantiles of a continuous metric per test cell.
+
+    Args:
+        df (DataFrame): The output of DashDataHelper.get_quantiles
+        metric (str): The metric to plot
+    """
+    df = df.loc[df['METRIC_NAME'] == metric]
+
+    traces = []
+    for i, cell in enumerate(df['TEST_CELL'].unique()):
+        cell_df = df.loc[df['TEST_CELL'] == cell]
+        traces.append(go.Bar(x = ['{:.0%}'.format(q) for q in cell_df['QUANTILE']],
+                             y = cell_df['VALUE'],
+                             marker = dict(color = _cell_color(i)),
+                             name = cell))
+
+    layout = go.Layout(title = 'Quantiles',
+                       barmode = 'group',
+                       yaxis = dict(hoverformat = '.3f'))
+
+    return {'data': traces, 'layout': layout}
+
+
+def planning_figure(df):
+    """The relative MDE of each metric and scenario by test duration.
+
+    Args:
+        df (DataFrame): The output of planning.planning_grid
+    """
+    traces = []
+    for (metric, share, cell_split), scenario in df.groupby(['METRIC_NAME', 'TRAFFIC', 'SPLIT'], sort=False):
+        traces.append(go.Scatter(x = scenario['DAYS'],
+                                 y = scenario['RELATIVE_MDE'],
+                                 mode = 'lines+markers',
+                                 name = '{} ({:.0%} traffic, {:.0%} test)'.format(
+                                     metric.title().replace('_',' '), share, cell_split)))
+
+    layout = go.Layout(title = 'Minimum Detectable Effect (80% power, 5% significance)',
+                       xaxis = dict(title = 'Days'),
+                       yaxis = dict(title = 'Relative MDE',
+                                    tickformat = '.0%'))
+
+    return {'data': traces, 'layout': layout}
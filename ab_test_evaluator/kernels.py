@@ -0,0 +1,170 @@
+"""Resampling and accumulation kernels behind the bootstraps.
+
+Every kernel has a pure NumPy implementation and, when Numba is installed, a
+compiled one in numba_kernels.py that loops without temporaries and runs the
+replicates in parallel. Both draw their random numbers from the same
+counter-based generator (splitmix64 over a seed and a counter), so they make
+the same draws and their results only differ by floating point rounding.
+
+The backend is picked at runtime: the AB_TEST_KERNELS environment variable
+("numpy" or "numba") if it's set, otherwise Numba if it's installed.
+"""
+import importlib.util
+import math
+import os
+
+import numpy as np
+
+
+KERNEL_BACKENDS = ['numpy', 'numba']
+
+# Upper bound on the number of values the NumPy kernels handle at once,
+# so memory stays bounded no matter how many replicates are requested
+BOOTSTRAP_BLOCK_SIZE = 2 ** 20
+
+# P(X <= k) for X ~ Poisson(1), k = 0..19. The tail past 19 is below 1e-17,
+# under the resolution of the 53-bit uniforms the weights are drawn from
+POISSON_CDF = np.cumsum([np.exp(-1) / math.factorial(k) for k in range(20)])
+
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+
+def available_backends():
+    """Returns the kernel backends that can run here"""
+    return [b for b in KERNEL_BACKENDS if b == 'numpy' or importlib.util.find_spec(b) is not None]
+
+
+def get_backend(backend=None):
+    """Returns the kernel backend to use.
+
+    Args:
+        backend (str): "numpy" or "numba", or None to use AB_TEST_KERNELS or
+                       the fastest installed backend
+    Returns:
+        str: The backend name
+    """
+    backend = backend or os.environ.get('AB_TEST_KERNELS')
+    if backend is None:
+        return available_backends()[-1]
+    if backend not in available_backends():
+        raise ValueError('Kernel backend {} is not available, use one of {}'.format(
+            backend, available_backends()))
+    return backend
+
+
+def _numba_kernels():
+    # imported on first use, Numba takes a while to import
+    from . import numba_kernels
+    return numba_kernels
+
+
+def _mix64(x):
+    """splitmix64 finalizer: a bijective scramble of 64-bit integers"""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def seed_key(seed):
+    """Scrambles an integer seed into the key of a counter-based stream"""
+    with np.errstate(over='ignore'):
+        return _mix64(np.uint64(seed) + GOLDEN_GAMMA)
+
+
+def random_bits(key, counters):
+    """The counters-th outputs of the splitmix64 stream with state key"""
+    with np.errstate(over='ignore'):
+        return _mix64(key + (counters + np.uint64(1)) * GOLDEN_GAMMA)
+
+
+def poisson_weights(row_ids, n_replicates, seed=0):
+    """Poisson(1) bootstrap weights from a counter-based RNG.
+
+    The weight of a row in a replicate only depends on (seed, row id, replicate),
+    so any chunk of the data can be weighted on its own, in any order and in any
+    process.
+
+    Args:
+        row_ids (array): Integer id of every row
+        n_replicates (int): The number of bootstrap replicates B
+        seed (int): The seed shared by every chunk of the same bootstrap
+    Returns:
+        array: uint8 weights of shape (len(row_ids), n_replicates)
+    """
+    row_ids = np.asarray(row_ids).astype(np.uint64)
+    replicates = np.arange(1, n_replicates + 1, dtype=np.uint64)
+
+    with np.errstate(over='ignore'):
+        row_keys = _mix64(row_ids * GOLDEN_GAMMA + seed_key(seed))
+        bits = _mix64(row_keys[:, None] + replicates * GOLDEN_GAMMA)
+    uniform = (bits >> np.uint64(11)).astype(float) * 2.0 ** -53
+
+    return np.searchsorted(POISSON_CDF, uniform, side='right').astype(np.uint8)
+
+
+def resample_moments(values, sample_size, n_replicates, seed, backend=None):
+    """Sums and sums of squares of bootstrap resamples of values.
+
+    Replicate r draws sample_size values with replacement, draw i picking
+    values[bits % len(values)] for the (r * sample_size + i)-th output of the
+    stream seeded by seed.
+
+    Args:
+        values (array): The values to resample
+        sample_size (int): The number of values drawn per replicate
+        n_replicates (int): The number of replicates
+        seed (int): The seed of the stream
+        backend (str): The kernel backend, see get_backend
+    Returns:
+        tuple: (sums, sums of squares), arrays of length n_replicates
+    """
+    values = np.ascontiguousarray(values, dtype=float)
+    key = seed_key(seed)
+    if get_backend(backend) == 'numba':
+        return _numba_kernels().resample_moments(values, sample_size, n_replicates, key)
+
+    sums = np.empty(n_replicates)
+    sumsqs = np.empty(n_replicates)
+    size = np.uint64(values.shape[0])
+    per_block = max(1, BOOTSTRAP_BLOCK_SIZE // max(sample_size, 1))
+    for start in range(0, n_replicates, per_block):
+        stop = min(start + per_block, n_replicates)
+        counters = np.arange(start * sample_size, stop * sample_size, dtype=np.uint64)
+        draws = values[random_bits(key, counters) % size].reshape(stop - start, sample_size)
+        sums[start:stop] = draws.sum(axis=1)
+        sumsqs[start:stop] = (draws * draws).sum(axis=1)
+
+    return sums, sumsqs
+
+
+def poisson_accumulate(values, row_ids, n_replicates, seed, backend=None):
+    """Poisson bootstrap weighted sums of one or more columns over a chunk of rows.
+
+    Uses the same weights as poisson_weights without materializing them with the
+    Numba backend, and in blocks of rows with the NumPy one.
+
+    Args:
+        values (array): The values, one column per metric, shape (rows, columns)
+        row_ids (array): Integer id of every row
+        n_replicates (int): The number of replicates
+        seed (int): The seed shared by every chunk of the same bootstrap
+        backend (str): The kernel backend, see get_backend
+    Returns:
+        tuple: (weighted sums of shape (columns, n_replicates),
+                total weights of shape (n_replicates,))
+    """
+    values = np.ascontiguousarray(values, dtype=float)
+    row_ids = np.ascontiguousarray(row_ids).astype(np.uint64)
+    if get_backend(backend) == 'numba':
+        return _numba_kernels().poisson_accumulate(values, row_ids, n_replicates,
+                                                   seed_key(seed), POISSON_CDF)
+
+    sums = np.zeros((values.shape[1], n_replicates))
+    weights = np.zeros(n_replicates)
+    per_block = max(1, BOOTSTRAP_BLOCK_SIZE // n_replicates)
+    for start in range(0, values.shape[0], per_block):
+        w = poisson_weights(row_ids[start:start + per_block], n_replicates, seed)
+        sums += values[start:start + per_block].T @ w
+        weights += w.sum(axis=0)
+
+    return sums, weights
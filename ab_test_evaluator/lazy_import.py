@@ -0,0 +1,25 @@
+import importlib
+
+
+class LazyModule(object):
+    """Stands in for a module and imports it on first attribute access.
+
+    Used for heavy dependencies (scipy, statsmodels) so importing the package
+    stays cheap for code paths that never touch them, e.g. the dash server or
+    `run_import.py --help`.
+
+    Args:
+        name (str): The full name of the module, e.g. 'scipy.stats'
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+    def __repr__(self):
+        return '<lazy module {!r}>'.format(self._name)
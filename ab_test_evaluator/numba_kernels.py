@@ -0,0 +1,69 @@
+"""Numba versions of the kernels in kernels.py.
+
+Only imported when the numba backend is used. The functions are compiled on
+first call and cached next to this file (cache=True), so later runs skip the
+JIT. They must make exactly the same random draws as the NumPy kernels, so
+every integer operation stays in uint64; the sums only differ by floating
+point rounding.
+"""
+import numpy as np
+from numba import njit, prange
+
+
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+MIX_1 = np.uint64(0xBF58476D1CE4E5B9)
+MIX_2 = np.uint64(0x94D049BB133111EB)
+
+
+@njit(cache=True, inline='always')
+def _mix64(x):
+    x = (x ^ (x >> np.uint64(30))) * MIX_1
+    x = (x ^ (x >> np.uint64(27))) * MIX_2
+    return x ^ (x >> np.uint64(31))
+
+
+@njit(cache=True, parallel=True)
+def resample_moments(values, sample_size, n_replicates, key):
+    sums = np.empty(n_replicates)
+    sumsqs = np.empty(n_replicates)
+    size = np.uint64(values.shape[0])
+
+    for r in prange(n_replicates):
+        start = np.uint64(r) * np.uint64(sample_size)
+        s = 0.
+        ss = 0.
+        for i in range(sample_size):
+            counter = start + np.uint64(i) + np.uint64(1)
+            v = values[_mix64(key + counter * GOLDEN_GAMMA) % size]
+            s += v
+            ss += v * v
+        sums[r] = s
+        sumsqs[r] = ss
+
+    return sums, sumsqs
+
+
+@njit(cache=True, parallel=True)
+def poisson_accumulate(values, row_ids, n_replicates, key, cdf):
+    n_rows, n_columns = values.shape
+    sums = np.zeros((n_columns, n_replicates))
+    weights = np.zeros(n_replicates)
+
+    row_keys = np.empty(n_rows, dtype=np.uint64)
+    for j in range(n_rows):
+        row_keys[j] = _mix64(row_ids[j] * GOLDEN_GAMMA + key)
+
+    for r in prange(n_replicates):
+        replicate = (np.uint64(r) + np.uint64(1)) * GOLDEN_GAMMA
+        for j in range(n_rows):
+            uniform = (_mix64(row_keys[j] + replicate) >> np.uint64(11)) * 2.0 ** -53
+            # inverse CDF, same as searchsorted(cdf, uniform, side='right')
+            w = 0
+            while w < cdf.shape[0] and cdf[w] <= uniform:
+                w += 1
+            if w > 0:
+                weights[r] += w
+                for c in range(n_columns):
+                    sums[c, r] += w * values[j, c]
+
+    return sums, weights
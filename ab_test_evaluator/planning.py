@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+
+from .stats import stats
+
+
+def metric_baselines(suffstats, metric_definitions):
+    """Estimates each metric's baseline and per-unit variance from a past test.
+
+    All days and test cells are pooled, so UNITS_PER_DAY is the test's total
+    traffic. A unit is a row for continuous and ratio metrics and a trial (a unit
+    of the denominator) for binary metrics. Ratio metrics get the delta-method
+    variance of a row, as in stats.RatioTestEval.
+
+    Args:
+        suffstats (DataFrame): The per-day sufficient statistics of the past test
+        metric_definitions (dict): The metric definitions, as in ABTest.metric_definitions
+    Returns:
+        DataFrame: One row per metric, indexed by METRIC_NAME, with METRIC_TYPE,
+                   BASELINE, VARIANCE and UNITS_PER_DAY
+    """
+    n_days = suffstats['DT'].nunique()
+    totals = suffstats.drop(columns=['DT', 'TEST_CELL']).sum()
+    n = totals['COUNT']
+
+    rows = []
+    for metric, m_dict in metric_definitions.items():
+        numerator = m_dict['numerator_column']
+        denominator = m_dict['denominator_column']
+        sum_x = totals['SUM_' + numerator]
+        sum_y = totals['SUM_' + denominator]
+        baseline = sum_x / sum_y
+
+        if m_dict['type'] == 'binary':
+            variance = baseline * (1 - baseline)
+            units = sum_y
+        else:
+            var_x = (totals['SUMSQ_' + numerator] - sum_x ** 2 / n) / (n - 1)
+            if m_dict['type'] == 'ratio':
+                var_y = (totals['SUMSQ_' + denominator] - sum_y ** 2 / n) / (n - 1)
+                cov_xy = (totals['SUMXY_{}_{}'.format(numerator, denominator)] - sum_x * sum_y / n) / (n - 1)
+                variance = (var_x - 2 * baseline * cov_xy + baseline ** 2 * var_y) / (sum_y / n) ** 2
+            else:
+                variance = var_x
+            units = n
+
+        rows.append([metric, m_dict['type'], baseline, variance, units / n_days])
+
+    return pd.DataFrame(rows, columns=['METRIC_NAME', 'METRIC_TYPE', 'BASELINE', 'VARIANCE',
+                                       'UNITS_PER_DAY']).set_index('METRIC_NAME')
+
+
+def minimum_detectable_effect(variance, n_control, n_test, alpha=.05, power=.8):
+    """Smallest absolute difference a two-sided z-test detects with the given power.
+
+    All arguments broadcast against each other.
+    """
+    z = stats.norm.ppf(1 - alpha / 2) + stats.norm.ppf(power)
+    with np.errstate(divide='ignore'):
+        return z * np.sqrt(variance * (1 / n_control + 1 / n_test))
+
+
+def power_of_test(effect, variance, n_control, n_test, alpha=.05):
+    """Power of a two-sided z-test to detect an absolute difference of effect.
+
+    All arguments broadcast against each other.
+    """
+    with np.errstate(divide='ignore'):
+        se = np.sqrt(variance * (1 / n_control + 1 / n_test))
+    z_alpha = stats.norm.ppf(1 - alpha / 2)
+    shift = np.abs(effect) / se
+    return stats.norm.sf(z_alpha - shift) + stats.norm.cdf(-z_alpha - shift)
+
+
+def planning_grid(baselines, days, traffic=(1.,), splits=(.5,), alpha=.05, power=.8,
+                  relative_effect=None):
+    """Computes the MDE of every metric for every scenario in one broadcast.
+
+    A scenario is a duration in days, the share of the baseline traffic that
+    enters the test and the share of the test's traffic sent to the test cell.
+    The grid is metrics x days x traffic x splits, computed as a single array.
+
+    Args:
+        baselines (DataFrame): The output of metric_baselines
+        days (list): Test durations in days
+        traffic (list): Shares of the baseline traffic in the test, between 0 and 1
+        splits (list): Shares of the test's traffic in the test cell, between 0 and 1
+        alpha (float): The significance level of the test
+        power (float): The power the MDE is computed at
+        relative_effect (float): If given, also compute the POWER to detect this
+                                 relative difference from the baseline
+    Returns:
+        DataFrame: One row per metric and scenario with the SAMPLE_SIZE (units in
+                   both cells), the absolute MDE and the MDE relative to the BASELINE
+    """
+    # metrics x days x traffic x splits
+    baseline = baselines['BASELINE'].values[:, None, None, None]
+    variance = baselines['VARIANCE'].values[:, None, None, None]
+    units_per_day = baselines['UNITS_PER_DAY'].values[:, None, None, None]
+    days = np.asarray(days, dtype=float)[None, :, None, None]
+    traffic = np.asarray(traffic, dtype=float)[None, None, :, None]
+    splits = np.asarray(splits, dtype=float)[None, None, None, :]
+
+    sample_size = units_per_day * days * traffic
+    n_test = sample_size * splits
+    n_control = sample_size * (1 - splits)
+    mde = minimum_detectable_effect(variance, n_control, n_test, alpha, power)
+
+    shape = np.broadcast_shapes(mde.shape, baseline.shape)
+    index = np.indices(shape).reshape(len(shape), -1)
+    columns = {'METRIC_NAME': baselines.index.values[index[0]],
+               'METRIC_TYPE': baselines['METRIC_TYPE'].values[index[0]],
+               'DAYS': days.ravel()[index[1]],
+               'TRAFFIC': traffic.ravel()[index[2]],
+               'SPLIT': splits.ravel()[index[3]],
+               'SAMPLE_SIZE': np.broadcast_to(sample_size, shape).ravel(),
+               'BASELINE': np.broadcast_to(baseline, shape).ravel(),
+               'MDE': mde.ravel()}
+    with np.errstate(divide='ignore', invalid='ignore'):
+        columns['RELATIVE_MDE'] = columns['MDE'] / np.abs(columns['BASELINE'])
+    if relative_effect is not None:
+        effect = relative_effect * np.abs(baseline)
+        columns['POWER'] = power_of_test(effect, variance, n_control, n_test, alpha).ravel()
+
+    return pd.DataFrame(columns)
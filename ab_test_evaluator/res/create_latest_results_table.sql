@@ -0,0 +1,10 @@
+create table if not exists ab_latest_results
+     ( test_name text not null
+     , metric_name text not null
+     , test_cell text not null
+     , dt text not null
+     , metric_value double precision
+     , p_value double precision
+     , lower_ci double precision
+     , upper_ci double precision
+     , primary key (test_name, metric_name, test_cell))
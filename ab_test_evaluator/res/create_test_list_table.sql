@@ -3,4 +3,5 @@ create table if not exists ab_tests
      ( test_name text primary key
      , active_fg text
      , description text
-     , config_file text not null)
+     , config_file text not null
+     , load_version integer not null default 0)
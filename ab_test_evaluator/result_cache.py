@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import pickle
+import time
+
+import pandas as pd
+
+from .storage import sqlite_connection
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE = 'ab_test_cache.db'
+# 256 MB, a (day, metric) result is about 1 KB
+DEFAULT_MAX_BYTES = 256 * 2 ** 20
+# Bump when the stats code changes in a way that changes its results,
+# so results computed by older code aren't served
+CACHE_VERSION = 3
+# Keys per query, under SQLite's limit on bound parameters
+QUERY_CHUNK_SIZE = 500
+
+
+def result_key(**parts):
+    """Hashes the inputs of a result into its cache key.
+
+    Args:
+        parts: Everything the result depends on, as JSON-serializable values
+    Returns:
+        str: The hex SHA-256 of the parts
+    """
+    parts['cache_version'] = CACHE_VERSION
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def chained_input_hashes(df, columns):
+    """Hashes the events up to each day, one day at a time.
+
+    The hash of a day is the hash of the previous day and the day's events, so
+    it identifies every event up to that day (and their order) while only
+    hashing each event once.
+
+    Args:
+        df (DataFrame): The event-level DataFrame, with DT truncated to the day
+        columns (list): The columns the result depends on
+    Returns:
+        dict: {day: hex digest}
+    """
+    row_hashes = pd.util.hash_pandas_object(df[columns], index=False).values
+    groups = df.groupby('DT').indices
+
+    hashes = {}
+    digest = hashlib.sha256(json.dumps(columns).encode('utf-8')).hexdigest()
+    for date in sorted(groups):
+        day = hashlib.sha256(digest.encode('utf-8'))
+        day.update(str(date).encode('utf-8'))
+        day.update(row_hashes[groups[date]].tobytes())
+        digest = day.hexdigest()
+        hashes[date] = digest
+    return hashes
+
+
+class ResultCache(object):
+
+    def __init__(self, path=CACHE_FILE, max_bytes=None):
+        """A persistent cache of computed results, keyed by a hash of their inputs.
+
+        Results are pickled into a SQLite file. Once the file holds more than
+        max_bytes of results, the least recently used ones are evicted. Only the
+        path is kept on the instance, so it can be sent to worker processes.
+
+        Args:
+            path (str): The SQLite file
+            max_bytes (int): The total size of the results to keep. Defaults to
+                             DEFAULT_MAX_BYTES
+        """
+        self.path = path
+        self.max_bytes = max_bytes or DEFAULT_MAX_BYTES
+        self.hits = 0
+        self.misses = 0
+        self._create_tables()
+
+    def _create_tables(self):
+        with sqlite_connection(self.path) as conn, conn:
+            conn.execute('create table if not exists results ('
+                         'key text primary key, value blob not null, '
+                         'size integer not null, last_used real not null)')
+            conn.execute('create index if not exists results_last_used on results (last_used)')
+            conn.execute('create table if not exists cache_stats ('
+                         'name text primary key, value integer not null)')
+
+    def get_many(self, keys):
+        """Looks up many results at once.
+
+        Args:
+            keys (list): The keys to look up
+        Returns:
+            dict: {key: result} for the keys in the cache
+        """
+        keys = list(keys)
+        found = {}
+        with sqlite_connection(self.path) as conn, conn:
+            for start in range(0, len(keys), QUERY_CHUNK_SIZE):
+                chunk = keys[start:start + QUERY_CHUNK_SIZE]
+                placeholders = ','.join('?' * len(chunk))
+                rows = conn.execute('select key, value from results where key in ({})'.format(placeholders),
+                                    chunk).fetchall()
+                found.update((key, pickle.loads(value)) for key, value in rows)
+                conn.execute('update results set last_used = ? where key in ({})'.format(placeholders),
+                             [time.time()] + chunk)
+
+            hits = len(found)
+            misses = len(keys) - hits
+            conn.executemany('insert into cache_stats (name, value) values (?, ?) '
+                             'on conflict (name) do update set value = value + excluded.value',
+                             [('hits', hits), ('misses', misses)])
+        self.hits += hits
+        self.misses += misses
+        return found
+
+    def get(self, key):
+        """Returns the result stored under key, or None"""
+        return self.get_many([key]).get(key)
+
+    def put_many(self, results):
+        """Stores many results at once, then evicts down to max_bytes.
+
+        Args:
+            results (dict): {key: result}
+        """
+        now = time.time()
+        rows = []
+        for key, result in results.items():
+            value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+            rows.append((key, value, len(value), now))
+        with sqlite_connection(self.path) as conn, conn:
+            conn.executemany('insert or replace into results (key, value, size, last_used) '
+                             'values (?, ?, ?, ?)', rows)
+            self._evict(conn)
+
+    def put(self, key, result):
+        """Stores result under key"""
+        self.put_many({key: result})
+
+    def _evict(self, conn):
+        """Deletes the least recently used results past max_bytes"""
+        deleted = conn.execute(
+            'delete from results where key in ('
+            'select key from (select key, sum(size) over (order by last_used desc, key) as total '
+            'from results) where total > ?)', [self.max_bytes]).rowcount
+        if deleted:
+            logger.info('Evicted {} results from the result cache'.format(deleted))
+
+    def stats(self):
+        """Reports the cache's size and hit rate.
+
+        Returns:
+            dict: The number of entries and their total bytes, the hits and misses
+                  of this instance, and the hits and misses since the file was created
+        """
+        with sqlite_connection(self.path) as conn:
+            entries, size = conn.execute('select count(*), coalesce(sum(size), 0) from results').fetchone()
+            totals = dict(conn.execute('select name, value from cache_stats').fetchall())
+
+        lookups = self.hits + self.misses
+        total_lookups = totals.get('hits', 0) + totals.get('misses', 0)
+        return {'entries': entries,
+                'bytes': size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'total_hits': totals.get('hits', 0),
+                'total_misses': totals.get('misses', 0),
+                'total_hit_rate': totals.get('hits', 0) / total_lookups if total_lookups else None}
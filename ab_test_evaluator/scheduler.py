@@ -0,0 +1,245 @@
+import concurrent.futures
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import yaml
+
+logger = logging.getLogger(__name__)
+
+CONFIG_EXTENSIONS = ['.yml', '.yaml']
+CSV_EXTENSION = '.csv'
+STATE_FILE = '.scheduler_state.json'
+HASH_CHUNK_SIZE = 2 ** 20
+
+# The lock a worker process's imports share the store with the other workers
+# under, set by _init_worker
+_store_lock = None
+
+
+def _init_worker(store_lock):
+    global _store_lock
+    _store_lock = store_lock
+
+
+def _refresh(config_file, csv_file, processes, storage, cache_file=None, cache_bytes=None):
+    """Runs one import in a scheduler worker process"""
+    from .ab_test import ABTest
+    from .result_cache import ResultCache
+    from .storage import LockedBackend, open_backend
+
+    backend = open_backend(storage)
+    if _store_lock is not None:
+        backend = LockedBackend(backend, _store_lock)
+    result_cache = ResultCache(cache_file, cache_bytes) if cache_file else None
+    ABTest(config_file, csv_file, processes, backend, result_cache).load_test_data()
+
+
+def find_pairs(drop_dir):
+    """Finds the config/CSV pairs in drop_dir, matched by file name.
+
+    Args:
+        drop_dir (str): The directory to look in
+    Returns:
+        dict: {name: (config path, CSV path)} for every name with both files
+    """
+    configs = {}
+    csvs = {}
+    for entry in os.scandir(drop_dir):
+        if not entry.is_file():
+            continue
+        name, ext = os.path.splitext(entry.name)
+        if ext.lower() in CONFIG_EXTENSIONS:
+            configs[name] = entry.path
+        elif ext.lower() == CSV_EXTENSION:
+            csvs[name] = entry.path
+    return {name: (configs[name], csvs[name]) for name in sorted(configs) if name in csvs}
+
+
+def hash_files(paths):
+    """Returns the SHA-256 of the contents of paths, read in chunks"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Scheduler(object):
+
+    def __init__(self, drop_dir, storage='ab_testing_data.db', state_file=None, max_workers=None,
+                 poll_interval=10, settle_seconds=5, cache_file=None, cache_bytes=None):
+        """Watches drop_dir for config/CSV pairs and imports the ones that changed.
+
+        A pair is a config file (.yml or .yaml) and a CSV file with the same name,
+        e.g. my_test.yml and my_test.csv. A pair is only considered once neither
+        file has been modified for settle_seconds, so files that are still being
+        written are left alone. It's then imported if the hash of its contents
+        differs from the last import's. The size and modification time of the
+        files are saved with the hash, so an idle poll only stats the files.
+
+        Changed tests are queued by the priority key of their config file (higher
+        first, default 0) and run in up to max_workers worker processes. Each
+        import gets an equal share of the CPUs for its rolling stats. The imports
+        take turns with the store (see storage.LockedBackend), so they can share
+        any backend, including DuckDB and Parquet, which have a single writer.
+
+        Args:
+            drop_dir (str): The directory to watch
+            storage (str): Where to store the results, as in run_import.py --storage
+            state_file (str): The JSON file with the hash of each test's last import.
+                              Defaults to .scheduler_state.json in drop_dir
+            max_workers (int): The number of imports to run at once. Defaults to 2,
+                               or 1 on a single CPU
+            poll_interval (float): Seconds between polls of drop_dir
+            settle_seconds (float): Seconds a file must go unmodified before it's read
+            cache_file (str): A result cache file shared by the imports, see
+                              result_cache.ResultCache. Defaults to no cache
+            cache_bytes (int): The size the result cache is kept under
+        """
+        self.drop_dir = drop_dir
+        self.storage = storage
+        self.state_file = state_file or os.path.join(drop_dir, STATE_FILE)
+        self.max_workers = max_workers or min(2, os.cpu_count() or 1)
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.cache_file = cache_file
+        self.cache_bytes = cache_bytes
+        self.processes_per_import = max(1, (os.cpu_count() or 1) // self.max_workers)
+        self.state = self._read_state()
+
+        self._queue = []
+        self._queued = {}
+        self._running = {}
+        self._counter = itertools.count()
+
+    def _read_state(self):
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file) as f:
+            return json.load(f)
+
+    def _write_state(self):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.state_file)
+
+    def _priority(self, config_file):
+        with open(config_file) as f:
+            return yaml.safe_load(f.read()).get('priority', 0)
+
+    def changed_tests(self):
+        """Finds the settled config/CSV pairs whose contents changed since their last import.
+
+        Returns:
+            list: (name, config path, CSV path, signature, hash) tuples
+        """
+        now = time.time()
+        changed = []
+        for name, paths in find_pairs(self.drop_dir).items():
+            stats = [os.stat(p) for p in paths]
+            if any(now - s.st_mtime < self.settle_seconds for s in stats):
+                continue
+
+            signature = [[s.st_size, s.st_mtime_ns] for s in stats]
+            previous = self.state.get(name, {})
+            pending = self._queued.get(name) or self._running.get(name)
+            if signature in [previous.get('signature'), pending and pending[3]]:
+                continue
+
+            digest = hash_files(paths)
+            if previous.get('hash') == digest:
+                # touched but not changed
+                previous['signature'] = signature
+                self._write_state()
+                continue
+            changed.append((name, paths[0], paths[1], signature, digest))
+        return changed
+
+    def poll(self):
+        """Queues the changed tests, replacing older queued drops of the same test"""
+        for job in self.changed_tests():
+            name, config_file = job[:2]
+            pending = self._queued.get(name) or self._running.get(name)
+            if pending is not None and pending[4] == job[4]:
+                continue
+            priority = self._priority(config_file)
+            self._queued[name] = job
+            heapq.heappush(self._queue, (-priority, next(self._counter), job))
+            logger.info('Queued {} (priority {})'.format(name, priority))
+
+    def _next_job(self):
+        """Pops the highest priority job whose test isn't already being imported"""
+        deferred = []
+        job = None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            name = entry[2][0]
+            if self._queued.get(name) is not entry[2]:
+                # replaced by a newer drop
+                continue
+            if name in self._running:
+                deferred.append(entry)
+                continue
+            job = self._queued.pop(name)
+            break
+
+        for entry in deferred:
+            heapq.heappush(self._queue, entry)
+        return job
+
+    def _finish(self, job, future):
+        name, config_file, csv_file, signature, digest = job
+        del self._running[name]
+        error = future.exception()
+        if error is not None:
+            logger.error('Import of {} failed: {}'.format(name, error))
+        else:
+            logger.info('Imported {}'.format(name))
+        # failed imports are recorded too, so they're only retried once the files change
+        self.state[name] = {'signature': signature, 'hash': digest,
+                            'status': 'failed' if error is not None else 'ok',
+                            'finished_at': time.strftime('%Y-%m-%d %H:%M:%S')}
+        self._write_state()
+
+    def run(self, once=False):
+        """Polls drop_dir and runs the queued imports.
+
+        Args:
+            once (bool): Return after importing what's changed now, instead of
+                         polling forever
+        """
+        store_lock = multiprocessing.Lock()
+        with concurrent.futures.ProcessPoolExecutor(self.max_workers, initializer=_init_worker,
+                                                    initargs=(store_lock,)) as executor:
+            futures = {}
+            self.poll()
+            while True:
+                while len(futures) < self.max_workers:
+                    job = self._next_job()
+                    if job is None:
+                        break
+                    name, config_file, csv_file = job[:3]
+                    self._running[name] = job
+                    logger.info('Importing {}'.format(name))
+                    future = executor.submit(_refresh, config_file, csv_file,
+                                             self.processes_per_import, self.storage,
+                                             self.cache_file, self.cache_bytes)
+                    futures[future] = job
+
+                if once and not futures and not self._queue:
+                    return
+
+                done, _ = concurrent.futures.wait(futures, timeout=self.poll_interval,
+                                                  return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    self._finish(futures.pop(future), future)
+                if not once:
+                    self.poll()
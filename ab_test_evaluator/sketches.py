@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+
+
+# Quantiles are within 1% (relative) of the exact value by default
+DEFAULT_RELATIVE_ACCURACY = .01
+
+# Values closer to zero than this are counted as zero
+MIN_INDEXED_VALUE = 1e-9
+
+SKETCH_COLUMNS = ['DT', 'TEST_CELL', 'METRIC_NAME', 'SIGN', 'BUCKET', 'COUNT']
+
+
+def _gamma(relative_accuracy):
+    return (1 + relative_accuracy) / (1 - relative_accuracy)
+
+
+def bucket_values(values, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """Maps values to their sketch buckets.
+
+    Bucket i of a sign covers magnitudes in (gamma^(i-1), gamma^i], with
+    gamma = (1 + a) / (1 - a) for relative accuracy a. Zero gets sign 0.
+
+    Args:
+        values (array): The values
+        relative_accuracy (float): The relative accuracy a of the sketch
+    Returns:
+        tuple: (sign, bucket) integer arrays
+    """
+    values = np.asarray(values, dtype=float)
+    magnitude = np.abs(values)
+    sign = np.where(magnitude < MIN_INDEXED_VALUE, 0, np.sign(values)).astype(np.int8)
+    with np.errstate(divide='ignore'):
+        bucket = np.ceil(np.log(np.maximum(magnitude, MIN_INDEXED_VALUE)) / np.log(_gamma(relative_accuracy)))
+    bucket = np.where(sign == 0, 0, bucket).astype(np.int64)
+    return sign, bucket
+
+
+class QuantileSketch(object):
+    """Mergeable quantile sketch with a relative error guarantee (DDSketch).
+
+    The sketch counts values in logarithmic buckets. For any quantile q, the
+    estimate v' of the exact value v (the value at rank floor(q * (n - 1))) is
+    within |v' - v| <= a * |v|, where a is the relative accuracy. Two sketches
+    with the same accuracy merge by adding their bucket counts, and the merged
+    sketch has the same guarantee, so per-day sketches combine into any date
+    window. The size is bounded by the range of the data: a sketch of positive
+    values between 0.01 and 1,000,000 with a = 1% holds at most ~925 buckets.
+
+    Args:
+        counts (Series): Counts indexed by (SIGN, BUCKET)
+        relative_accuracy (float): The relative accuracy a of the buckets
+    """
+
+    def __init__(self, counts=None, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        if counts is None:
+            index = pd.MultiIndex.from_arrays([[], []], names=['SIGN', 'BUCKET'])
+            counts = pd.Series([], index=index, dtype=np.int64)
+        self.counts = counts
+        self.relative_accuracy = relative_accuracy
+
+    @classmethod
+    def from_values(cls, values, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        sign, bucket = bucket_values(values, relative_accuracy)
+        counts = pd.Series(1, index=pd.MultiIndex.from_arrays([sign, bucket], names=['SIGN', 'BUCKET']))
+        return cls(counts.groupby(level=['SIGN', 'BUCKET']).sum(), relative_accuracy)
+
+    @classmethod
+    def from_frame(cls, df, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+        """Merges every row of a SIGN, BUCKET, COUNT frame into one sketch"""
+        return cls(df.groupby(['SIGN', 'BUCKET'])['COUNT'].sum(), relative_accuracy)
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Can only merge sketches with the same relative accuracy')
+        counts = self.counts.add(other.counts, fill_value=0).astype(np.int64)
+        return QuantileSketch(counts, self.relative_accuracy)
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def _ordered_buckets(self):
+        """Bucket representative values and counts, in increasing order of value"""
+        signs = self.counts.index.get_level_values('SIGN').values
+        buckets = self.counts.index.get_level_values('BUCKET').values
+        gamma = _gamma(self.relative_accuracy)
+        # the point of the bucket with the same relative error to both ends
+        values = signs * 2 * gamma ** buckets.astype(float) / (gamma + 1)
+        order = np.argsort(values, kind='stable')
+        return values[order], self.counts.values[order]
+
+    def quantile(self, quantiles):
+        """Estimates the given quantiles.
+
+        Args:
+            quantiles (array): Quantiles between 0 and 1
+        Returns:
+            array: The estimated values, NaN if the sketch is empty
+        """
+        quantiles = np.atleast_1d(np.asarray(quantiles, dtype=float))
+        if self.count == 0:
+            return np.full(quantiles.shape, np.nan)
+        values, counts = self._ordered_buckets()
+        ranks = np.floor(quantiles * (self.count - 1))
+        return values[np.searchsorted(np.cumsum(counts), ranks, side='right')]
+
+
+def build_sketches(events, metric_columns, relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """Builds one sketch per day, test cell and metric from the event-level data.
+
+    Args:
+        events (DataFrame): The event-level data, with DT and TEST_CELL columns
+        metric_columns (dict): The column to sketch for each metric name
+        relative_accuracy (float): The relative accuracy of the sketches
+    Returns:
+        DataFrame: The non-empty buckets, with columns DT, TEST_CELL, METRIC_NAME,
+                   SIGN, BUCKET and COUNT
+    """
+    frames = []
+    for metric, column in metric_columns.items():
+        sign, bucket = bucket_values(events[column], relative_accuracy)
+        df = pd.DataFrame({'DT': events['DT'].dt.floor('D'),
+                           'TEST_CELL': events['TEST_CELL'],
+                           'SIGN': sign,
+                           'BUCKET': bucket})
+        df = df.groupby(['DT', 'TEST_CELL', 'SIGN', 'BUCKET']).size().rename('COUNT').reset_index()
+        df['METRIC_NAME'] = metric
+        frames.append(df[SKETCH_COLUMNS])
+
+    if not frames:
+        return pd.DataFrame(columns=SKETCH_COLUMNS)
+    return pd.concat(frames, ignore_index=True)
+
+
+def window_quantiles(sketches, test_cells, quantiles, start_date=None, end_date=None,
+                     relative_accuracy=DEFAULT_RELATIVE_ACCURACY):
+    """Merges the per-day sketches of a date window and estimates quantiles.
+
+    Args:
+        sketches (DataFrame): The output of build_sketches
+        test_cells (list): The cell names, control first
+        quantiles (array): Quantiles between 0 and 1
+        start_date (datetime): The first day of the window, or None for the first day
+        end_date (datetime): The last day of the window, or None for the last day
+        relative_accuracy (float): The relative accuracy the sketches were built with
+    Returns:
+        DataFrame: One row per metric, test cell and quantile with the estimated
+                   VALUE and the QUANTILE_DIFF between the cell and the control
+                   (NaN for the control)
+    """
+    in_window = pd.Series(True, index=sketches.index)
+    if start_date is not None:
+        in_window &= sketches['DT'] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        in_window &= sketches['DT'] <= pd.Timestamp(end_date)
+    sketches = sketches[in_window]
+
+    frames = []
+    for metric, metric_df in sketches.groupby('METRIC_NAME', sort=False):
+        values = {}
+        for cell in test_cells:
+            cell_df = metric_df[metric_df['TEST_CELL'] == cell]
+            values[cell] = QuantileSketch.from_frame(cell_df, relative_accuracy).quantile(quantiles)
+        control = values[test_cells[0]]
+        for cell in test_cells:
+            diff = values[cell] - control if cell != test_cells[0] else np.full(len(control), np.nan)
+            frames.append(pd.DataFrame({'METRIC_NAME': metric,
+                                        'TEST_CELL': cell,
+                                        'QUANTILE': quantiles,
+                                        'VALUE': values[cell],
+                                        'QUANTILE_DIFF': diff}))
+
+    if not frames:
+        return pd.DataFrame(columns=['METRIC_NAME', 'TEST_CELL', 'QUANTILE', 'VALUE', 'QUANTILE_DIFF'])
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,349 @@
+from contextlib import contextmanager
+import concurrent.futures
+import glob
+import importlib
+import logging
+import os
+
+import pandas as pd
+
+from .result_cache import result_key
+from .storage import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+# Rows per fetchmany call when streaming results from a database
+DEFAULT_FETCH_SIZE = 10000
+# The files picked up from a directory of partitions
+PARTITION_SUFFIXES = ('.csv', '.csv.gz')
+
+
+def open_source(csv_file=None, source_config=None, processes=None, cache=None):
+    """Creates a test's source from a CSV path or the source section of its config.
+
+    Args:
+        csv_file (str): The path of an event-level CSV file, or a glob, directory or
+                        list of partitions (see PartitionedCSVSource). Takes
+                        precedence over source_config
+        source_config (dict): The config's source section, see SQLSource and
+                              PartitionedCSVSource
+        processes (int): The number of worker processes partitions are read with
+        cache (ResultCache): Where partitioned sources keep their per-partition
+                             sufficient statistics
+    Returns:
+        Source: The source
+    """
+    if csv_file is not None:
+        if is_partitioned(csv_file):
+            return PartitionedCSVSource(csv_file, processes=processes, cache=cache)
+        return CSVSource(csv_file)
+    if source_config is not None:
+        if 'path' in source_config:
+            return PartitionedCSVSource(processes=processes, cache=cache, **source_config)
+        return SQLSource(**source_config)
+    raise ValueError('The test needs a CSV file or a source in its config')
+
+
+def _is_glob(path):
+    return any(c in path for c in '*?[')
+
+
+def is_partitioned(path):
+    """Whether path is a glob, a directory or a list of files rather than a single file"""
+    return not isinstance(path, str) or os.path.isdir(path) or _is_glob(path)
+
+
+def list_partitions(path):
+    """Lists the files of a partitioned input.
+
+    Args:
+        path (str): A glob, a directory (its .csv and .csv.gz files) or a single
+                    file, or a list of them
+    Returns:
+        list: The paths of the files, sorted so the events always come in the same order
+    """
+    files = []
+    for p in [path] if isinstance(path, str) else path:
+        if os.path.isdir(p):
+            files.extend(f for f in glob.glob(os.path.join(p, '*')) if f.endswith(PARTITION_SUFFIXES))
+        elif _is_glob(p):
+            files.extend(glob.glob(p))
+        else:
+            files.append(p)
+    if not files:
+        raise ValueError('No partitions found at {}'.format(path))
+    return sorted(set(files))
+
+
+def _read_partition(path):
+    """Worker process task: parses one partition"""
+    return pd.read_csv(path)
+
+
+def _aggregate_partition(path, date_field, test_cell_field, columns, products, keys):
+    """Worker process task: parses one partition and sums its per-day sufficient statistics"""
+    events = pd.read_csv(path).rename({date_field: 'DT', test_cell_field: 'TEST_CELL'}, axis=1)
+    events['DT'] = pd.to_datetime(events['DT'])
+    events['COUNT'] = 1
+    for key, column in keys.items():
+        # like ABTest.segment_suffstats, so missing values aren't dropped by the group by
+        events[key] = events[column].astype(str).where(events[column].notna(), '(none)')
+    return StorageBackend().aggregate_suffstats(events, columns, products, list(keys))
+
+
+class Source(object):
+    """Where a test's data comes from.
+
+    Sources that return events feed the full import: bootstrapped stats,
+    quantile sketches and segments by pattern. Aggregated sources only return
+    the per-day sufficient statistics, which give the closed-form stats.
+    """
+
+    # whether the source returns sufficient statistics instead of events
+    aggregated = False
+
+    def read_events(self):
+        """Reads the event-level data, one row per event"""
+        raise NotImplementedError
+
+    def read_suffstats(self, date_field, test_cell_field, columns, products, keys=None):
+        """Reads the per-day sufficient statistics, aggregated by the source.
+
+        Args:
+            date_field (str): The date column
+            test_cell_field (str): The test cell column
+            columns (list): The columns to get the sum (SUM_<col>) and sum of squares
+                            (SUMSQ_<col>) of. COUNT is the number of events
+            products (list): (numerator, denominator) pairs to get the sum of the
+                             cross-product (SUMXY_<numerator>_<denominator>) of
+            keys (dict): {output column: source column} to group by after DT and TEST_CELL
+        Returns:
+            DataFrame: The same columns as StorageBackend.aggregate_suffstats
+        """
+        raise NotImplementedError
+
+
+class CSVSource(Source):
+
+    def __init__(self, path):
+        """An event-level CSV file.
+
+        Args:
+            path (str): The path of the file
+        """
+        self.path = path
+
+    def __repr__(self):
+        return 'CSVSource({!r})'.format(self.path)
+
+    def read_events(self):
+        return pd.read_csv(self.path)
+
+
+class PartitionedCSVSource(Source):
+
+    def __init__(self, path, aggregate=False, processes=None, cache=None):
+        """Event-level CSV files split by date, e.g. one (optionally gzipped) file per day.
+
+        Given as the csv_file of a test, or in the config's source section:
+
+            source:
+              path: /data/my_test/*.csv.gz
+              aggregate: true
+
+        The partitions are parsed concurrently in processes worker processes.
+        Without aggregate, their events are concatenated (in file name order) for
+        the full import. With it, each worker sums its partition's per-day
+        sufficient statistics and only those are merged by day. With a cache,
+        the statistics of every partition are kept under its path, size and
+        modification time, so later runs only parse the new and changed partitions.
+
+        The partitions are listed on every read, so a glob picks up new files.
+
+        Args:
+            path (str): A glob, directory or list of files, see list_partitions
+            aggregate (bool): Return the sufficient statistics instead of the events
+            processes (int): The number of worker processes. Defaults to the number of CPUs
+            cache (ResultCache): Where to keep the per-partition sufficient statistics.
+                                 Defaults to no cache
+        """
+        self.path = path
+        self.aggregated = aggregate
+        self.processes = processes or os.cpu_count() or 1
+        self.cache = cache
+
+    def __repr__(self):
+        return 'PartitionedCSVSource({!r})'.format(self.path)
+
+    def _map(self, fn, *iterables):
+        """Runs fn over the partitions in worker processes, keeping their order"""
+        jobs = list(zip(*iterables))
+        if self.processes > 1 and len(jobs) > 1:
+            with concurrent.futures.ProcessPoolExecutor(min(self.processes, len(jobs))) as executor:
+                return list(executor.map(fn, *zip(*jobs)))
+        return [fn(*job) for job in jobs]
+
+    def read_events(self):
+        partitions = list_partitions(self.path)
+        logger.info('Reading {} partitions'.format(len(partitions)))
+        return pd.concat(self._map(_read_partition, partitions), ignore_index=True)
+
+    def _partition_key(self, path, spec):
+        stat = os.stat(path)
+        return result_key(kind='partition_suffstats', path=os.path.abspath(path),
+                          size=stat.st_size, mtime=stat.st_mtime_ns, spec=spec)
+
+    def read_suffstats(self, date_field, test_cell_field, columns, products, keys=None):
+        keys = keys or {}
+        partitions = list_partitions(self.path)
+        spec = [date_field, test_cell_field, columns, products, keys]
+
+        found = {}
+        if self.cache is not None:
+            partition_keys = {path: self._partition_key(path, spec) for path in partitions}
+            cached = self.cache.get_many(partition_keys.values())
+            found = {path: cached[key] for path, key in partition_keys.items() if key in cached}
+        stale = [path for path in partitions if path not in found]
+        logger.info('Aggregating {} partitions, {} unchanged'.format(len(stale), len(found)))
+
+        n = len(stale)
+        computed = dict(zip(stale, self._map(_aggregate_partition, stale, [date_field] * n,
+                                             [test_cell_field] * n, [columns] * n,
+                                             [products] * n, [keys] * n)))
+        if self.cache is not None and computed:
+            self.cache.put_many({partition_keys[path]: df for path, df in computed.items()})
+        found.update(computed)
+
+        # a day can span partitions, so merge by day
+        group_by = ['DT', 'TEST_CELL'] + list(keys)
+        return (pd.concat([found[path] for path in partitions], ignore_index=True)
+                .groupby(group_by).sum().reset_index())
+
+
+class SQLSource(Source):
+
+    def __init__(self, query, driver=None, connect=None, url=None, aggregate=True,
+                 fetch_size=DEFAULT_FETCH_SIZE, day_expression=None):
+        """A query against a database, given in the config's source section, e.g.
+
+            source:
+              driver: sqlite3
+              connect:
+                database: events.db
+              query: select * from events where test_id = 42
+
+        With aggregate (the default), the query is wrapped in a generated GROUP BY
+        that sums the sufficient statistics per day and test cell, so only one row
+        per day and cell leaves the database. Otherwise the events are streamed.
+        Results are fetched fetch_size rows at a time either way.
+
+        The connection is opened for each read and never kept on the source, so
+        a test can still be sent to worker processes.
+
+        Args:
+            query (str): The event-level query
+            driver (str): A DB-API module to connect with, e.g. sqlite3 or psycopg2
+            connect (dict): Keyword arguments of the driver's connect()
+            url (str): A SQLAlchemy database URL, instead of driver and connect.
+                       Needs the sqlalchemy package
+            aggregate (bool): Aggregate in the database instead of reading the events
+            fetch_size (int): Rows per fetchmany call
+            day_expression (str): SQL truncating the date column, with {} for the
+                                  column. Defaults to date({}) on SQLite and
+                                  cast({} as date) elsewhere
+        """
+        if (driver is None) == (url is None):
+            raise ValueError('A SQL source needs either a driver or a url')
+        self.query = query.strip().rstrip(';')
+        self.driver = driver
+        self.connect_args = connect or {}
+        self.url = url
+        self.aggregated = aggregate
+        self.fetch_size = fetch_size
+        if day_expression is None:
+            is_sqlite = driver == 'sqlite3' or (url or '').startswith('sqlite')
+            day_expression = 'date({})' if is_sqlite else 'cast({} as date)'
+        self.day_expression = day_expression
+
+    def __repr__(self):
+        return 'SQLSource({!r})'.format(self.url or self.driver)
+
+    @contextmanager
+    def _connect(self):
+        if self.url is not None:
+            try:
+                import sqlalchemy
+            except ImportError:
+                raise ImportError('SQL sources with a url need the sqlalchemy package: pip install sqlalchemy')
+            engine = sqlalchemy.create_engine(self.url)
+            # the DB-API connection underneath, for cursor() and fetchmany()
+            conn = engine.raw_connection()
+            try:
+                yield conn
+            finally:
+                conn.close()
+                engine.dispose()
+        else:
+            conn = importlib.import_module(self.driver).connect(**self.connect_args)
+            try:
+                yield conn
+            finally:
+                conn.close()
+
+    def fetch(self, query):
+        """Runs query and streams its rows into a DataFrame, fetch_size rows at a time"""
+        with self._connect() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(query)
+                columns = [d[0] for d in cur.description]
+                frames = []
+                while True:
+                    rows = cur.fetchmany(self.fetch_size)
+                    if not rows:
+                        break
+                    frames.append(pd.DataFrame.from_records(rows, columns=columns))
+            finally:
+                cur.close()
+
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(frames, ignore_index=True)
+
+    def read_events(self):
+        return self.fetch(self.query)
+
+    def aggregate_query(self, date_field, test_cell_field, columns, products, keys=None):
+        """Generates the GROUP BY query of read_suffstats"""
+        keys = keys or {}
+        day = self.day_expression.format(date_field)
+        group_by = [day, test_cell_field] + list(keys.values())
+
+        def value(col):
+            # COUNT is the number of events, not a column
+            return '1' if col == 'COUNT' else col
+
+        select = ['{} as DT'.format(day), '{} as TEST_CELL'.format(test_cell_field)]
+        select += ['{} as {}'.format(col, name) for name, col in keys.items()]
+        select.append('count(*) as COUNT')
+        for col in columns:
+            # 1.0 * so integer columns are summed as floats
+            select.append('sum(1.0 * {0}) as SUM_{1}'.format(value(col), col))
+            select.append('sum(1.0 * {0} * {0}) as SUMSQ_{1}'.format(value(col), col))
+        for numerator, denominator in products:
+            select.append('sum(1.0 * {} * {}) as SUMXY_{}_{}'.format(
+                value(numerator), value(denominator), numerator, denominator))
+
+        return 'select {}\nfrom ({}) events\ngroup by {}\norder by {}'.format(
+            ',\n       '.join(select), self.query, ', '.join(group_by), ', '.join(group_by))
+
+    def read_suffstats(self, date_field, test_cell_field, columns, products, keys=None):
+        df = self.fetch(self.aggregate_query(date_field, test_cell_field, columns, products, keys))
+        # some databases fold unquoted aliases to lower case
+        df.columns = [c.upper() for c in df.columns]
+        df['DT'] = pd.to_datetime(df['DT'])
+        df['COUNT'] = df['COUNT'].astype('int64')
+        stat_columns = [c for c in df.columns if c.startswith(('SUM_', 'SUMSQ_', 'SUMXY_'))]
+        # sums over only NULLs are NULL
+        df[stat_columns] = df[stat_columns].astype(float).fillna(0)
+        return df
@@ -1,86 +1,52 @@
-from contextlib import contextmanager
 import os
-import sqlite3
-import pkg_resources
 
 import pandas as pd
 import numpy as np
 
+from .sketches import SKETCH_COLUMNS
+from .storage import (SQLiteBackend, sqlite_connection, TEST_LIST_TABLE,
+                      CREATE_TABLE_FILENAME, LATEST_RESULTS_COLUMNS)
+
 
 DATABASE_FILE = 'ab_testing_data.db'
-TEST_LIST_TABLE = 'ab_tests'
 DAILY_ROLLUP_EXT = '_daily'
 STATS_EXT = '_rolling_stats'
-CREATE_TABLE_FILENAME = pkg_resources.resource_filename(__name__, 'res/create_test_list_table.sql')
+SUFFSTATS_EXT = '_suffstats'
+METRICS_EXT = '_metrics'
+CELLS_EXT = '_cells'
+SKETCHES_EXT = '_sketches'
+SEGMENT_DAILY_EXT = '_segment_daily'
+SEGMENT_SUFFSTATS_EXT = '_segment_suffstats'
+SEGMENT_STATS_EXT = '_segment_stats'
+SEGMENT_EXTS = [SEGMENT_DAILY_EXT, SEGMENT_SUFFSTATS_EXT, SEGMENT_STATS_EXT]
+
 
-@contextmanager
-def sqlite_connection(filename):
-    conn = sqlite3.connect(filename)
-    yield conn
-    conn.close()
+def get_backend(backend=None):
+    """Returns backend, or the default SQLite backend on DATABASE_FILE if it's None"""
+    if backend is None:
+        return SQLiteBackend(DATABASE_FILE)
+    return backend
 
 
 def sqlify_test_name(test_name):
     return test_name.replace(' ', '_')
 
 
-def _verify_test_in_list(test_name, config_file, description):
+def _verify_test_in_list(test_name, config_file, description, backend=None):
     """Checks whether the test is currently in the list
     of tests and active. If not, it will add or activate
     the test.
 
     Args:
         test_name (str): Name of the test
+        backend (StorageBackend): Where the test list is stored
     """
-
-    # first check that the ab_tests table exists and create if not
-    check_query = """select name from sqlite_master where type='table' and name = ?"""
-    with sqlite_connection(DATABASE_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute(check_query, (TEST_LIST_TABLE,))
-        if cur.fetchone() is None: # missing table
-            _create_test_list_table()
-    
     test_name = sqlify_test_name(test_name)
     config_file = os.path.basename(config_file)
-    check_query = 'select count(*) from {} where test_name = ?'.format(TEST_LIST_TABLE)
-
-    with sqlite_connection(DATABASE_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute(check_query, (test_name,))
-        result = cur.fetchone()[0]
-
-    if result == 0:
-        # test does not exist yet
-        insert_query = """
-        insert into {} (test_name, active_fg, config_file, description)
-        values (?, 'Y', ?, ?)
-        """.format(TEST_LIST_TABLE)
-
-        with sqlite_connection(DATABASE_FILE) as conn:
-            conn.execute(insert_query, (test_name, config_file, description))
-            conn.commit()
-    else:
-        # test exists, just make sure it's active
-        update_query = """
-        update {} set active_fg = 'Y', config_file = ?, description = ?
-        where test_name = ?
-        """.format(TEST_LIST_TABLE)
-
-        with sqlite_connection(DATABASE_FILE) as conn:
-            conn.execute(update_query, (config_file, description, test_name))
-            conn.commit()
-
-def _create_test_list_table():
-    """Creates the test list table"""
-    with open(CREATE_TABLE_FILENAME, 'r') as f:
-        query = f.read()
-    with sqlite_connection(DATABASE_FILE) as conn:
-        conn.execute(query)
-        conn.commit()
-    
+    get_backend(backend).verify_test_in_list(test_name, config_file, description)
+
 
-def deactivate_test(test_name):
+def deactivate_test(test_name, backend=None):
     """Sets the test_name to inactive if it exists in the test list.
 
     TODO: Decide whether, when a test is deactivated, to drop its corresponding tables.
@@ -89,30 +55,62 @@ def deactivate_test(test_name):
 
     Args:
         test_name (str): The name of the test    
+        backend (StorageBackend): Where the test list is stored
     """
-    test_name = sqlify_test_name(test_name)
-    query = "update {} set active_fg = 'N' where test_name = ?".format(TEST_LIST_TABLE)
+    get_backend(backend).deactivate_test(sqlify_test_name(test_name))
+
+
+def bump_load_version(test, backend=None):
+    """Increments the test's load version in the test list.
 
-    with sqlite_connection(DATABASE_FILE) as conn:
-        cur = conn.cursor()
-        cur.execute(query, (test_name,))
-        conn.commit()
+    Called once at the end of every load, after all of the test's tables
+    are written, so readers can tell whether anything changed since they
+    last read the test.
+
+    Args:
+        test (ABTest): The test
+        backend (StorageBackend): Where the test list is stored
+    """
+    get_backend(backend).bump_load_version(sqlify_test_name(test.test_name))
+
+
+def update_latest_results(df, test, backend=None):
+    """Replaces the test's rows in the latest results table with its last day of stats.
+
+    The table has one row per test, metric and test cell across all tests, so
+    the overview of every test is a single read.
+
+    Args:
+        df (DataFrame): The rolling stats, as in insert_rolling_stats_data
+        test (ABTest): The test
+        backend (StorageBackend): Where the table is stored
+    """
+    latest = df[df['DT'] == df['DT'].max()]
+    latest = pd.DataFrame({'test_name': sqlify_test_name(test.test_name),
+                           'metric_name': latest['METRIC_NAME'],
+                           'test_cell': latest['TEST_CELL'].astype(str),
+                           'dt': pd.to_datetime(latest['DT']).dt.strftime('%Y-%m-%d'),
+                           'metric_value': latest['METRIC_VALUE'].astype(float),
+                           'p_value': latest['P_VALUE'].astype(float),
+                           'lower_ci': latest['LOWER_CI'].astype(float),
+                           'upper_ci': latest['UPPER_CI'].astype(float)})
+    get_backend(backend).replace_latest_results(sqlify_test_name(test.test_name),
+                                                latest[LATEST_RESULTS_COLUMNS])
 
         
-def _insert_table(df, table_name):
+def _insert_table(df, table_name, backend=None):
     """Creates or replaces the table_name with the data
     in df.
 
     Args:
         df (DataFrame): The data to create/replace the table with
         table_name (str): The name of table    
+        backend (StorageBackend): Where to store the table
     """
-    with sqlite_connection(DATABASE_FILE) as conn:
-        df.to_sql(table_name, conn, if_exists='replace', index=False,
-                  chunksize=5000)
+    get_backend(backend).write_table(df, table_name)
         
     
-def insert_daily_rollup_data(df, test):
+def insert_daily_rollup_data(df, test, backend=None):
     """Creates or replaces the daily rollup table for test_name.
 
     This method will create or replace a table with name (test_name +
@@ -124,6 +122,7 @@ def insert_daily_rollup_data(df, test):
     Args:
         df (DataFrame): The data to create/replace the table with
         test_name (str): The name of the test
+        backend (StorageBackend): Where to store the table
     """
     test_name = sqlify_test_name(test.test_name)
     # Check that the data conforms to the expected schema:
@@ -141,13 +140,13 @@ def insert_daily_rollup_data(df, test):
             raise TypeError('{} column should be numeric, found {}'.format(col, df[col].dtype))
 
         
-    _verify_test_in_list(test_name, test.config_file, test.description)
+    _verify_test_in_list(test_name, test.config_file, test.description, backend)
 
     table_name = test_name + DAILY_ROLLUP_EXT
-    _insert_table(df, table_name)
+    _insert_table(df, table_name, backend)
 
 
-def insert_rolling_stats_data(df, test):
+def insert_rolling_stats_data(df, test, backend=None):
     """Creates or replaces the rolling stats table for test_name.
 
     This method will create or replace a table with name (test_name +
@@ -159,14 +158,172 @@ def insert_rolling_stats_data(df, test):
     Args:
         df (DataFrame): The data to create/replace the table with
         test_name (str): The name of the test
+        backend (StorageBackend): Where to store the table
     """
     test_name = sqlify_test_name(test.test_name)
-    _verify_test_in_list(test_name, test.config_file, test.description)
+    _verify_test_in_list(test_name, test.config_file, test.description, backend)
 
     # TODO: Define expected schema and add checks
     
     table_name = test_name + STATS_EXT
-    _insert_table(df, table_name)
+    _insert_table(df, table_name, backend)
+
+
+def insert_suffstats_data(df, test, backend=None):
+    """Creates or replaces the sufficient statistics table for test_name.
+
+    The table (test_name + SUFFSTATS_EXT) has one row per DT and TEST_CELL,
+    with the COUNT, SUM_, SUMSQ_ and SUMXY_ columns from ABTest.daily_suffstats.
+    Together with the metric definitions, this is enough to compute the
+    stats for any date window without the raw events.
+
+    Args:
+        df (DataFrame): The data to create/replace the table with
+        test (ABTest): The test
+        backend (StorageBackend): Where to store the table
+    """
+    test_name = sqlify_test_name(test.test_name)
+    for col in ['DT', 'TEST_CELL', 'COUNT']:
+        if col not in df.columns:
+            raise KeyError('{} column not found in sufficient statistics'.format(col))
+
+    _verify_test_in_list(test_name, test.config_file, test.description, backend)
+
+    table_name = test_name + SUFFSTATS_EXT
+    _insert_table(df, table_name, backend)
+
+
+def insert_metric_definitions(test, backend=None):
+    """Creates or replaces the metric definitions table for test_name.
+
+    One row per metric with its METRIC_TYPE, NUMERATOR_COLUMN and
+    DENOMINATOR_COLUMN, so stats can be computed from the sufficient
+    statistics without the config file.
+
+    Args:
+        test (ABTest): The test
+        backend (StorageBackend): Where to store the table
+    """
+    test_name = sqlify_test_name(test.test_name)
+    df = pd.DataFrame([[k, v['type'], v['numerator_column'], v['denominator_column']]
+                       for k, v in test.metric_definitions.items()],
+                      columns=['METRIC_NAME', 'METRIC_TYPE', 'NUMERATOR_COLUMN', 'DENOMINATOR_COLUMN'])
+
+    _verify_test_in_list(test_name, test.config_file, test.description, backend)
+
+    table_name = test_name + METRICS_EXT
+    _insert_table(df, table_name, backend)
+
+
+def insert_cell_definitions(test, backend=None):
+    """Creates or replaces the test cells table for test_name.
+
+    One row per TEST_CELL, control first, with IS_CONTROL set on the control,
+    so readers compare the cells the same way the import did.
+
+    Args:
+        test (ABTest): The test
+        backend (StorageBackend): Where to store the table
+    """
+    test_name = sqlify_test_name(test.test_name)
+    df = pd.DataFrame({'TEST_CELL': test.test_cells,
+                       'IS_CONTROL': [i == 0 for i in range(len(test.test_cells))]})
+
+    _verify_test_in_list(test_name, test.config_file, test.description, backend)
+
+    table_name = test_name + CELLS_EXT
+    _insert_table(df, table_name, backend)
+
+
+def insert_sketch_data(df, test, backend=None):
+    """Creates or replaces the quantile sketch table for test_name.
+
+    The table (test_name + SKETCHES_EXT) holds the bucket counts of one
+    sketch per DT, TEST_CELL and METRIC_NAME, as built by
+    sketches.build_sketches.
+
+    Args:
+        df (DataFrame): The data to create/replace the table with
+        test (ABTest): The test
+        backend (StorageBackend): Where to store the table
+    """
+    test_name = sqlify_test_name(test.test_name)
+    for col in SKETCH_COLUMNS:
+        if col not in df.columns:
+            raise KeyError('{} column not found in sketch data'.format(col))
+
+    _verify_test_in_list(test_name, test.config_file, test.description, backend)
+
+    table_name = test_name + SKETCHES_EXT
+    _insert_table(df, table_name, backend)
+
+
+def _insert_segment_table(df, test, ext, backend=None):
+    test_name = sqlify_test_name(test.test_name)
+    for col in ['DT', 'TEST_CELL', 'SEGMENT_NAME', 'SEGMENT_VALUE']:
+        if col not in df.columns:
+            raise KeyError('{} column not found in segment data'.format(col))
+
+    _verify_test_in_list(test_name, test.config_file, test.description, backend)
+    _insert_table(df, test_name + ext, backend)
+
+
+def insert_segment_rollup_data(df, test, backend=None):
+    """Creates or replaces the per-segment daily rollup table for test_name.
+
+    Same as the daily rollup (test_name + SEGMENT_DAILY_EXT), with one row
+    per DT, TEST_CELL, SEGMENT_NAME and SEGMENT_VALUE.
+
+    Args:
+        df (DataFrame): The data to create/replace the table with
+        test (ABTest): The test
+        backend (StorageBackend): Where to store the table
+    """
+    _insert_segment_table(df, test, SEGMENT_DAILY_EXT, backend)
+
+
+def insert_segment_suffstats_data(df, test, backend=None):
+    """Creates or replaces the per-segment sufficient statistics table for test_name.
+
+    Args:
+        df (DataFrame): The output of ABTest.segment_suffstats
+        test (ABTest): The test
+        backend (StorageBackend): Where to store the table
+    """
+    _insert_segment_table(df, test, SEGMENT_SUFFSTATS_EXT, backend)
+
+
+def insert_segment_stats_data(df, test, backend=None):
+    """Creates or replaces the per-segment rolling stats table for test_name.
+
+    Args:
+        df (DataFrame): The output of suffstats.segment_stats
+        test (ABTest): The test
+        backend (StorageBackend): Where to store the table
+    """
+    _insert_segment_table(df, test, SEGMENT_STATS_EXT, backend)
+
+
+def drop_sketch_data(test, backend=None):
+    """Drops the quantile sketch table of a test, e.g. once it's loaded without events.
+
+    Args:
+        test (ABTest): The test
+        backend (StorageBackend): Where the table is stored
+    """
+    get_backend(backend).drop_table(sqlify_test_name(test.test_name) + SKETCHES_EXT)
+
+
+def drop_segment_data(test, backend=None):
+    """Drops the segment tables of a test, e.g. once its config has no segments.
+
+    Args:
+        test (ABTest): The test
+        backend (StorageBackend): Where the tables are stored
+    """
+    test_name = sqlify_test_name(test.test_name)
+    for ext in SEGMENT_EXTS:
+        get_backend(backend).drop_table(test_name + ext)
 
 
 if __name__ == '__main__':
@@ -5,21 +5,51 @@ Created on Mon Jul 15 14:51:05 2019
 @author: michael.schulte
 """
 
-import multiprocessing
-
 import numpy as np
 import pandas as pd
-import scipy.stats as stats
-import statsmodels.api as sm
+
+from .kernels import poisson_accumulate, poisson_weights, resample_moments
+from .lazy_import import LazyModule
+
+# scipy and statsmodels take most of the package's import time, so they're
+# only imported once a test is actually evaluated
+stats = LazyModule('scipy.stats')
+sm = LazyModule('statsmodels.api')
 
 
 QUANTILES = np.arange(.1, 1, .2)
 
 
+def _t_stat_from_moments(a, n_a, b, n_b):
+    '''Equal-variance t statistic, as in stats.ttest_ind, from (sums, sums of squares) of each sample
+
+    The variances come from the raw sums, which cancel when the mean is large
+    next to the spread, so the samples should be centered first (see _center).
+    '''
+    mean_a = a[0] / n_a
+    mean_b = b[0] / n_b
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        var_a = (a[1] - a[0] * mean_a) / (n_a - 1)
+        var_b = (b[1] - b[0] * mean_b) / (n_b - 1)
+        pooled_var = ((n_a - 1) * var_a + (n_b - 1) * var_b) / (n_a + n_b - 2)
+        return (mean_a - mean_b) / np.sqrt(pooled_var * (1 / n_a + 1 / n_b))
+
+
+def _center(values, shift):
+    '''values - shift as floats, so the kernels accumulate moments of values near 0
+
+    t statistics and differences of means don't change under a shift of both
+    samples, but their sums of squares lose every digit below the mean's.
+    '''
+    return np.asarray(values, dtype = float) - shift
+
+
 class ContinuousTestEval:
-    def __init__(self, control, test):
+    def __init__(self, control, test, seed = None):
         self.control = control
         self.test = test
+        # seed may be an int or a np.random.SeedSequence; None draws fresh entropy
+        self.random_state = np.random.default_rng(seed)
 
 
     def __repr__(self):
@@ -32,62 +62,37 @@ class ContinuousTestEval:
         if type(self.control) != np.ndarray:
             self.control = np.array(self.control)
         if type(self.test) != np.ndarray:
-            self.test = np.array(self.control)
+            self.test = np.array(self.test)
 
         return self.control, self.test
 
 
-    def _multiprocess_pval_loop(self, *args):
-        '''
-
-        :param df:
-        :return:
-        '''
-        ctrl_boot = args[0][0].sample(args[0][1], replace=True)
-        test_boot = args[0][0].sample(args[0][2], replace=True)
-        boot_t = np.abs(stats.ttest_ind(ctrl_boot, test_boot)[0])
-
-        return boot_t
-
-
-    def continuous_pval(self, n = 1000):
+    def continuous_pval(self, n = 1000, backend = None):
         '''Bootstrapped p-value on continous variable using permutation method
         ----------
         Params:
             control: continuous data array for control group
             test = continuous data array for test group
             n = number of bootstrap iterations (higher is more accurate, more computationally expensive)
+            backend = kernel backend for the resampling, see kernels.get_backend
         '''
         control, test = self.data_prep
 
         t_stat = stats.ttest_ind(control, test)[0]
-        df = pd.DataFrame({'data': np.append(control, test)})
+        pooled = np.append(control, test)
+        pooled = _center(pooled, pooled.mean())
 
-        p = multiprocessing.Pool()
-        diff = p.map(self._multiprocess_pval_loop, [(df, control.shape[0], test.shape[0]) for i in range(n)])
+        ctrl_seed, test_seed = self.random_state.integers(0, 2 ** 63, 2)
+        ctrl_boot = resample_moments(pooled, control.shape[0], n, ctrl_seed, backend)
+        test_boot = resample_moments(pooled, test.shape[0], n, test_seed, backend)
+        diff = np.abs(_t_stat_from_moments(ctrl_boot, control.shape[0], test_boot, test.shape[0]))
 
         p_val = np.mean(np.where(np.abs(t_stat) < diff, 1, 0))
 
         return p_val
 
 
-    def _multiprocess_ci_loop(self, *args):
-        '''
-        Multiprocess bootstrapping loop for confidence intervals
-
-        :param c: control data
-        :param t: test data
-        :return: Mean difference value of single bootstrap iteration
-        '''
-
-        boot_c = args[0][0].sample(args[0][0].shape[0], replace = True)
-        boot_t = args[0][1].sample(args[0][1].shape[0], replace = True)
-        boot_diff = boot_t.mean() - boot_c.mean()
-
-        return boot_diff
-
-
-    def mean_diff_continuous_ci(self, n = 1000, ci = .95):
+    def mean_diff_continuous_ci(self, n = 1000, ci = .95, backend = None):
         '''
         Bootstrapped mean difference confidence interval on continuous variable
         ----------
@@ -95,14 +100,15 @@ class ContinuousTestEval:
             control: continuous data array for control group
             test = continuous data array for test group
             n = number of bootstrap iterations (higher is more accurate, more computationally expensive)
+            backend = kernel backend for the resampling, see kernels.get_backend
         '''
         control, test = self.data_prep
+        shift = control.mean()
 
-        c = pd.DataFrame({'data': control})
-        t = pd.DataFrame({'data': test})
-
-        p = multiprocessing.Pool()
-        sample_means = p.map(self._multiprocess_ci_loop, [(c, t) for i in range(n)])
+        ctrl_seed, test_seed = self.random_state.integers(0, 2 ** 63, 2)
+        ctrl_sums = resample_moments(_center(control, shift), control.shape[0], n, ctrl_seed, backend)[0]
+        test_sums = resample_moments(_center(test, shift), test.shape[0], n, test_seed, backend)[0]
+        sample_means = test_sums / test.shape[0] - ctrl_sums / control.shape[0]
 
         alpha = ((1 - ci) * 100) / 2
 
@@ -156,6 +162,80 @@ class ContinuousTestEval:
         return out_df
 
 
+class ContinuousMultiTestEval:
+    def __init__(self, control, tests, seed = None):
+        '''Bootstrapped tests of several test cells against one control
+
+        Gives the same results as a ContinuousTestEval of the control and each
+        test cell, but the CI resamples the control once for all of them. With a
+        single test cell, its random draws are the same as ContinuousTestEval's.
+        '''
+        self.control = np.asarray(control)
+        self.tests = [np.asarray(t) for t in tests]
+        # seed may be an int or a np.random.SeedSequence; None draws fresh entropy
+        self.random_state = np.random.default_rng(seed)
+
+
+    def __repr__(self):
+        return 'Class for A/B/n testing on continuous data'
+
+
+    def continuous_pvals(self, n = 1000, backend = None):
+        '''Bootstrapped p-value of every test cell, as in ContinuousTestEval.continuous_pval
+        ----------
+        Params:
+            n = number of bootstrap iterations (higher is more accurate, more computationally expensive)
+            backend = kernel backend for the resampling, see kernels.get_backend
+
+        Each test cell is resampled from its own pool with the control, so
+        nothing is shared between the test cells here.
+        '''
+        control = self.control
+        p_vals = np.empty(len(self.tests))
+        for i, test in enumerate(self.tests):
+            t_stat = stats.ttest_ind(control, test)[0]
+            pooled = np.append(control, test)
+            pooled = _center(pooled, pooled.mean())
+
+            ctrl_seed, test_seed = self.random_state.integers(0, 2 ** 63, 2)
+            ctrl_boot = resample_moments(pooled, control.shape[0], n, ctrl_seed, backend)
+            test_boot = resample_moments(pooled, test.shape[0], n, test_seed, backend)
+            diff = np.abs(_t_stat_from_moments(ctrl_boot, control.shape[0], test_boot, test.shape[0]))
+
+            p_vals[i] = np.mean(np.where(np.abs(t_stat) < diff, 1, 0))
+
+        return p_vals
+
+
+    def mean_diff_continuous_cis(self, n = 1000, ci = .95, backend = None):
+        '''Bootstrapped mean difference CI of every test cell, as in ContinuousTestEval.mean_diff_continuous_ci
+        ----------
+        Params:
+            n = number of bootstrap iterations (higher is more accurate, more computationally expensive)
+            ci = confidence interval desired
+            backend = kernel backend for the resampling, see kernels.get_backend
+
+        Return:
+            (lower bounds, upper bounds), one per test cell
+        '''
+        control = self.control
+        shift = control.mean()
+
+        seeds = self.random_state.integers(0, 2 ** 63, 1 + len(self.tests))
+        # the control's replicates are shared by every test cell
+        ctrl_means = resample_moments(_center(control, shift), control.shape[0], n,
+                                      seeds[0], backend)[0] / control.shape[0]
+        sample_means = np.array([resample_moments(_center(test, shift), test.shape[0], n, seed, backend)[0]
+                                 / test.shape[0] for test, seed in zip(self.tests, seeds[1:])]) - ctrl_means
+
+        alpha = ((1 - ci) * 100) / 2
+
+        lb = np.percentile(sample_means, alpha, axis = 1)
+        ub = np.percentile(sample_means, 100 - alpha, axis = 1)
+
+        return lb, ub
+
+
 class BinaryTestEval:
     def __init__(self, control, test):
         self.control = control
@@ -172,7 +252,7 @@ class BinaryTestEval:
         if type(self.control) != np.ndarray:
             self.control = np.array(self.control)
         if type(self.test) != np.ndarray:
-            self.test = np.array(self.control)
+            self.test = np.array(self.test)
 
         return self.control, self.test
 
@@ -220,3 +300,277 @@ class BinaryTestEval:
         lb = tp - cp - t_c
 
         return lb, ub
+
+
+class RatioTestEval:
+    def __init__(self, control, test):
+        '''Delta-method test on a ratio of per-row sums, sum(x) / sum(y)
+
+        control and test hold the sufficient statistics of each group: a dict (or
+        DataFrame) with keys n, sum_x, sum_y, sum_xx, sum_yy and sum_xy. The values
+        can be arrays, e.g. one entry per day of cumulative data, and every method
+        then returns one result per entry.
+        '''
+        self.control = control
+        self.test = test
+
+
+    def __repr__(self):
+        return 'Class for A/B testing on ratio metrics'
+
+
+    @staticmethod
+    def _ratio_and_variance(s):
+        '''Ratio of the group and its delta-method variance'''
+        n = np.asarray(s['n'], dtype = float)
+        sum_x = np.asarray(s['sum_x'], dtype = float)
+        sum_y = np.asarray(s['sum_y'], dtype = float)
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            ratio = sum_x / sum_y
+            var_x = (s['sum_xx'] - sum_x ** 2 / n) / (n - 1)
+            var_y = (s['sum_yy'] - sum_y ** 2 / n) / (n - 1)
+            cov_xy = (s['sum_xy'] - sum_x * sum_y / n) / (n - 1)
+            variance = (var_x - 2 * ratio * cov_xy + ratio ** 2 * var_y) / (n * (sum_y / n) ** 2)
+
+        return ratio, variance
+
+
+    def _diff_and_se(self):
+        cr, cv = self._ratio_and_variance(self.control)
+        tr, tv = self._ratio_and_variance(self.test)
+
+        return tr - cr, np.sqrt(cv + tv)
+
+
+    def ratio_pval(self):
+        '''Two-sided z-test p-value on the difference of ratios
+        ----------
+        Params:
+            control = sufficient statistics for control group
+            test = sufficient statistics for test group
+        '''
+        diff, se = self._diff_and_se()
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            pval = 2 * stats.norm.sf(np.abs(diff / se))
+
+        return pval
+
+
+    def ratio_ci(self, ci = .95):
+        '''Delta-method confidence interval on the difference of ratios (test - control)
+        ----------
+        Params:
+            control = sufficient statistics for control group
+            test = sufficient statistics for test group
+            ci = confidence interval desired
+        '''
+        diff, se = self._diff_and_se()
+
+        z_score = stats.norm.ppf(1 - (1 - ci) / 2)
+
+        lb = diff - z_score * se
+        ub = diff + z_score * se
+
+        return lb, ub
+
+
+class ProportionTestEval:
+    def __init__(self, control, test):
+        '''Two-proportion test from success and trial counts
+
+        control and test are dicts (or DataFrames) with keys successes and trials.
+        Like RatioTestEval, the values can be arrays and every method then returns
+        one result per entry. Gives the same results as BinaryTestEval without
+        building the arrays of trials.
+        '''
+        self.control = control
+        self.test = test
+
+
+    def __repr__(self):
+        return 'Class for A/B testing on binary counts'
+
+
+    @property
+    def data_prep(self):
+        '''Successes and trials of both groups as float arrays'''
+        return [np.asarray(s[k], dtype = float) for s in (self.control, self.test)
+                for k in ('successes', 'trials')]
+
+
+    def proportion_pval(self):
+        '''Pooled two-proportion z-test p-value, as in proportions_ztest
+        ----------
+        Params:
+            control = success and trial counts for control group
+            test = success and trial counts for test group
+        '''
+        cs, cn, ts, tn = self.data_prep
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            pooled = (cs + ts) / (cn + tn)
+            se = np.sqrt(pooled * (1 - pooled) * (1 / cn + 1 / tn))
+            pval = 2 * stats.norm.sf(np.abs((ts / tn - cs / cn) / se))
+
+        return pval
+
+
+    def proportion_ci(self, ci = .9):
+        '''Confidence interval on the difference of proportions, as in binary_ci
+        ----------
+        Params:
+            control = success and trial counts for control group
+            test = success and trial counts for test group
+            ci = confidence interval desired
+        '''
+        cs, cn, ts, tn = self.data_prep
+
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            cp = cs / cn
+            tp = ts / tn
+            t_c = stats.norm.ppf(1 - (1 - ci) / 2) * np.sqrt(cp * (1 - cp) / cn + tp * (1 - tp) / tn)
+
+        return tp - cp - t_c, tp - cp + t_c
+
+
+class PoissonBootstrap:
+    def __init__(self, n_replicates = 1000, seed = 0):
+        '''Streaming Poisson bootstrap of the mean of one group
+
+        Every row gets a Poisson(1) weight per replicate from poisson_weights and
+        the accumulator keeps the weighted sum and weight total of each replicate,
+        so memory is O(n_replicates) however many rows are added. Accumulators
+        with the same n_replicates and seed merge by addition (a + b), so chunks,
+        processes and days can be accumulated separately. Row ids must be unique
+        across everything that gets merged.
+        '''
+        self.n_replicates = n_replicates
+        self.seed = seed
+        self.count = 0
+        self.total = 0.
+        self.replicate_sums = np.zeros(n_replicates)
+        self.replicate_weights = np.zeros(n_replicates)
+
+
+    def __repr__(self):
+        return 'Streaming Poisson bootstrap accumulator'
+
+
+    def update(self, values, row_ids = None, weights = None):
+        '''Add a chunk of rows
+        ----------
+        Params:
+            values = data array for the chunk
+            row_ids = integer id of every row in the chunk
+            weights = the chunk's poisson_weights, if they're already computed
+                      (e.g. shared by several metrics of the same rows)
+        '''
+        values = np.asarray(values, dtype = float)
+
+        if weights is not None:
+            sums, totals = values @ weights, weights.sum(axis = 0)
+        else:
+            sums, totals = poisson_accumulate(values[:, None], row_ids, self.n_replicates, self.seed)
+            sums = sums[0]
+
+        return self.add_replicates(sums, totals, values)
+
+
+    def add_replicates(self, replicate_sums, replicate_weights, values):
+        '''Add a chunk of rows whose replicate sums are already computed
+        ----------
+        Params:
+            replicate_sums = weighted sum of the chunk's values per replicate
+            replicate_weights = total weight of the chunk's rows per replicate
+            values = data array for the chunk
+        '''
+        self.replicate_sums += replicate_sums
+        self.replicate_weights += replicate_weights
+        self.count += values.shape[0]
+        self.total += values.sum()
+
+        return self
+
+
+    def __add__(self, other):
+        if (self.n_replicates, self.seed) != (other.n_replicates, other.seed):
+            raise ValueError('Can only merge bootstraps with the same replicates and seed')
+
+        merged = PoissonBootstrap(self.n_replicates, self.seed)
+        merged.count = self.count + other.count
+        merged.total = self.total + other.total
+        merged.replicate_sums = self.replicate_sums + other.replicate_sums
+        merged.replicate_weights = self.replicate_weights + other.replicate_weights
+
+        return merged
+
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else np.nan
+
+
+    @property
+    def replicate_means(self):
+        '''Mean of every replicate, NaN for the (rare) replicates with no weight'''
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            return self.replicate_sums / self.replicate_weights
+
+
+class PoissonBootstrapTestEval:
+    def __init__(self, control, test):
+        '''Mean difference test from two PoissonBootstrap accumulators
+
+        The replicates of the two groups are independent since their rows are,
+        so the difference of their replicate means is a bootstrap sample of the
+        difference in means.
+        '''
+        self.control = control
+        self.test = test
+
+
+    def __repr__(self):
+        return 'Class for A/B testing on streamed continuous data'
+
+
+    @property
+    def replicate_diffs(self):
+        diff = self.test.replicate_means - self.control.replicate_means
+        return diff[~np.isnan(diff)]
+
+
+    def bootstrap_pval(self):
+        '''Two-sided bootstrap p-value on the mean difference
+        ----------
+        Params:
+            control = PoissonBootstrap for control group
+            test = PoissonBootstrap for test group
+
+        Return:
+            twice the share of replicates on the far side of zero, i.e. one minus
+            the widest percentile interval that still excludes zero
+        '''
+        diff = self.replicate_diffs
+        if diff.shape[0] == 0:
+            return np.nan
+
+        return min(1., 2 * min(np.mean(diff <= 0), np.mean(diff >= 0)))
+
+
+    def mean_diff_ci(self, ci = .95):
+        '''Percentile confidence interval on the mean difference (test - control)
+        ----------
+        Params:
+            control = PoissonBootstrap for control group
+            test = PoissonBootstrap for test group
+            ci = confidence interval desired
+        '''
+        diff = self.replicate_diffs
+        if diff.shape[0] == 0:
+            return np.nan, np.nan
+
+        alpha = ((1 - ci) * 100) / 2
+
+        return np.percentile(diff, alpha), np.percentile(diff, 100 - alpha)
@@ -0,0 +1,599 @@
+from contextlib import contextmanager
+import functools
+import os
+import pathlib
+import shutil
+import sqlite3
+import threading
+
+import pandas as pd
+import numpy as np
+
+
+TEST_LIST_TABLE = 'ab_tests'
+CREATE_TABLE_FILENAME = os.path.join(os.path.dirname(__file__), 'res', 'create_test_list_table.sql')
+LATEST_RESULTS_TABLE = 'ab_latest_results'
+CREATE_LATEST_RESULTS_FILENAME = os.path.join(os.path.dirname(__file__), 'res',
+                                              'create_latest_results_table.sql')
+LATEST_RESULTS_COLUMNS = ['test_name', 'metric_name', 'test_cell', 'dt', 'metric_value',
+                          'p_value', 'lower_ci', 'upper_ci']
+# How much of the file pooled readers memory-map, so their reads skip a copy into the page cache
+READ_MMAP_SIZE = 256 * 2 ** 20
+# Prepared statements each pooled reader keeps, a dashboard runs a few dozen distinct queries
+STATEMENT_CACHE_SIZE = 256
+
+
+@contextmanager
+def sqlite_connection(filename):
+    conn = sqlite3.connect(filename)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+class ReadConnectionPool(object):
+
+    def __init__(self, filename, mmap_size=READ_MMAP_SIZE):
+        """Read-only SQLite connections, one per thread, kept open between queries.
+
+        A new connection parses the schema and starts with a cold page cache, so
+        a server answering many small reads from several threads keeps one
+        connection per thread instead. The connections are opened read-only with
+        query_only set, memory-map up to mmap_size bytes of the file and keep
+        their prepared statements between queries.
+
+        Only the filename and mmap_size are pickled, and a forked process opens
+        its own connections, so the pool can be handed to worker processes.
+
+        Args:
+            filename (str): The SQLite file
+            mmap_size (int): The number of bytes of the file to memory-map
+        """
+        self.filename = filename
+        self.mmap_size = mmap_size
+        self._init_connections()
+
+    def _init_connections(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (pid, connection) of every thread, to close them all
+        self._connections = []
+
+    def __getstate__(self):
+        return {'filename': self.filename, 'mmap_size': self.mmap_size}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_connections()
+
+    def _open(self):
+        uri = pathlib.Path(os.path.abspath(self.filename)).as_uri() + '?mode=ro'
+        # closed by close(), which may run on another thread
+        conn = sqlite3.connect(uri, uri=True, cached_statements=STATEMENT_CACHE_SIZE,
+                               check_same_thread=False)
+        conn.execute('pragma query_only = 1')
+        conn.execute('pragma mmap_size = {}'.format(int(self.mmap_size)))
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Yields this thread's connection, opening it on first use.
+
+        If the caller raises, any transaction left open is rolled back, and a
+        connection that can't be rolled back is closed and replaced next time.
+        """
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            conn = self._open()
+            self._local.conn = conn
+            self._local.pid = pid
+            with self._lock:
+                self._connections.append((pid, conn))
+        conn = self._local.conn
+        try:
+            yield conn
+        except BaseException:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                self._discard(conn)
+            raise
+
+    def _discard(self, conn):
+        self._local.pid = None
+        with self._lock:
+            self._connections = [(pid, c) for pid, c in self._connections if c is not conn]
+        conn.close()
+
+    def close(self):
+        """Closes the connections this process opened"""
+        pid = os.getpid()
+        with self._lock:
+            mine = [conn for conn_pid, conn in self._connections if conn_pid == pid]
+            self._connections = [(conn_pid, conn) for conn_pid, conn in self._connections if conn_pid != pid]
+        for conn in mine:
+            conn.close()
+        # a new local, so every thread opens a new connection on its next query
+        self._local = threading.local()
+
+
+def open_backend(spec, read_only=False):
+    """Creates a storage backend from a "kind:path" string.
+
+    The kind is one of sqlite, duckdb or parquet, e.g. "duckdb:ab_testing_data.duckdb"
+    or "parquet:ab_testing_data/". A plain path is treated as a SQLite file.
+
+    Args:
+        spec (str): The backend kind and path
+        read_only (bool): Read a SQLite file through a pool of read-only connections,
+                          see SQLiteBackend. The other backends ignore it
+    Returns:
+        StorageBackend: The backend
+    """
+    kind, sep, path = spec.partition(':')
+    if not sep or kind not in BACKENDS:
+        return SQLiteBackend(spec, read_only)
+    if kind == 'sqlite':
+        return SQLiteBackend(path, read_only)
+    return BACKENDS[kind](path)
+
+
+class StorageBackend(object):
+    """Stores the test list and the per-test tables.
+
+    Subclasses implement reading and writing whole tables. The test list and the
+    aggregations have pandas implementations here; backends with a query engine
+    override the aggregations to run them inside the engine.
+    """
+
+    def read_table(self, table_name, parse_dates=None):
+        """Reads a whole table into a DataFrame"""
+        raise NotImplementedError
+
+    def write_table(self, df, table_name):
+        """Creates or replaces table_name with the data in df"""
+        raise NotImplementedError
+
+    def table_exists(self, table_name):
+        raise NotImplementedError
+
+    def drop_table(self, table_name):
+        raise NotImplementedError
+
+    def read_test_list(self):
+        """Returns the test list, one row per test"""
+        if not self.table_exists(TEST_LIST_TABLE):
+            return pd.DataFrame(columns=['test_name', 'active_fg', 'description', 'config_file',
+                                         'load_version'])
+        df = self.read_table(TEST_LIST_TABLE)
+        if 'load_version' not in df.columns:
+            # written before load versions existed
+            df['load_version'] = 0
+        return df
+
+    def verify_test_in_list(self, test_name, config_file, description):
+        """Adds the test to the test list, or makes sure it's active if it's already there"""
+        df = self.read_test_list()
+        previous = df.loc[df['test_name'] == test_name, 'load_version']
+        df = df[df['test_name'] != test_name]
+        row = pd.DataFrame({'test_name': [test_name], 'active_fg': ['Y'],
+                            'description': [description], 'config_file': [config_file],
+                            'load_version': [int(previous.iloc[0]) if len(previous) else 0]})
+        self.write_table(pd.concat([df, row], ignore_index=True), TEST_LIST_TABLE)
+
+    def deactivate_test(self, test_name):
+        """Sets the test to inactive if it exists in the test list"""
+        df = self.read_test_list()
+        df.loc[df['test_name'] == test_name, 'active_fg'] = 'N'
+        self.write_table(df, TEST_LIST_TABLE)
+
+    def bump_load_version(self, test_name):
+        """Increments the test's load version, marking its tables as changed"""
+        df = self.read_test_list()
+        df.loc[df['test_name'] == test_name, 'load_version'] += 1
+        self.write_table(df, TEST_LIST_TABLE)
+
+    def replace_latest_results(self, test_name, df):
+        """Replaces the test's rows in the latest results table.
+
+        Args:
+            test_name (str): The name of the test
+            df (DataFrame): The test's latest results, with LATEST_RESULTS_COLUMNS
+        """
+        latest = self.read_table(LATEST_RESULTS_TABLE) if self.table_exists(LATEST_RESULTS_TABLE) \
+            else pd.DataFrame(columns=LATEST_RESULTS_COLUMNS)
+        latest = latest[latest['test_name'] != test_name]
+        self.write_table(pd.concat([latest, df[LATEST_RESULTS_COLUMNS]], ignore_index=True),
+                         LATEST_RESULTS_TABLE)
+
+    def read_latest_results(self):
+        """Returns the latest results of every active test, one row per test, metric and cell"""
+        if not self.table_exists(LATEST_RESULTS_TABLE):
+            return pd.DataFrame(columns=LATEST_RESULTS_COLUMNS)
+        tests = self.read_test_list()
+        latest = self.read_table(LATEST_RESULTS_TABLE)
+        latest = latest[latest['test_name'].isin(tests.loc[tests['active_fg'] == 'Y', 'test_name'])]
+        return latest.sort_values(['test_name', 'metric_name', 'test_cell']).reset_index(drop=True)
+
+    def aggregate_suffstats(self, events, columns, products, keys=()):
+        """Sums the event-level data into per-day sufficient statistics.
+
+        Args:
+            events (DataFrame): The event-level data, with DT, TEST_CELL and COUNT columns
+            columns (list): The columns to get the sum (SUM_<col>) and sum of squares
+                            (SUMSQ_<col>) of
+            products (list): (numerator, denominator) pairs to get the sum of the
+                             cross-product (SUMXY_<numerator>_<denominator>) of
+            keys (list): Columns to group by after DT and TEST_CELL, e.g. a segment
+        Returns:
+            DataFrame: One row per DT*TEST_CELL (*keys), with DT truncated to the day
+        """
+        data = {'DT': events['DT'].dt.floor('D'),
+                'TEST_CELL': events['TEST_CELL']}
+        for key in keys:
+            data[key] = events[key]
+        data['COUNT'] = 1
+        for col in columns:
+            data['SUM_' + col] = events[col].astype(float)
+            data['SUMSQ_' + col] = events[col].astype(float) ** 2
+        for numerator, denominator in products:
+            data['SUMXY_{}_{}'.format(numerator, denominator)] = \
+                data['SUM_' + numerator] * data['SUM_' + denominator]
+
+        return pd.DataFrame(data).groupby(['DT', 'TEST_CELL'] + list(keys)).sum().reset_index()
+
+    def cumulate_suffstats(self, suffstats):
+        """Turns per-day sufficient statistics into cumulative ones per test cell.
+
+        Every cell gets a row for every day, even days on which it had no events.
+
+        Args:
+            suffstats (DataFrame): The output of aggregate_suffstats
+        Returns:
+            DataFrame: The same columns, summed from the first day up to DT
+        """
+        days = np.sort(suffstats['DT'].unique())
+        cells = np.sort(suffstats['TEST_CELL'].unique())
+        index = pd.MultiIndex.from_product([days, cells], names=['DT', 'TEST_CELL'])
+        cumulative = (suffstats.set_index(['DT', 'TEST_CELL'])
+                      .reindex(index, fill_value=0)
+                      .groupby(level='TEST_CELL').cumsum())
+        return cumulative.reset_index()
+
+
+class _SQLBackend(StorageBackend):
+    """Shared implementation for backends that speak SQL through a DB-API connection"""
+
+    def _connect(self):
+        raise NotImplementedError
+
+    def _execute(self, query, params=()):
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            result = cur.fetchall() if cur.description else None
+            conn.commit()
+        return result
+
+    def drop_table(self, table_name):
+        self._execute('drop table if exists {}'.format(table_name))
+
+    def _create_test_list_table(self):
+        with open(CREATE_TABLE_FILENAME, 'r') as f:
+            self._execute(f.read())
+
+        # test lists created before load versions existed don't have the column
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute('select * from {} limit 0'.format(TEST_LIST_TABLE))
+            columns = [d[0] for d in cur.description]
+        if 'load_version' not in columns:
+            self._execute('alter table {} add column load_version integer not null default 0'
+                          .format(TEST_LIST_TABLE))
+
+    def read_test_list(self):
+        self._create_test_list_table()
+        return self.read_table(TEST_LIST_TABLE)
+
+    def verify_test_in_list(self, test_name, config_file, description):
+        self._create_test_list_table()
+        check_query = 'select count(*) from {} where test_name = ?'.format(TEST_LIST_TABLE)
+
+        if self._execute(check_query, (test_name,))[0][0] == 0:
+            # test does not exist yet
+            insert_query = """
+            insert into {} (test_name, active_fg, config_file, description)
+            values (?, 'Y', ?, ?)
+            """.format(TEST_LIST_TABLE)
+            self._execute(insert_query, (test_name, config_file, description))
+        else:
+            # test exists, just make sure it's active
+            update_query = """
+            update {} set active_fg = 'Y', config_file = ?, description = ?
+            where test_name = ?
+            """.format(TEST_LIST_TABLE)
+            self._execute(update_query, (config_file, description, test_name))
+
+    def deactivate_test(self, test_name):
+        self._create_test_list_table()
+        query = "update {} set active_fg = 'N' where test_name = ?".format(TEST_LIST_TABLE)
+        self._execute(query, (test_name,))
+
+    def bump_load_version(self, test_name):
+        self._create_test_list_table()
+        query = 'update {} set load_version = load_version + 1 where test_name = ?'.format(TEST_LIST_TABLE)
+        self._execute(query, (test_name,))
+
+    def _create_latest_results_table(self):
+        with open(CREATE_LATEST_RESULTS_FILENAME, 'r') as f:
+            self._execute(f.read())
+
+    def replace_latest_results(self, test_name, df):
+        self._create_latest_results_table()
+        rows = [tuple(None if pd.isna(v) else v for v in row)
+                for row in df[LATEST_RESULTS_COLUMNS].itertuples(index=False)]
+        insert_query = 'insert into {} ({}) values ({})'.format(
+            LATEST_RESULTS_TABLE, ', '.join(LATEST_RESULTS_COLUMNS), ', '.join('?' * len(LATEST_RESULTS_COLUMNS)))
+        # one transaction, so readers never see the test without its rows
+        with self._connect() as conn:
+            cur = conn.cursor()
+            cur.execute('delete from {} where test_name = ?'.format(LATEST_RESULTS_TABLE), (test_name,))
+            cur.executemany(insert_query, rows)
+            conn.commit()
+
+    def read_latest_results(self):
+        self._create_test_list_table()
+        self._create_latest_results_table()
+        # the primary key makes this an index scan, however many tests there are
+        query = """
+        select {} from {} l
+        join {} t on t.test_name = l.test_name
+        where t.active_fg = 'Y'
+        order by l.test_name, l.metric_name, l.test_cell
+        """.format(', '.join('l.' + c for c in LATEST_RESULTS_COLUMNS), LATEST_RESULTS_TABLE, TEST_LIST_TABLE)
+        return pd.DataFrame(self._execute(query), columns=LATEST_RESULTS_COLUMNS)
+
+
+class SQLiteBackend(_SQLBackend):
+    """Stores everything in a single SQLite file.
+
+    SQLite has no columnar engine, so the aggregations stay in pandas.
+
+    With read_only, every query goes through a ReadConnectionPool, for servers
+    that only read. The test list and latest results tables are then never
+    created, a missing one reads as empty, and writes raise sqlite3.OperationalError.
+    """
+
+    def __init__(self, db_path, read_only=False):
+        self.db_path = db_path
+        self.read_only = read_only
+        self._read_pool = ReadConnectionPool(db_path) if read_only else None
+
+    @contextmanager
+    def _connect(self):
+        if self._read_pool is not None:
+            with self._read_pool.connection() as conn:
+                yield conn
+            return
+        with sqlite_connection(self.db_path) as conn:
+            yield conn
+
+    def _create_test_list_table(self):
+        if not self.read_only:
+            super()._create_test_list_table()
+
+    def _create_latest_results_table(self):
+        if not self.read_only:
+            super()._create_latest_results_table()
+
+    def read_test_list(self):
+        if self.read_only:
+            # without creating the table, and with the load version of old test lists filled in
+            return StorageBackend.read_test_list(self)
+        return super().read_test_list()
+
+    def read_latest_results(self):
+        if self.read_only and not (self.table_exists(TEST_LIST_TABLE)
+                                   and self.table_exists(LATEST_RESULTS_TABLE)):
+            return pd.DataFrame(columns=LATEST_RESULTS_COLUMNS)
+        return super().read_latest_results()
+
+    def read_table(self, table_name, parse_dates=None):
+        query = "select * from {}".format(table_name)
+        with self._connect() as conn:
+            return pd.read_sql(query, conn, parse_dates=parse_dates)
+
+    def write_table(self, df, table_name):
+        with self._connect() as conn:
+            df.to_sql(table_name, conn, if_exists='replace', index=False,
+                      chunksize=5000)
+
+    def table_exists(self, table_name):
+        if self.read_only and not os.path.exists(self.db_path):
+            # nothing imported yet, and a read-only connection can't create the file
+            return False
+        query = "select count(*) from sqlite_master where type = 'table' and name = ?"
+        return self._execute(query, (table_name,))[0][0] > 0
+
+
+class DuckDBBackend(_SQLBackend):
+    """Stores everything in an embedded DuckDB file.
+
+    The sufficient statistics are aggregated and cumulated by DuckDB's columnar
+    engine, which scans the event DataFrame in place. Needs the duckdb package.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+
+    @contextmanager
+    def _connect(self):
+        try:
+            import duckdb
+        except ImportError:
+            raise ImportError('The duckdb storage backend needs the duckdb package: pip install duckdb')
+        conn = duckdb.connect(self.db_path)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def read_table(self, table_name, parse_dates=None):
+        with self._connect() as conn:
+            df = conn.execute('select * from {}'.format(table_name)).df()
+        for col in parse_dates or []:
+            df[col] = pd.to_datetime(df[col])
+        return df
+
+    def write_table(self, df, table_name):
+        with self._connect() as conn:
+            conn.register('input_df', df)
+            conn.execute('create or replace table {} as select * from input_df'.format(table_name))
+
+    def table_exists(self, table_name):
+        query = 'select count(*) from information_schema.tables where table_name = ?'
+        return self._execute(query, (table_name,))[0][0] > 0
+
+    def aggregate_suffstats(self, events, columns, products, keys=()):
+        select = ['date_trunc(\'day\', "DT") as "DT"', '"TEST_CELL"']
+        select.extend('"{}"'.format(key) for key in keys)
+        select.append('count(*) as "COUNT"')
+        for col in columns:
+            select.append('sum(cast("{0}" as double)) as "SUM_{0}"'.format(col))
+            select.append('sum(cast("{0}" as double) * "{0}") as "SUMSQ_{0}"'.format(col))
+        for numerator, denominator in products:
+            select.append('sum(cast("{0}" as double) * "{1}") as "SUMXY_{0}_{1}"'.format(numerator, denominator))
+        group_by = ', '.join(str(i + 1) for i in range(2 + len(keys)))
+        query = 'select {0} from events group by {1} order by {1}'.format(', '.join(select), group_by)
+
+        with self._connect() as conn:
+            conn.register('events', events)
+            return conn.execute(query).df()
+
+    def cumulate_suffstats(self, suffstats):
+        stat_columns = [c for c in suffstats.columns if c not in ['DT', 'TEST_CELL']]
+        select = ['sum(coalesce(d."{0}", 0)) over (partition by g."TEST_CELL" order by g."DT") as "{0}"'.format(c)
+                  for c in stat_columns]
+        query = """
+        with grid as (select * from (select distinct "DT" from daily)
+                                    cross join (select distinct "TEST_CELL" from daily))
+        select g."DT", g."TEST_CELL", {}
+        from grid g left join daily d on g."DT" = d."DT" and g."TEST_CELL" = d."TEST_CELL"
+        order by g."DT", g."TEST_CELL"
+        """.format(', '.join(select))
+
+        with self._connect() as conn:
+            conn.register('daily', suffstats)
+            df = conn.execute(query).df()
+        df['COUNT'] = df['COUNT'].astype(np.int64)
+        return df
+
+
+class ParquetBackend(StorageBackend):
+    """Stores every table as a directory of Parquet files under root.
+
+    Tables are replaced by writing a new directory and swapping it in. The
+    sufficient statistics are aggregated with Arrow's columnar group-by. Needs
+    the pyarrow package.
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+    def _table_path(self, table_name):
+        return os.path.join(self.root, table_name)
+
+    def read_table(self, table_name, parse_dates=None):
+        df = pd.read_parquet(self._table_path(table_name))
+        for col in parse_dates or []:
+            df[col] = pd.to_datetime(df[col])
+        return df
+
+    def write_table(self, df, table_name):
+        path = self._table_path(table_name)
+        tmp_path = path + '.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        df.to_parquet(os.path.join(tmp_path, 'part-0.parquet'), index=False)
+        self.drop_table(table_name)
+        os.rename(tmp_path, path)
+
+    def table_exists(self, table_name):
+        return os.path.isdir(self._table_path(table_name))
+
+    def drop_table(self, table_name):
+        shutil.rmtree(self._table_path(table_name), ignore_errors=True)
+
+    def aggregate_suffstats(self, events, columns, products, keys=()):
+        try:
+            import pyarrow as pa
+            import pyarrow.compute as pc
+        except ImportError:
+            raise ImportError('The parquet storage backend needs the pyarrow package: pip install pyarrow')
+
+        group_by = ['DT', 'TEST_CELL'] + list(keys)
+        arrays = {'DT': pa.array(events['DT'].dt.floor('D')),
+                  'TEST_CELL': pa.array(events['TEST_CELL'])}
+        for key in keys:
+            arrays[key] = pa.array(events[key])
+        arrays['COUNT'] = pa.array(events['COUNT'])
+        values = {col: pa.array(events[col], type=pa.float64()) for col in columns}
+        for col in columns:
+            arrays['SUM_' + col] = values[col]
+            arrays['SUMSQ_' + col] = pc.multiply(values[col], values[col])
+        for numerator, denominator in products:
+            arrays['SUMXY_{}_{}'.format(numerator, denominator)] = \
+                pc.multiply(values[numerator], values[denominator])
+
+        table = pa.table(arrays)
+        stat_columns = [c for c in arrays if c not in group_by]
+        result = table.group_by(group_by).aggregate([(c, 'sum') for c in stat_columns])
+        df = result.to_pandas().rename(columns={c + '_sum': c for c in stat_columns})
+        return df[group_by + stat_columns].sort_values(group_by).reset_index(drop=True)
+
+
+BACKENDS = {'sqlite': SQLiteBackend,
+            'duckdb': DuckDBBackend,
+            'parquet': ParquetBackend}
+
+
+class LockedBackend(object):
+    """Makes every call to another backend while holding a lock.
+
+    Imports running in several processes must take turns with a shared store.
+    The base class updates the test list and the latest results by rewriting
+    the whole table, ParquetBackend writes through a fixed temporary directory
+    per table, and DuckDB lets one process at a time open its file. With the
+    same lock around every call, only the store calls are serialized, and the
+    stats computed between them still run concurrently.
+    """
+
+    def __init__(self, backend, lock):
+        """Wraps backend so that its calls hold lock.
+
+        Args:
+            backend (StorageBackend): The backend to call
+            lock: A lock shared by every process that writes to the store, e.g. a
+                  multiprocessing.Lock handed to the worker processes
+        """
+        self.backend = backend
+        self.lock = lock
+
+    def __repr__(self):
+        return 'LockedBackend({!r})'.format(self.backend)
+
+    def __getattr__(self, name):
+        if name in ['backend', 'lock']:
+            # not set yet, e.g. while unpickling
+            raise AttributeError(name)
+        attr = getattr(self.backend, name)
+        if name.startswith('_') or not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def locked(*args, **kwargs):
+            with self.lock:
+                return attr(*args, **kwargs)
+        return locked
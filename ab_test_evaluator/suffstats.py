@@ -0,0 +1,186 @@
+import numpy as np
+import pandas as pd
+
+from .stats import ProportionTestEval, RatioTestEval
+
+
+STAT_COLUMNS = ['TEST_CELL', 'METRIC_NAME', 'METRIC_VALUE', 'P_VALUE', 'LOWER_CI', 'UPPER_CI']
+SEGMENT_KEYS = ['SEGMENT_NAME', 'SEGMENT_VALUE']
+
+
+def suffstat_columns(numerator, denominator):
+    """Maps the RatioTestEval statistics to their columns in the sufficient statistics"""
+    return {'n': 'COUNT',
+            'sum_x': 'SUM_' + numerator,
+            'sum_y': 'SUM_' + denominator,
+            'sum_xx': 'SUMSQ_' + numerator,
+            'sum_yy': 'SUMSQ_' + denominator,
+            'sum_xy': 'SUMXY_{}_{}'.format(numerator, denominator)}
+
+
+def evaluate_metric(m_dict, control, test):
+    """Closed-form stats for one metric from summed sufficient statistics.
+
+    Ratio metrics use the delta method and binary metrics a two-proportion z-test.
+    Continuous metrics are the ratio of the column to COUNT, for which the delta
+    method reduces to a normal-approximation test on the difference of means.
+
+    Args:
+        m_dict (dict): The metric definition, as in ABTest.metric_definitions
+        control (DataFrame): Sufficient statistics of the control cell. Each row is
+                             evaluated separately, e.g. one row per day
+        test (DataFrame): Sufficient statistics of the test cell, aligned with control
+    Returns:
+        dict: Arrays for CONTROL_VALUE, TEST_VALUE, P_VALUE, LOWER_CI and UPPER_CI
+    """
+    numerator = m_dict['numerator_column']
+    denominator = m_dict['denominator_column']
+
+    if m_dict['type'] == 'binary':
+        group_stats = [{'successes': s['SUM_' + numerator], 'trials': s['SUM_' + denominator]}
+                       for s in (control, test)]
+        b = ProportionTestEval(*group_stats)
+        p_val = b.proportion_pval()
+        lower, upper = b.proportion_ci()
+    else:
+        columns = suffstat_columns(numerator, denominator)
+        group_stats = []
+        for s in (control, test):
+            group = {k: s[v].values for k, v in columns.items() if k != 'sum_xy'}
+            if m_dict['type'] == 'ratio':
+                group['sum_xy'] = s[columns['sum_xy']].values
+            else:
+                # averages divide by COUNT, so the cross-product is just the sum
+                group['sum_xy'] = group['sum_x']
+            group_stats.append(group)
+        b = RatioTestEval(*group_stats)
+        p_val = b.ratio_pval()
+        lower, upper = b.ratio_ci()
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        values = [np.asarray(s['SUM_' + numerator], dtype=float) / np.asarray(s['SUM_' + denominator])
+                  for s in (control, test)]
+
+    return {'CONTROL_VALUE': values[0], 'TEST_VALUE': values[1],
+            'P_VALUE': p_val, 'LOWER_CI': lower, 'UPPER_CI': upper}
+
+
+def evaluate_cells(m_dict, cell_stats):
+    """Closed-form stats of every test cell against the control, in one batched call.
+
+    The control's rows are repeated once per test cell, so evaluate_metric runs
+    once on the stacked rows of all the comparisons.
+
+    Args:
+        m_dict (dict): The metric definition, as in ABTest.metric_definitions
+        cell_stats (list): Sufficient statistics of every cell, control first,
+                           aligned row for row, e.g. one row per day
+    Returns:
+        dict: (cells, rows) arrays for METRIC_VALUE, P_VALUE, LOWER_CI and UPPER_CI,
+              in the order of cell_stats. The control's P_VALUE and CIs are NaN
+    """
+    control = cell_stats[0]
+    n_rows = len(control)
+    n_tests = len(cell_stats) - 1
+    r = evaluate_metric(m_dict, pd.concat([control] * n_tests, ignore_index=True),
+                        pd.concat(cell_stats[1:], ignore_index=True))
+
+    def by_cell(values):
+        return np.asarray(values, dtype=float).reshape(n_tests, n_rows)
+
+    result = {'METRIC_VALUE': np.vstack([by_cell(r['CONTROL_VALUE'])[:1], by_cell(r['TEST_VALUE'])])}
+    for col in ['P_VALUE', 'LOWER_CI', 'UPPER_CI']:
+        result[col] = np.vstack([np.full((1, n_rows), np.nan), by_cell(r[col])])
+    return result
+
+
+def window_stats(suffstats, metric_definitions, test_cells, start_date=None, end_date=None):
+    """Computes the stats for a date window from the per-day sufficient statistics.
+
+    Args:
+        suffstats (DataFrame): The per-day sufficient statistics of a test
+        metric_definitions (dict): The metric definitions, as in ABTest.metric_definitions
+        test_cells (list): The cell names, control first
+        start_date (datetime): The first day of the window, or None for the first day
+        end_date (datetime): The last day of the window, or None for the last day
+    Returns:
+        DataFrame: One row per test cell per metric, with the same columns as the
+                   rolling stats except DT
+    """
+    in_window = pd.Series(True, index=suffstats.index)
+    if start_date is not None:
+        in_window &= suffstats['DT'] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        in_window &= suffstats['DT'] <= pd.Timestamp(end_date)
+
+    summed = suffstats[in_window].drop(columns='DT').groupby('TEST_CELL').sum()
+    summed = summed.reindex(list(test_cells), fill_value=0)
+    cell_stats = [summed.loc[[cell]] for cell in test_cells]
+
+    rows = []
+    for metric, m_dict in metric_definitions.items():
+        result = evaluate_cells(m_dict, cell_stats)
+        for i, cell in enumerate(test_cells):
+            rows.append([cell, metric] + [result[col][i, 0] for col in STAT_COLUMNS[2:]])
+
+    return pd.DataFrame(rows, columns=STAT_COLUMNS)
+
+
+def cumulate_segment_suffstats(suffstats):
+    """Turns per-day sufficient statistics by segment into cumulative ones.
+
+    Like StorageBackend.cumulate_suffstats, every segment and cell gets a row for
+    every day, even days on which it had no events.
+
+    Args:
+        suffstats (DataFrame): Per-day sufficient statistics with SEGMENT_NAME and
+                               SEGMENT_VALUE columns
+    Returns:
+        DataFrame: The same columns, summed from the first day up to DT
+    """
+    stat_columns = [c for c in suffstats.columns if c not in ['DT', 'TEST_CELL'] + SEGMENT_KEYS]
+    grid = (suffstats[SEGMENT_KEYS].drop_duplicates()
+            .merge(pd.DataFrame({'DT': np.sort(suffstats['DT'].unique())}), how='cross')
+            .merge(pd.DataFrame({'TEST_CELL': np.sort(suffstats['TEST_CELL'].unique())}), how='cross'))
+    cumulative = grid.merge(suffstats, how='left', on=SEGMENT_KEYS + ['DT', 'TEST_CELL'])
+    cumulative[stat_columns] = cumulative[stat_columns].fillna(0)
+    cumulative = cumulative.sort_values(SEGMENT_KEYS + ['TEST_CELL', 'DT']).reset_index(drop=True)
+    cumulative[stat_columns] = cumulative.groupby(SEGMENT_KEYS + ['TEST_CELL'])[stat_columns].cumsum()
+    cumulative['COUNT'] = cumulative['COUNT'].astype(np.int64)
+    return cumulative
+
+
+def segment_stats(suffstats, metric_definitions, test_cells):
+    """Computes the rolling stats of every segment from its per-day sufficient statistics.
+
+    All segments, days and test cells of a metric are evaluated in one vectorized
+    call of evaluate_cells, so the cost grows with the number of segment days, not
+    with the number of events.
+
+    Args:
+        suffstats (DataFrame): Per-day sufficient statistics with SEGMENT_NAME and
+                               SEGMENT_VALUE columns
+        metric_definitions (dict): The metric definitions, as in ABTest.metric_definitions
+        test_cells (list): The cell names, control first
+    Returns:
+        DataFrame: One row per day, segment, test cell and metric, with the same
+                   columns as the rolling stats plus SEGMENT_NAME and SEGMENT_VALUE
+    """
+    cumulative = cumulate_segment_suffstats(suffstats)
+    order = SEGMENT_KEYS + ['DT']
+    cell_stats = [cumulative[cumulative['TEST_CELL'] == cell].sort_values(order).reset_index(drop=True)
+                  for cell in test_cells]
+    keys = cell_stats[0][['DT'] + SEGMENT_KEYS]
+
+    frames = []
+    for metric, m_dict in metric_definitions.items():
+        result = evaluate_cells(m_dict, cell_stats)
+        for i, cell in enumerate(test_cells):
+            frame = keys.copy()
+            frame['TEST_CELL'] = cell
+            frame['METRIC_NAME'] = metric
+            for col in STAT_COLUMNS[2:]:
+                frame[col] = result[col][i]
+            frames.append(frame)
+
+    return pd.concat(frames, ignore_index=True)[['DT'] + SEGMENT_KEYS + STAT_COLUMNS]
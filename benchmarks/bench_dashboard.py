@@ -0,0 +1,93 @@
+"""Load-tests the dashboard's reads with concurrent simulated users.
+
+Run from the repo root: python -m benchmarks.bench_dashboard [--storage PATH] [--users N]
+
+Every user is a thread, like a request thread of a multi-threaded WSGI server,
+and runs page loads back to back: the reads the dashboard's callbacks make when
+a test is picked, from the test list to the quantile chart. The latency of every
+callback is recorded, and the p50, p99 and throughput are reported once with a
+new connection per query and once with the pooled read-only connections the
+dashboard uses. Import a test first, e.g. python run_import.py.
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from ab_test_evaluator.dash_data_helper import DashDataHelper
+from ab_test_evaluator.storage import SQLiteBackend
+
+
+def _setup_args():
+    parser = argparse.ArgumentParser(description='Load-test the dashboard reads')
+    parser.add_argument('--storage', type=str, default='ab_testing_data.db',
+                        help='the SQLite file to read (default: ab_testing_data.db)')
+    parser.add_argument('--test', type=str, default=None,
+                        help='the test to load (default: the first active test)')
+    parser.add_argument('--users', type=int, default=8,
+                        help='the number of concurrent users (default: 8)')
+    parser.add_argument('--pages', type=int, default=20,
+                        help='page loads per user (default: 20)')
+    return parser.parse_args()
+
+
+def _callbacks(helper, test_name):
+    """The dashboard's reads for one page load, as (callback name, function) pairs"""
+    metric = next(iter(helper.get_metric_definitions(test_name)))
+    return [('test_list', helper.get_active_test_list),
+            ('metric_dropdown', lambda: helper.get_daily_rollup(test_name).columns),
+            ('segment_dropdown', lambda: helper.get_segments(test_name)),
+            ('window_range', lambda: helper.get_suffstats(test_name)),
+            ('window_stats', lambda: helper.get_window_stats(test_name)),
+            ('daily_metric', lambda: helper.get_daily_rollup(test_name)[metric]),
+            ('p_val_chart', lambda: helper.get_rolling_stats(test_name)),
+            ('ci_chart', lambda: helper.get_rolling_stats(test_name)),
+            ('quantile_chart', lambda: helper.get_quantiles(test_name)),
+            ('overview_table', helper.get_latest_results)]
+
+
+def _run_user(callbacks, pages, latencies):
+    for _ in range(pages):
+        for name, callback in callbacks:
+            start = time.perf_counter()
+            callback()
+            latencies.append((name, time.perf_counter() - start))
+
+
+def load_test(backend, test_name, users, pages):
+    """Runs users concurrent users and returns their callback latencies and the elapsed time"""
+    callbacks = _callbacks(DashDataHelper(backend=backend), test_name)
+    latencies = []
+    threads = [threading.Thread(target=_run_user, args=(callbacks, pages, latencies))
+               for _ in range(users)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    args = _setup_args()
+    test_name = args.test or DashDataHelper(backend=SQLiteBackend(args.storage))\
+        .get_active_test_list()['test_name'].iloc[0]
+
+    print('{}, {} users, {} page loads each'.format(test_name, args.users, args.pages))
+    print('{:<24} {:>10} {:>10} {:>10} {:>14}'.format('connections', 'p50 (ms)', 'p99 (ms)',
+                                                      'max (ms)', 'callbacks/s'))
+    for label, read_only in [('per query', False), ('pooled, read-only', True)]:
+        backend = SQLiteBackend(args.storage, read_only=read_only)
+        # warm up the OS page cache, so neither run pays for the first read of the file
+        load_test(backend, test_name, 1, 1)
+        latencies, elapsed = load_test(backend, test_name, args.users, args.pages)
+        ms = np.array([latency for _, latency in latencies]) * 1000
+        print('{:<24} {:>10.2f} {:>10.2f} {:>10.2f} {:>14.0f}'.format(
+            label, np.percentile(ms, 50), np.percentile(ms, 99), ms.max(), len(ms) / elapsed))
+
+        by_callback = {}
+        for name, latency in latencies:
+            by_callback.setdefault(name, []).append(latency * 1000)
+        print('  p99 by callback: ' + ', '.join('{} {:.1f}'.format(name, np.percentile(values, 99))
+                                                for name, values in by_callback.items()))
@@ -0,0 +1,66 @@
+"""Checks every accelerated stats path against the reference implementation, and times both.
+
+Run from the repo root: python -m benchmarks.bench_equivalence [--rows N] [--days D] [--cells K]
+
+Generates events with a fixed seed and runs the checks of tests/equivalence.py
+on them: the original per-day computation and ttest_ind bootstrap against the
+moment kernels, the batched closed-form stats, the Poisson bootstrap, worker
+processes, the result cache, the Numba kernels and the storage engines that are
+installed. Prints every check's worst |difference| / tolerance and the time of
+both sides, so one run validates the correctness and the speedup of every mode.
+The exit status is 1 if a check fails.
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+from tests.equivalence import EquivalenceHarness
+from tests.generate_fake_data import generate_events
+
+
+def _setup_args():
+    parser = argparse.ArgumentParser(description='Check the accelerated stats paths against the reference')
+    parser.add_argument('--rows', type=int, default=20000,
+                        help='the number of events (default: 20000)')
+    parser.add_argument('--days', type=int, default=14,
+                        help='the number of days (default: 14)')
+    parser.add_argument('--cells', type=int, default=3,
+                        help='the number of test cells, control included (default: 3)')
+    parser.add_argument('--iterations', type=int, default=500,
+                        help='the bootstrap iterations (default: 500)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the seed of the events and the bootstraps (default: 0)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='the worker processes of the parallel check (default: number of CPUs, at most 4)')
+    parser.add_argument('--hosts', type=str, nargs='+', default=None,
+                        help='run_worker.py workers to check the distributed rolling stats on, as in '
+                             'run_import.py --hosts (default: no distributed check)')
+    return parser.parse_args()
+
+
+def print_results(results):
+    print('{:<40} {:>10} {:>12} {:>8} {:>10}  {}'.format('check', 'reference', 'accelerated',
+                                                        'speedup', 'error/tol', 'result'))
+    for r in results:
+        print('{:<40} {:>9.3f}s {:>11.3f}s {:>7.1f}x {:>10.3f}  {}'.format(
+            r.check, r.reference_seconds, r.candidate_seconds,
+            r.reference_seconds / r.candidate_seconds if r.candidate_seconds else np.inf,
+            r.worst_error, 'ok' if r.passed else 'FAILED'))
+
+
+if __name__ == '__main__':
+    args = _setup_args()
+    out_dir = tempfile.mkdtemp()
+    try:
+        events = generate_events(args.rows, args.days, args.cells, args.seed)
+        print('{} events over {} days in {} test cells, {} bootstrap iterations'.format(
+            args.rows, args.days, args.cells, args.iterations))
+        harness = EquivalenceHarness(events, out_dir, args.iterations, args.seed, args.processes, args.hosts)
+        results = harness.run()
+    finally:
+        shutil.rmtree(out_dir)
+    print_results(results)
+    sys.exit(0 if all(r.passed for r in results) else 1)
@@ -0,0 +1,56 @@
+"""Times the bootstrap kernels on every available backend.
+
+Run from the repo root: python -m benchmarks.bench_kernels [--rows N] [--replicates B]
+
+The first call of the numba backend includes compiling the kernels, or loading
+them from the on-disk cache on later runs, and is reported separately.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from ab_test_evaluator.kernels import available_backends, poisson_accumulate, resample_moments
+
+
+def _setup_args():
+    parser = argparse.ArgumentParser(description='Benchmark the bootstrap kernels')
+    parser.add_argument('--rows', type=int, default=100000,
+                        help='the number of events (default: 100000)')
+    parser.add_argument('--replicates', type=int, default=1000,
+                        help='the number of bootstrap replicates (default: 1000)')
+    parser.add_argument('--metrics', type=int, default=4,
+                        help='the number of metric columns for the Poisson kernel (default: 4)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='timed runs per kernel, the best is reported (default: 3)')
+    return parser.parse_args()
+
+
+def _time(fn, repeat):
+    start = time.perf_counter()
+    fn()
+    first = time.perf_counter() - start
+
+    best = first
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return first, best
+
+
+if __name__ == '__main__':
+    args = _setup_args()
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(3, 1, (args.rows, args.metrics))
+    row_ids = np.arange(args.rows)
+
+    kernels = {'resample_moments': lambda b: resample_moments(values[:, 0], args.rows, args.replicates, 0, b),
+               'poisson_accumulate': lambda b: poisson_accumulate(values, row_ids, args.replicates, 0, b)}
+
+    print('{} rows, {} replicates, {} metrics'.format(args.rows, args.replicates, args.metrics))
+    print('{:<20} {:<8} {:>12} {:>12}'.format('kernel', 'backend', 'first (s)', 'best (s)'))
+    for name, kernel in kernels.items():
+        for backend in available_backends():
+            first, best = _time(lambda: kernel(backend), args.repeat)
+            print('{:<20} {:<8} {:>12.3f} {:>12.3f}'.format(name, backend, first, best))
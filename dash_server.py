@@ -5,19 +5,35 @@ Created on Mon Jul 23 09:01:55 2018
 @author: michael.schulte
 """
 
+import os
+
 import dash
 from dash.dependencies import Input, Output
 import dash_core_components as dcc
 import dash_html_components as html
-import plotly.graph_objs as go
+import dash_table
+import pandas as pd
 
+from ab_test_evaluator import figures
+from ab_test_evaluator.api import create_api
 from ab_test_evaluator.dash_data_helper import DashDataHelper
+from ab_test_evaluator.planning import planning_grid
+from ab_test_evaluator.storage import open_backend
 
 
-helper = DashDataHelper()
+# a SQLite file, duckdb:PATH or parquet:DIRECTORY, like run_import.py --storage.
+# The dashboard only reads, so a SQLite file is read through a connection per thread
+storage = open_backend(os.environ.get('AB_TEST_STORAGE', 'ab_testing_data.db'), read_only=True)
+helper = DashDataHelper(backend=storage)
 
 app = dash.Dash(__name__)
 
+# highlight overview rows whose confidence interval of the difference excludes 0
+SIGNIFICANCE_LEVEL = .05
+
+# read-only JSON results API, e.g. /api/tests
+app.server.register_blueprint(create_api(storage))
+
 # app.config.supress_callback_exceptions = True
 
 app.layout = html.Div([
@@ -27,54 +43,125 @@ app.layout = html.Div([
                     html.H2(children = 'Cool Tool; Boring Name',
                             className='app-header'),
 
-                    html.Div([
-                            dcc.Dropdown(id = 'test_dropdown',
-                                         placeholder = 'Select a test...')
-                            ],
-                             id='test-dropdown-div',
-                             className='test-selector'),
-
-                    html.Div([
-                            dcc.Dropdown(id = 'metric_dropdown',
-                                         value = 'GROSS_REV',
-                                         placeholder = 'Select a metric...')
-                            ],
-                             id='metric-dropdown-div',
-                             className='test-selector'),
-
-                    html.Div([
-                            dcc.Textarea(id = 'start_dt',
-                                         contentEditable = False,
-                                         wrap = True,
-                                         draggable = False,
-                                         disabled = True,
-                                         style = {'background-color':'#f1f3f4', 'border-color':'#f1f3f4', 
-                                                  'text-align':'center', 'font-family':'Arial'})
-                            ]),
+                    dcc.Tabs(id = 'tabs', value = 'results', children = [
+                        dcc.Tab(label = 'Results', value = 'results', children = [
+                            html.Div([
+                                    dcc.Dropdown(id = 'test_dropdown',
+                                                 placeholder = 'Select a test...')
+                                    ],
+                                     id='test-dropdown-div',
+                                     className='test-selector'),
+
+                            html.Div([
+                                    dcc.Dropdown(id = 'metric_dropdown',
+                                                 value = 'GROSS_REV',
+                                                 placeholder = 'Select a metric...')
+                                    ],
+                                     id='metric-dropdown-div',
+                                     className='test-selector'),
+
+                            html.Div([
+                                    dcc.Dropdown(id = 'segment_dropdown',
+                                                 placeholder = 'All segments')
+                                    ],
+                                     id='segment-dropdown-div',
+                                     className='test-selector'),
+
+                            html.Div([
+                                    dcc.Textarea(id = 'start_dt',
+                                                 contentEditable = False,
+                                                 wrap = True,
+                                                 draggable = False,
+                                                 disabled = True,
+                                                 style = {'background-color':'#f1f3f4', 'border-color':'#f1f3f4', 
+                                                          'text-align':'center', 'font-family':'Arial'})
+                                    ]),
+
+                            html.Div([
+                                    dcc.DatePickerRange(id = 'window_picker'),
+                                    dcc.Markdown(id = 'window_stats')
+                                    ],
+                                     id='window-stats-div'),
+
+                            html.Div([
+                                    dcc.Graph(id = 'metrics_viz')
+                                    ],
+                                     id='metrics-viz-holder',
+                                     className='chart'),
 
-                    html.Div([
-                            dcc.Graph(id = 'metrics_viz')
-                            ],
-                             id='metrics-viz-holder',
-                             className='chart'),
-
-                    html.Div([
-                            dcc.Graph(id = 'p-value_viz')
-                            ],
-                             id='p-val-viz-holder',
-                             className='chart'),
-
-                    html.Div([
-                            dcc.Graph(id = 'ci_viz')
-                            ],
-                             id='ci-viz-holder',
-                             className='chart'),
+                            html.Div([
+                                    dcc.Graph(id = 'p-value_viz')
+                                    ],
+                                     id='p-val-viz-holder',
+                                     className='chart'),
+
+                            html.Div([
+                                    dcc.Graph(id = 'ci_viz')
+                                    ],
+                                     id='ci-viz-holder',
+                                     className='chart'),
+
+                            html.Div([
+                                    dcc.Graph(id = 'quantile_viz')
+                                    ],
+                                     id='quantile-viz-holder',
+                                     className='chart'),
                     
-                    html.Div([
-                            dcc.Markdown(id = 'test_description')
-                            ],
-                             id='description')
-                            
+                            html.Div([
+                                    dcc.Markdown(id = 'test_description')
+                                    ],
+                                     id='description')
+                            ]),
+
+                        dcc.Tab(label = 'Overview', value = 'overview', children = [
+                            html.Div([
+                                    dash_table.DataTable(
+                                        id = 'overview_table',
+                                        columns = [{'name': 'Test', 'id': 'test_name'},
+                                                   {'name': 'Metric', 'id': 'metric_name'},
+                                                   {'name': 'Test Cell', 'id': 'test_cell'},
+                                                   {'name': 'As Of', 'id': 'dt'}] +
+                                                  [{'name': name, 'id': col, 'type': 'numeric',
+                                                    'format': {'specifier': '.3f'}}
+                                                   for name, col in [('Value', 'metric_value'),
+                                                                     ('P-Value', 'p_value'),
+                                                                     ('Lower CI', 'lower_ci'),
+                                                                     ('Upper CI', 'upper_ci')]],
+                                        sort_action = 'native',
+                                        sort_mode = 'multi',
+                                        style_data_conditional = [
+                                            {'if': {'filter_query': '{lower_ci} > 0'},
+                                             'backgroundColor': '#d9f2e1'},
+                                            {'if': {'filter_query': '{upper_ci} < 0'},
+                                             'backgroundColor': '#f8dcdc'},
+                                            {'if': {'filter_query': '{{p_value}} < {}'.format(SIGNIFICANCE_LEVEL),
+                                                    'column_id': 'p_value'},
+                                             'fontWeight': 'bold'}])
+                                    ],
+                                     id='overview-div')
+                            ]),
+
+                        dcc.Tab(label = 'Planning', value = 'planning', children = [
+                            html.Div([
+                                    dcc.Dropdown(id = 'planning_test_dropdown',
+                                                 placeholder = 'Select a past test for the baselines...'),
+                                    html.Label('Days'),
+                                    dcc.Input(id = 'planning_days', type = 'text', value = '7, 14, 21, 28'),
+                                    html.Label('Traffic share'),
+                                    dcc.Input(id = 'planning_traffic', type = 'text', value = '1'),
+                                    html.Label('Test cell split'),
+                                    dcc.Input(id = 'planning_split', type = 'text', value = '0.5')
+                                    ],
+                                     id='planning-div'),
+
+                            html.Div([
+                                    dcc.Graph(id = 'planning_viz')
+                                    ],
+                                     id='planning-viz-holder',
+                                     className='chart')
+                            ])
+                        ])
+
                     ],
                       id='main')
 
@@ -84,7 +171,7 @@ app.layout = html.Div([
         [Input('metrics_viz','style')])
 def test_list(a):
     '''Get most up-to-date list of tests for test_dropdown'''
-    helper = DashDataHelper()
+    helper = DashDataHelper(backend=storage)
     test_list = helper.get_active_test_list()['test_name']
     
     return [{'label': i.replace('_',' '), 'value':i} for i in test_list]
@@ -95,119 +182,184 @@ def test_list(a):
         [Input('test_dropdown','value')])
 def test_list(test_name):
     '''Get metrics from selected test & populate in metric dropdown'''
-    helper = DashDataHelper()
+    helper = DashDataHelper(backend=storage)
     cols = helper.get_daily_rollup(test_name).columns
     
     return [{'label': i.title().replace('_',' '), 'value':i} for i in cols]
 
 
+@app.callback(
+        Output('segment_dropdown','options'),
+        [Input('test_dropdown','value')])
+def segment_list(test_name):
+    '''Get the segments of the selected test for segment_dropdown'''
+    helper = DashDataHelper(backend=storage)
+    df = helper.get_segments(test_name)
+
+    return [{'label': '{}: {}'.format(row.SEGMENT_NAME.replace('_',' '), row.SEGMENT_VALUE),
+             'value': '{}={}'.format(row.SEGMENT_NAME, row.SEGMENT_VALUE)} for row in df.itertuples()]
+
+
+def parse_segment(segment_dropdown):
+    '''Turn a segment_dropdown value into a (name, value) pair, None for all segments'''
+    if not segment_dropdown:
+        return None
+    return tuple(segment_dropdown.split('=', 1))
+
+
 @app.callback(
         Output('start_dt','value'),
         [Input('test_dropdown','value')])
 def get_start_date(test):
-    helper = DashDataHelper()
+    helper = DashDataHelper(backend=storage)
     df = helper.get_daily_rollup(test)
     
     dt = df['DT'].min().strftime('%m/%d/%Y')
     
     return 'Start Date: \n {}'.format(dt)
 
+@app.callback(
+        [Output('window_picker', 'min_date_allowed'),
+         Output('window_picker', 'max_date_allowed'),
+         Output('window_picker', 'start_date'),
+         Output('window_picker', 'end_date')],
+        [Input('test_dropdown','value')])
+def window_range(test):
+    '''Limit the date window to the days of the selected test'''
+    helper = DashDataHelper(backend=storage)
+    df = helper.get_suffstats(test)
+
+    return df['DT'].min(), df['DT'].max(), df['DT'].min(), df['DT'].max()
+
+
+@app.callback(
+        Output('window_stats', 'children'),
+        [Input('test_dropdown','value'),
+         Input('metric_dropdown','value'),
+         Input('window_picker','start_date'),
+         Input('window_picker','end_date')])
+def window_stats(test_dropdown, metric_dropdown, start_date, end_date):
+    '''Stats for the selected metric over the selected date window'''
+    helper = DashDataHelper(backend=storage)
+    df = helper.get_window_stats(test_dropdown, start_date, end_date)
+
+    df = df.loc[df['METRIC_NAME'] == metric_dropdown]
+
+    rows = ['| Test Cell | Value | P-Value | CI |',
+            '| --- | --- | --- | --- |']
+    for row in df.itertuples():
+        if pd.isna(row.P_VALUE):
+            # the control, which the other cells are compared with
+            rows.append('| {} (control) | {:.3f} | | |'.format(row.TEST_CELL, row.METRIC_VALUE))
+            continue
+        rows.append('| {} | {:.3f} | {:.3f} | [{:.3f}, {:.3f}] |'.format(
+            row.TEST_CELL, row.METRIC_VALUE, row.P_VALUE, row.LOWER_CI, row.UPPER_CI))
+
+    return '\n'.join(rows)
+
+
 @app.callback(
         Output('metrics_viz', 'figure'),
         [Input('test_dropdown','value'),
-         Input('metric_dropdown','value')])
-def daily_metric(test_dropdown, metric_dropdown):
+         Input('metric_dropdown','value'),
+         Input('segment_dropdown','value')])
+def daily_metric(test_dropdown, metric_dropdown, segment_dropdown):
     '''Get selected test data & visualize selected metric'''
-    helper = DashDataHelper()
-    df = helper.get_daily_rollup(test_dropdown)
-    
-    trace1 = go.Scatter(x = df.loc[df['TEST_CELL'] == df['TEST_CELL'].sort_values().unique()[0]]['DT'], 
-                        y = df.loc[df['TEST_CELL'] == df['TEST_CELL'].sort_values().unique()[0]][metric_dropdown], 
-                        line = dict(color = ('#9A9EAB')),
-                        name = df['TEST_CELL'].unique()[0])
-    trace2 = go.Scatter(x = df.loc[df['TEST_CELL'] == df['TEST_CELL'].unique()[1]]['DT'], 
-                        y = df.loc[df['TEST_CELL'] == df['TEST_CELL'].unique()[1]][metric_dropdown], 
-                        line = dict(color = ('#EC96A4')),
-                        name = df['TEST_CELL'].unique()[1])
-    
-    layout = go.Layout(yaxis = {'hoverformat':'.3f'},
-                       title = metric_dropdown.title().replace('_',' '),)
-#                       paper_bgcolor = '#e3e7ea')
-    
-    return {'data': [trace1,trace2], 'layout':layout}
+    helper = DashDataHelper(backend=storage)
+    df = helper.get_daily_rollup(test_dropdown, parse_segment(segment_dropdown))
+
+    return figures.daily_metric_figure(df, metric_dropdown)
 
 
 @app.callback(
         Output('p-value_viz', 'figure'),
         [Input('test_dropdown','value'),
-         Input('metric_dropdown','value')])
-def p_val_chart(test_dropdown, metric_dropdown):
+         Input('metric_dropdown','value'),
+         Input('segment_dropdown','value')])
+def p_val_chart(test_dropdown, metric_dropdown, segment_dropdown):
     '''Display P-Value Trends'''
-    helper = DashDataHelper()
-    df = helper.get_rolling_stats(test_dropdown)
-    
-    df = df.loc[df['METRIC_NAME'] == metric_dropdown]
-    
-    trace1 = go.Scatter(x = df.loc[df['TEST_CELL'] == df['TEST_CELL'].sort_values().unique()[0]]['DT'], 
-                        y = df.loc[df['TEST_CELL'] == df['TEST_CELL'].sort_values().unique()[0]]['P_VALUE'],
-                        line = dict(color=('#5D535E'))
-                        )
-    
-    layout = go.Layout(title = 'Significance (P-Value)',
-                       shapes = [{'type': 'line',
-                                'x0': df['DT'].min(),
-                                'y0': .05,
-                                'x1': df['DT'].max(),
-                                'y1': .05,
-                                'line': {
-                                    'color': '#DFE166',
-                                    'width': 3,
-                                    'dash': 'dash'}}],
-                        yaxis = dict(hoverformat = '.3f',
-                                     range=[0,1])
-                        )
-    
-    return {'data': [trace1], 'layout':layout}
+    helper = DashDataHelper(backend=storage)
+    df = helper.get_rolling_stats(test_dropdown, parse_segment(segment_dropdown))
+
+    return figures.p_value_figure(df, metric_dropdown)
 
 
 @app.callback(
         Output('ci_viz', 'figure'),
         [Input('test_dropdown','value'),
-         Input('metric_dropdown','value')])
-def ci_chart(test_dropdown, metric_dropdown):
+         Input('metric_dropdown','value'),
+         Input('segment_dropdown','value')])
+def ci_chart(test_dropdown, metric_dropdown, segment_dropdown):
     '''Display Metric Avg & CI'''
-    helper = DashDataHelper()
-    df = helper.get_rolling_stats(test_dropdown)
-    
-    df = df.loc[df['METRIC_NAME'] == metric_dropdown]
-    
-    y_val = df.loc[df['DT'] == df['DT'].max()]['METRIC_VALUE']
-    
-    trace1 = go.Bar(x = df['TEST_CELL'], 
-                    y = y_val,
-#                    text = ['{:.3f}'.format(i) for i in y_val],
-#                    textposition = 'auto',
-                    marker = dict(color = ['#9A9EAB', '#EC96A4']),
-                    error_y = dict(type = 'data',
-                                   symmetric = False,
-                                   array = df.loc[df['DT'] == df['DT'].max()]['UPPER_CI'] - df.loc[df['DT'] == df['DT'].max()]['METRIC_VALUE'],
-                                   arrayminus = df.loc[df['DT'] == df['DT'].max()]['METRIC_VALUE'] - df.loc[df['DT'] == df['DT'].max()]['LOWER_CI']
-                                   )
-                    )
-    
-    layout = go.Layout(title = 'Avg Performance To-Date',
-                       yaxis=dict(range=[y_val.min() * .6, y_val.max() * 1.3],
-                                  hoverformat = '.3f')
-                       )
+    helper = DashDataHelper(backend=storage)
+    df = helper.get_rolling_stats(test_dropdown, parse_segment(segment_dropdown))
+
+    return figures.ci_figure(df, metric_dropdown)
+
+
+@app.callback(
+        Output('quantile_viz', 'figure'),
+        [Input('test_dropdown','value'),
+         Input('metric_dropdown','value'),
+         Input('window_picker','start_date'),
+         Input('window_picker','end_date')])
+def quantile_chart(test_dropdown, metric_dropdown, start_date, end_date):
+    '''Display quantiles of a continuous metric over the selected date window'''
+    helper = DashDataHelper(backend=storage)
+    df = helper.get_quantiles(test_dropdown, start_date, end_date)
+
+    return figures.quantile_figure(df, metric_dropdown)
+
+
+@app.callback(
+        Output('overview_table','data'),
+        [Input('tabs','value')])
+def overview_table(tab):
+    '''Latest stats of every active test, from a single read of the latest results table'''
+    helper = DashDataHelper(backend=storage)
+    df = helper.get_latest_results()
+    df['test_name'] = df['test_name'].str.replace('_',' ')
+    df['metric_name'] = df['metric_name'].str.title().str.replace('_',' ')
+
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+@app.callback(
+        Output('planning_test_dropdown','options'),
+        [Input('tabs','value')])
+def planning_test_list(tab):
+    '''Past tests to take the planning baselines from'''
+    helper = DashDataHelper(backend=storage)
+    # inactive tests are still fine baselines
+    test_list = helper.backend.read_test_list()['test_name']
+
+    return [{'label': i.replace('_',' '), 'value':i} for i in test_list]
+
+
+@app.callback(
+        Output('planning_viz', 'figure'),
+        [Input('planning_test_dropdown','value'),
+         Input('planning_days','value'),
+         Input('planning_traffic','value'),
+         Input('planning_split','value')])
+def planning_chart(test_name, days, traffic, split):
+    '''Minimum detectable effect of each metric by test duration'''
+    helper = DashDataHelper(backend=storage)
+    baselines = helper.get_metric_baselines(test_name)
+
+    def parse(text):
+        return [float(i) for i in text.replace(',', ' ').split()]
+
+    df = planning_grid(baselines, parse(days), parse(traffic), parse(split))
 
-    return {'data': [trace1], 'layout':layout}
+    return figures.planning_figure(df)
 
 
 @app.callback(
         Output('test_description', 'children'),
         [Input('test_dropdown','value')])
 def get_test_description(test_dropdown):
-    helper = DashDataHelper()
+    helper = DashDataHelper(backend=storage)
     df = helper.get_active_test_list()
     
     df = df.loc[df['test_name'] == test_dropdown]
@@ -0,0 +1,34 @@
+import logging
+import argparse
+
+
+def _setup_args():
+    desc = 'Export a static report of every active test'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('--storage', dest='storage', type=str,
+                        default='ab_testing_data.db',
+                        help='where the results are stored: a SQLite file, duckdb:PATH or parquet:DIRECTORY (default: ab_testing_data.db)')
+    parser.add_argument('--out-dir', dest='out_dir', type=str,
+                        default='reports',
+                        help='the directory to write the reports to (default: reports)')
+    parser.add_argument('--format', dest='fmt', type=str,
+                        choices=['html', 'json'], default='html',
+                        help='html for one page per test with the figures embedded, json for JSON files and a shared viewer.html (default: html)')
+    parser.add_argument('--processes', dest='processes', type=int,
+                        default=None,
+                        help='the number of worker processes (default: number of CPUs)')
+    parser.add_argument('--force', dest='force', action='store_true',
+                        help='export every test, not just the ones imported since the last export')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _setup_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    # imported here so --help doesn't wait on pandas and plotly
+    from ab_test_evaluator.export import export_reports
+    from ab_test_evaluator.storage import open_backend
+    result = export_reports(open_backend(args.storage), args.out_dir, args.fmt, args.processes, args.force)
+    print('Exported {}, skipped {} unchanged, {} failed, removed {}'.format(
+        len(result['exported']), len(result['skipped']), len(result['failed']), len(result['removed'])))
@@ -5,28 +5,63 @@ import argparse
 
 import yaml
 
-from ab_test_evaluator import ABTest
-
 
 def _setup_args():
     desc = 'Load an AB test by passing a config file and a CSV file'
     parser = argparse.ArgumentParser(description=desc)
     parser.add_argument('--config', dest='config_file', type=str,
-                        nargs=1, default='sample_config.yml',
+                        default='sample_config.yml',
                         help='the path to the config file (default: sample_config.yml)')
     parser.add_argument('--csv', dest='csv_file', type=str,
-                        nargs=1, default='sample_data.csv',
-                        help='the path to the event-level CSV file (default: sample_data.csv)')
+                        nargs='+', default=None,
+                        help='the event-level CSV file, or a glob, directory or list of CSV files partitioned by date, '
+                             'optionally gzipped (default: the source in the config file, or sample_data.csv)')
+    parser.add_argument('--processes', dest='processes', type=int,
+                        default=None,
+                        help='the number of worker processes for the stats (default: number of CPUs)')
+    parser.add_argument('--storage', dest='storage', type=str,
+                        default='ab_testing_data.db',
+                        help='where to store the results: a SQLite file, duckdb:PATH or parquet:DIRECTORY (default: ab_testing_data.db)')
+    parser.add_argument('--cache', dest='cache', type=str,
+                        default=None,
+                        help='a SQLite file to cache the per-day stats in, so unchanged metrics and days are not recomputed (default: no cache)')
+    parser.add_argument('--cache-size', dest='cache_size', type=float,
+                        default=256,
+                        help='the size in MB the cache is kept under, least recently used results are evicted first (default: 256)')
+    parser.add_argument('--hosts', dest='hosts', type=str,
+                        nargs='+', default=None,
+                        help='run the stats on run_worker.py workers instead of local processes, as host:port '
+                             'or host:first_port-last_port (default: local processes)')
     args = parser.parse_args()
-    return args.config_file, args.csv_file
+    csv_file = args.csv_file
+    if csv_file is not None and len(csv_file) == 1:
+        # a single file, glob or directory
+        csv_file = csv_file[0]
+    return args.config_file, csv_file, args.processes, args.storage, args.cache, args.cache_size, args.hosts
+
 
+def import_test_data(config_file, csv_file, processes=None, storage=None, result_cache=None, hosts=None):
+    # imported here so --help doesn't wait on pandas and friends
+    from ab_test_evaluator import ABTest
 
-def import_test_data(config_file, csv_file):
-    a = ABTest(config_file, csv_file)
+    a = ABTest(config_file, csv_file, processes, storage, result_cache, hosts)
     a.load_test_data()
 
 
 if __name__ == '__main__':
-    config, csv = _setup_args()
-    print(f"Using {config} as config file and {csv} as CSV file")
-    import_test_data(config, csv)
+    config, csv, processes, storage, cache, cache_size, hosts = _setup_args()
+    with open(config) as f:
+        has_source = 'source' in yaml.safe_load(f.read())
+    if csv is None and has_source:
+        print(f"Using {config} as config file and its source")
+    else:
+        csv = csv or 'sample_data.csv'
+        print(f"Using {config} as config file and {csv} as CSV input")
+    from ab_test_evaluator.storage import open_backend
+    from ab_test_evaluator.result_cache import ResultCache
+    result_cache = ResultCache(cache, int(cache_size * 2 ** 20)) if cache else None
+    import_test_data(config, csv, processes, open_backend(storage), result_cache, hosts)
+    if result_cache is not None:
+        stats = result_cache.stats()
+        print('Result cache: {hits} hits, {misses} misses, {entries} entries; '
+              '{total_hits} hits and {total_misses} misses overall'.format(**stats))
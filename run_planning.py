@@ -0,0 +1,51 @@
+import argparse
+
+
+def _setup_args():
+    desc = 'Compute the minimum detectable effects of a new test, using a past test as the baseline'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('--test', dest='test_name', type=str, required=True,
+                        help='the name of the past test to take the baselines from, as in the test list')
+    parser.add_argument('--storage', dest='storage', type=str,
+                        default='ab_testing_data.db',
+                        help='where the results are stored: a SQLite file, duckdb:PATH or parquet:DIRECTORY (default: ab_testing_data.db)')
+    parser.add_argument('--days', dest='days', type=int, nargs='+',
+                        default=[7, 14, 21, 28],
+                        help='test durations in days (default: 7 14 21 28)')
+    parser.add_argument('--traffic', dest='traffic', type=float, nargs='+',
+                        default=[1.],
+                        help='shares of the past test\'s traffic in the new test (default: 1)')
+    parser.add_argument('--split', dest='splits', type=float, nargs='+',
+                        default=[.5],
+                        help='shares of the new test\'s traffic in the test cell (default: 0.5)')
+    parser.add_argument('--alpha', dest='alpha', type=float,
+                        default=.05,
+                        help='the significance level (default: 0.05)')
+    parser.add_argument('--power', dest='power', type=float,
+                        default=.8,
+                        help='the power the MDE is computed at (default: 0.8)')
+    parser.add_argument('--effect', dest='relative_effect', type=float,
+                        default=None,
+                        help='also compute the power to detect this relative effect, e.g. 0.05 for 5%%')
+    parser.add_argument('--output', dest='output', type=str,
+                        default=None,
+                        help='write the grid to this CSV file instead of printing it')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _setup_args()
+
+    from ab_test_evaluator.dash_data_helper import DashDataHelper
+    from ab_test_evaluator.planning import planning_grid
+    from ab_test_evaluator.storage import open_backend
+
+    helper = DashDataHelper(backend=open_backend(args.storage))
+    baselines = helper.get_metric_baselines(args.test_name)
+    grid = planning_grid(baselines, args.days, args.traffic, args.splits, args.alpha,
+                         args.power, args.relative_effect)
+
+    if args.output:
+        grid.to_csv(args.output, index=False)
+    else:
+        print(grid.to_string(index=False))
@@ -0,0 +1,45 @@
+import logging
+import argparse
+
+
+def _setup_args():
+    desc = 'Watch a directory for config/CSV pairs and import the tests whose files changed'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('--drop-dir', dest='drop_dir', type=str,
+                        default='drop',
+                        help='the directory to watch for NAME.yml and NAME.csv pairs (default: drop)')
+    parser.add_argument('--storage', dest='storage', type=str,
+                        default='ab_testing_data.db',
+                        help='where to store the results: a SQLite file, duckdb:PATH or parquet:DIRECTORY (default: ab_testing_data.db)')
+    parser.add_argument('--state-file', dest='state_file', type=str,
+                        default=None,
+                        help='the JSON file with the hashes of the last imports (default: DROP_DIR/.scheduler_state.json)')
+    parser.add_argument('--workers', dest='workers', type=int,
+                        default=None,
+                        help='the number of imports to run at once (default: 2, or 1 on a single CPU)')
+    parser.add_argument('--poll-interval', dest='poll_interval', type=float,
+                        default=10,
+                        help='seconds between polls of the drop directory (default: 10)')
+    parser.add_argument('--settle-seconds', dest='settle_seconds', type=float,
+                        default=5,
+                        help='seconds a file must go unmodified before it is imported (default: 5)')
+    parser.add_argument('--cache', dest='cache', type=str,
+                        default=None,
+                        help='a SQLite file to cache the per-day stats in, so unchanged metrics and days are not recomputed (default: no cache)')
+    parser.add_argument('--cache-size', dest='cache_size', type=float,
+                        default=256,
+                        help='the size in MB the cache is kept under, least recently used results are evicted first (default: 256)')
+    parser.add_argument('--once', dest='once', action='store_true',
+                        help='import what has changed and exit, instead of watching forever')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _setup_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    from ab_test_evaluator.scheduler import Scheduler
+    scheduler = Scheduler(args.drop_dir, args.storage, args.state_file, args.workers,
+                          args.poll_interval, args.settle_seconds, args.cache,
+                          int(args.cache_size * 2 ** 20))
+    scheduler.run(once=args.once)
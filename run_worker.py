@@ -0,0 +1,37 @@
+import logging
+import argparse
+import multiprocessing
+
+
+def _setup_args():
+    desc = 'Start workers that run the rolling stats of imports started with run_import.py --hosts'
+    parser = argparse.ArgumentParser(description=desc)
+    parser.add_argument('--host', dest='host', type=str,
+                        default='127.0.0.1',
+                        help='the address to listen on, 0.0.0.0 for every interface (default: 127.0.0.1)')
+    parser.add_argument('--port', dest='port', type=int,
+                        default=6000,
+                        help='the port of the first worker, the others listen on the next ports (default: 6000)')
+    parser.add_argument('--processes', dest='processes', type=int,
+                        default=None,
+                        help='the number of workers (default: number of CPUs)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _setup_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    # imported here so --help doesn't wait on pandas and friends
+    from ab_test_evaluator.executors import serve, worker_authkey
+    # fail here rather than in every worker
+    authkey = worker_authkey()
+    processes = args.processes or multiprocessing.cpu_count()
+    workers = [multiprocessing.Process(target=serve, args=((args.host, args.port + i), authkey))
+               for i in range(processes)]
+    for worker in workers:
+        worker.start()
+    print('Workers listening, import with --hosts {}:{}-{}'.format(
+        args.host, args.port, args.port + processes - 1))
+    for worker in workers:
+        worker.join()
@@ -0,0 +1,530 @@
+"""Checks of every accelerated stats path against a reference implementation.
+
+The reference is what the stats started as: every day recomputed from its
+events, and for continuous metrics the original bootstrap, which resamples
+indices and calls stats.ttest_ind and np.mean on every replicate. A check runs
+the reference, or another slower path, and an accelerated path on the same
+events, and compares their outputs within a tolerance that depends on what may
+legitimately differ:
+
+- exact: paths that make the same random draws in the same order, e.g. worker
+  processes and the result cache
+- float: the same arithmetic in another order, within FLOAT_RTOL
+- Monte Carlo: bootstraps with different random draws, within MONTE_CARLO_Z
+  standard errors of the difference of two bootstrap estimates
+
+Every check reports its worst |difference| / tolerance, at most 1 to pass, and
+the time of both sides. tests/test_equivalence.py runs the checks on a small
+dataset, python -m benchmarks.bench_equivalence on a larger one.
+"""
+import collections
+import contextlib
+import importlib.util
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+import yaml
+
+from ab_test_evaluator.ab_test import ABTest
+from ab_test_evaluator.kernels import available_backends
+from ab_test_evaluator.result_cache import ResultCache
+from ab_test_evaluator.stats import (BinaryTestEval, ContinuousMultiTestEval, ContinuousTestEval,
+                                     ProportionTestEval, RatioTestEval)
+from ab_test_evaluator.storage import BACKENDS, StorageBackend
+
+# Relative tolerance of results computed with the same arithmetic in another order
+FLOAT_RTOL = 1e-9
+FLOAT_ATOL = 1e-12
+# How many standard errors two Monte Carlo estimates may differ by. Each comparison
+# is a test at this level (a 1 in 150,000 false alarm), so a run of a few thousand
+# comparisons rarely fails by chance, and a fixed seed makes every run the same
+MONTE_CARLO_Z = 4.5
+# The mean of the continuous check on values whose spread is tiny next to their mean
+LARGE_MEAN = 1e8
+
+STAT_KEYS = ['DT', 'METRIC_NAME', 'TEST_CELL']
+STAT_VALUES = ['METRIC_VALUE', 'P_VALUE', 'LOWER_CI', 'UPPER_CI']
+# The CI level of the bootstraps, see ContinuousTestEval.mean_diff_continuous_ci
+BOOTSTRAP_CI = .95
+
+METRICS = {'accepts_per_sr': {'type': 'continuous', 'function': 'ACCEPTS'},
+           'net_rev_per_sr': {'type': 'continuous', 'function': 'NET_REV'},
+           'win_rate': {'type': 'binary', 'function': 'WON_LEADS / CLOSED_LEADS'},
+           'connection_rate': {'type': 'ratio', 'function': 'CONNECTIONS / CALL_TRACKING_LEADS'}}
+
+Result = collections.namedtuple('Result', ['check', 'reference_seconds', 'candidate_seconds',
+                                           'worst_error', 'passed'])
+
+
+@contextlib.contextmanager
+def _kernel_backend(backend):
+    """Sets AB_TEST_KERNELS for the duration, worker processes inherit it"""
+    previous = os.environ.get('AB_TEST_KERNELS')
+    os.environ['AB_TEST_KERNELS'] = backend
+    try:
+        yield
+    finally:
+        if previous is None:
+            del os.environ['AB_TEST_KERNELS']
+        else:
+            os.environ['AB_TEST_KERNELS'] = previous
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def float_tolerance(reference):
+    return FLOAT_RTOL * np.abs(np.asarray(reference, dtype=float)) + FLOAT_ATOL
+
+
+def p_value_tolerance(reference, candidate, iterations):
+    """Tolerance of two bootstrap p-values with independent draws.
+
+    A p-value p estimated from n replicates has a variance of p (1 - p) / n, at
+    least 1 / n^2 so that p-values of 0 get one replicate of slack.
+    """
+    p = (np.asarray(reference, dtype=float) + np.asarray(candidate, dtype=float)) / 2
+    variance = np.maximum(p * (1 - p), 1 / iterations) / iterations
+    return MONTE_CARLO_Z * np.sqrt(2 * variance)
+
+
+def percentile_se(lower, upper, iterations, ci=BOOTSTRAP_CI):
+    """Monte Carlo standard error of the bounds of a percentile bootstrap CI.
+
+    The q-th percentile of n replicates has a standard error of
+    sqrt(q (1 - q) / n) / f(x_q). The bootstrap distribution is taken to be
+    normal, with the standard deviation implied by the width of the CI.
+    """
+    q = (1 - ci) / 2
+    z = stats.norm.ppf(1 - q)
+    sd = (np.asarray(upper, dtype=float) - np.asarray(lower, dtype=float)) / (2 * z)
+    return sd * np.sqrt(q * (1 - q) / iterations) / stats.norm.pdf(z)
+
+
+def ci_tolerance(reference, candidate, iterations):
+    """Tolerance of the CI bounds of two bootstraps with independent draws.
+
+    Args:
+        reference, candidate (tuple): (lower, upper) arrays of both sides
+        iterations (int): The bootstrap replicates of each side
+    """
+    se = [percentile_se(lower, upper, iterations) for lower, upper in (reference, candidate)]
+    return MONTE_CARLO_Z * np.sqrt(se[0] ** 2 + se[1] ** 2)
+
+
+def worst_error(reference, candidate, tolerance):
+    """Returns the largest |reference - candidate| / tolerance.
+
+    Entries that are NaN on both sides match, a NaN on one side only doesn't,
+    and a tolerance of 0 requires equality.
+    """
+    reference = np.asarray(reference, dtype=float)
+    candidate = np.asarray(candidate, dtype=float)
+    if reference.shape != candidate.shape or (np.isnan(reference) != np.isnan(candidate)).any():
+        return np.inf
+    both = ~np.isnan(reference)
+    diff = np.abs(reference - candidate)[both]
+    tolerance = np.broadcast_to(tolerance, reference.shape)[both]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        errors = np.where(diff == 0, 0., diff / tolerance)
+    return errors.max() if errors.size else 0.
+
+
+def compare_stats(reference, candidate, monte_carlo=(), iterations=None, p_values=True, p_slack=0.):
+    """Compares two rolling stat tables row by row.
+
+    Args:
+        reference, candidate (DataFrame): rolling_stats outputs
+        monte_carlo (list): The metrics whose P_VALUE and CIs come from bootstraps
+                            with different draws on each side, compared within the
+                            Monte Carlo tolerances. Everything else gets the float tolerance
+        iterations (int): The bootstrap replicates of each side
+        p_values (bool): Whether to compare the P_VALUE of the monte_carlo metrics,
+                         False when the two sides test different null models
+        p_slack (float): Added to the tolerance of every P_VALUE, e.g. one replicate
+                         that rounding may move across the observed statistic
+    Returns:
+        float: The worst |difference| / tolerance, inf if the rows don't match
+    """
+    merged = reference.merge(candidate, on=STAT_KEYS, suffixes=('_ref', '_new'))
+    if not len(merged) == len(reference) == len(candidate):
+        return np.inf
+
+    mc = merged['METRIC_NAME'].isin(list(monte_carlo)).values
+    columns = {col: (merged[col + '_ref'].values.astype(float), merged[col + '_new'].values.astype(float))
+               for col in STAT_VALUES}
+    errors = []
+    for col, (ref, new) in columns.items():
+        tolerance = float_tolerance(ref)
+        if col == 'P_VALUE':
+            tolerance = tolerance + p_slack
+            if mc.any():
+                tolerance[mc] = p_value_tolerance(ref[mc], new[mc], iterations) if p_values else np.inf
+        elif col != 'METRIC_VALUE' and mc.any():
+            bounds = [(columns['LOWER_CI'][i][mc], columns['UPPER_CI'][i][mc]) for i in (0, 1)]
+            tolerance[mc] = ci_tolerance(bounds[0], bounds[1], iterations)
+        errors.append(worst_error(ref, new, tolerance))
+    return max(errors)
+
+
+def baseline_continuous_stats(control, test, iterations, seed, ci=BOOTSTRAP_CI):
+    """The bootstrap ContinuousTestEval started as, before the moment kernels.
+
+    Every p-value replicate resamples a control and a test sample of the
+    original sizes from the pooled events and takes their stats.ttest_ind.
+    Every CI replicate resamples each cell from itself and takes the difference
+    of their np.mean. The indices come from NumPy's generator, one replicate at
+    a time, so nothing is shared with the kernels but the events.
+
+    Args:
+        control, test (array): The events of both cells
+        iterations (int): The bootstrap replicates
+        seed: The seed of the draws, an int or a np.random.SeedSequence
+        ci (float): The CI level
+    Returns:
+        dict: P_VALUE, LOWER_CI and UPPER_CI
+    """
+    rng = np.random.default_rng(seed)
+    control = np.asarray(control, dtype=float)
+    test = np.asarray(test, dtype=float)
+    pooled = np.append(control, test)
+
+    t_stat = stats.ttest_ind(control, test)[0]
+    boot_t = np.empty(iterations)
+    for i in range(iterations):
+        ctrl_boot = pooled[rng.integers(0, pooled.shape[0], control.shape[0])]
+        test_boot = pooled[rng.integers(0, pooled.shape[0], test.shape[0])]
+        boot_t[i] = np.abs(stats.ttest_ind(ctrl_boot, test_boot)[0])
+
+    diffs = np.empty(iterations)
+    for i in range(iterations):
+        diffs[i] = (np.mean(test[rng.integers(0, test.shape[0], test.shape[0])])
+                    - np.mean(control[rng.integers(0, control.shape[0], control.shape[0])]))
+
+    alpha = ((1 - ci) * 100) / 2
+    return {'P_VALUE': np.mean(np.abs(t_stat) < boot_t),
+            'LOWER_CI': np.percentile(diffs, alpha),
+            'UPPER_CI': np.percentile(diffs, 100 - alpha)}
+
+
+def _reference_stats(m_dict, control, treatment, iterations, seed):
+    """The stats of one test cell against the control, from their events"""
+    numerator = m_dict['numerator_column']
+    denominator = m_dict['denominator_column']
+    if m_dict['type'] == 'continuous':
+        return baseline_continuous_stats(control[numerator].values, treatment[numerator].values,
+                                         iterations, seed)
+    if m_dict['type'] == 'binary':
+        trials = []
+        for events in (control, treatment):
+            successes = int(events[numerator].sum())
+            trials.append(np.concatenate((np.ones(successes),
+                                          np.zeros(int(events[denominator].sum()) - successes))))
+        b = BinaryTestEval(*trials)
+        p_val = b.binary_pval()
+        lower, upper = b.binary_ci()
+    else:
+        group_stats = []
+        for events in (control, treatment):
+            x = events[numerator].values.astype(float)
+            y = events[denominator].values.astype(float)
+            group_stats.append({'n': len(events), 'sum_x': x.sum(), 'sum_y': y.sum(), 'sum_xx': (x * x).sum(),
+                                'sum_yy': (y * y).sum(), 'sum_xy': (x * y).sum()})
+        b = RatioTestEval(*group_stats)
+        p_val = b.ratio_pval()
+        lower, upper = b.ratio_ci()
+    return {'P_VALUE': p_val, 'LOWER_CI': lower, 'UPPER_CI': upper}
+
+
+def reference_rolling_stats(test, df):
+    """The rolling stats as they were first written: every day recomputed from its events.
+
+    Each day's stats come from all the events up to it. Binary metrics expand
+    their counts into arrays of trials for BinaryTestEval, ratio metrics sum the
+    events for RatioTestEval, and continuous metrics run baseline_continuous_stats
+    of each test cell against the control. Nothing is batched, cached or shared
+    between days, cells or metrics.
+
+    Args:
+        test (ABTest): The test, with its test_cells set
+        df (DataFrame): The events, from ABTest.read_events
+    Returns:
+        DataFrame: The columns of ABTest.rolling_stats
+    """
+    df = df.copy()
+    df['DT'] = df['DT'].dt.floor('D')
+    control = test.test_cells[0]
+
+    rows = []
+    for date in np.sort(df['DT'].unique()):
+        run = df[df['DT'] <= date]
+        events = {cell: run[run['TEST_CELL'] == cell] for cell in test.test_cells}
+        for metric, m_dict in test.metric_definitions.items():
+            seed = test._task_seed(date, metric)
+            for cell in test.test_cells:
+                t = events[cell]
+                row = {'DT': date, 'METRIC_NAME': metric, 'TEST_CELL': cell,
+                       'METRIC_VALUE': t[m_dict['numerator_column']].sum() / t[m_dict['denominator_column']].sum(),
+                       'P_VALUE': np.nan, 'LOWER_CI': np.nan, 'UPPER_CI': np.nan}
+                if cell != control:
+                    row.update(_reference_stats(m_dict, events[control], t, test.bootstrap_iterations, seed))
+                rows.append(row)
+    return pd.DataFrame(rows)
+
+
+class EquivalenceHarness(object):
+
+    def __init__(self, events, out_dir, iterations=500, seed=0, processes=None, hosts=None):
+        """Runs the checks on one set of events.
+
+        Args:
+            events (DataFrame): The events, e.g. from generate_events, with a
+                                "control" test cell
+            out_dir (str): Where to write the events, configs and result cache
+            iterations (int): The bootstrap iterations
+            seed (int): The test's seed
+            processes (int): The worker processes of the parallel check. Defaults
+                             to the number of CPUs, at most 4
+            hosts (list): run_worker.py workers for the distributed check, or None to skip it
+        """
+        self.out_dir = out_dir
+        self.iterations = iterations
+        self.seed = seed
+        self.processes = processes or max(2, min(4, os.cpu_count() or 1))
+        self.hosts = hosts
+        self.csv_file = os.path.join(out_dir, 'events.csv')
+        events.to_csv(self.csv_file, index=False)
+
+        self.events = self.make_test().read_events()
+        self.continuous = [m for m, m_dict in METRICS.items() if m_dict['type'] == 'continuous']
+        self._baseline = None
+
+    def make_test(self, bootstrap='resample', processes=1, **kwargs):
+        """Creates the test on the events, with its test cells set"""
+        config = {'test_name': 'Equivalence',
+                  'description': 'Generated by benchmarks.bench_equivalence',
+                  'control_cell': 'control',
+                  'seed': self.seed,
+                  'bootstrap': bootstrap,
+                  'bootstrap_iterations': self.iterations,
+                  'metrics': METRICS}
+        config_file = os.path.join(self.out_dir, '{}.yml'.format(bootstrap))
+        with open(config_file, 'w') as f:
+            yaml.safe_dump(config, f)
+
+        test = ABTest(config_file, self.csv_file, processes, StorageBackend(), **kwargs)
+        if hasattr(self, 'events'):
+            test.test_cells = test._order_cells(self.events['TEST_CELL'].unique())
+        return test
+
+    def baseline(self):
+        """Runs the rolling stats sequentially on the NumPy kernels, once"""
+        if self._baseline is None:
+            with _kernel_backend('numpy'):
+                self._baseline = _timed(lambda: self.make_test().rolling_stats(self.events))
+        return self._baseline
+
+    def _result(self, check, reference_seconds, candidate_seconds, error):
+        return Result(check, reference_seconds, candidate_seconds, error, bool(error <= 1))
+
+    def check_binary_eval(self):
+        """BinaryTestEval on arrays of trials vs ProportionTestEval on the counts, every day and cell at once"""
+        cumulative = (self.events.assign(DT=self.events['DT'].dt.floor('D'))
+                      .groupby(['TEST_CELL', 'DT'])[['WON_LEADS', 'CLOSED_LEADS']].sum()
+                      .groupby(level='TEST_CELL').cumsum())
+        control = cumulative.loc['control']
+        pairs = [(control.loc[date], row) for (cell, date), row in cumulative.iterrows()
+                 if cell != 'control' and date in control.index]
+
+        def reference():
+            results = []
+            for c, t in pairs:
+                trials = [np.concatenate((np.ones(int(s['WON_LEADS'])),
+                                          np.zeros(int(s['CLOSED_LEADS'] - s['WON_LEADS'])))) for s in (c, t)]
+                b = BinaryTestEval(*trials)
+                results.append((b.binary_pval(),) + tuple(b.binary_ci()))
+            return np.array(results)
+
+        def candidate():
+            counts = [{'successes': np.array([p[i]['WON_LEADS'] for p in pairs]),
+                       'trials': np.array([p[i]['CLOSED_LEADS'] for p in pairs])} for i in (0, 1)]
+            b = ProportionTestEval(*counts)
+            return np.column_stack((b.proportion_pval(),) + tuple(b.proportion_ci()))
+
+        (ref, ref_seconds), (new, new_seconds) = _timed(reference), _timed(candidate)
+        return self._result('binary: arrays of trials vs counts', ref_seconds, new_seconds,
+                            worst_error(ref, new, float_tolerance(ref)))
+
+    def check_continuous_eval(self, offset=0):
+        """baseline_continuous_stats vs the moment kernels of ContinuousMultiTestEval.
+
+        Compares every test cell's NET_REV against the control's, within the Monte
+        Carlo tolerance. With an offset, NET_REV is scaled to a spread of
+        hundredths around a mean of offset, where moments summed from the raw
+        values lose every digit of the variance.
+        """
+        values = [self.events.loc[self.events['TEST_CELL'] == cell, 'NET_REV'].values
+                  for cell in self.make_test().test_cells]
+        if offset:
+            values = [offset + v / 1000 for v in values]
+
+        def reference():
+            results = [baseline_continuous_stats(values[0], test, self.iterations, self.seed)
+                       for test in values[1:]]
+            return np.array([[r['P_VALUE'], r['LOWER_CI'], r['UPPER_CI']] for r in results])
+
+        def candidate():
+            b = ContinuousMultiTestEval(values[0], values[1:], self.seed)
+            p_vals = b.continuous_pvals(self.iterations)
+            return np.column_stack((p_vals,) + tuple(b.mean_diff_continuous_cis(self.iterations)))
+
+        (ref, ref_seconds), (new, new_seconds) = _timed(reference), _timed(candidate)
+        bounds = ci_tolerance(ref[:, 1:].T, new[:, 1:].T, self.iterations)
+        tolerance = np.column_stack((p_value_tolerance(ref[:, 0], new[:, 0], self.iterations), bounds, bounds))
+        check = 'continuous: kernels at a mean of {:.0e}'.format(offset) if offset else 'continuous: ttest_ind vs kernels'
+        return self._result(check, ref_seconds, new_seconds, worst_error(ref, new, tolerance))
+
+    def check_multi_test_eval(self):
+        """ContinuousTestEval of each test cell vs ContinuousMultiTestEval of all of them.
+
+        The p-value of the first test cell makes the same draws on both sides, so
+        it must match exactly. Everything else has its own draws (the CIs are
+        seeded after every p-value), within the Monte Carlo tolerance.
+        """
+        values = [self.events.loc[self.events['TEST_CELL'] == cell, 'NET_REV'].values
+                  for cell in self.make_test().test_cells]
+
+        def reference():
+            results = []
+            for test in values[1:]:
+                b = ContinuousTestEval(values[0], test, self.seed)
+                results.append((b.continuous_pval(self.iterations),) + tuple(b.mean_diff_continuous_ci(self.iterations)))
+            return np.array(results)
+
+        def candidate():
+            b = ContinuousMultiTestEval(values[0], values[1:], self.seed)
+            p_vals = b.continuous_pvals(self.iterations)
+            return np.column_stack((p_vals,) + tuple(b.mean_diff_continuous_cis(self.iterations)))
+
+        (ref, ref_seconds), (new, new_seconds) = _timed(reference), _timed(candidate)
+        tolerance = np.column_stack((p_value_tolerance(ref[:, 0], new[:, 0], self.iterations),
+                                     ci_tolerance(ref[:, 1:].T, new[:, 1:].T, self.iterations),
+                                     ci_tolerance(ref[:, 1:].T, new[:, 1:].T, self.iterations)))
+        tolerance[0, 0] = 0
+        return self._result('continuous: pairwise vs shared control', ref_seconds, new_seconds,
+                            worst_error(ref, new, tolerance))
+
+    def check_rolling_stats(self):
+        """The per-day reference loop vs rolling_stats"""
+        test = self.make_test()
+        with _kernel_backend('numpy'):
+            ref, ref_seconds = _timed(lambda: reference_rolling_stats(test, self.events))
+        new, new_seconds = self.baseline()
+        return self._result('rolling stats: per-day reference', ref_seconds, new_seconds,
+                            compare_stats(ref, new, self.continuous, self.iterations))
+
+    def check_processes(self):
+        """Sequential vs worker processes, which make the same draws"""
+        base, base_seconds = self.baseline()
+        test = self.make_test(processes=self.processes)
+        with _kernel_backend('numpy'):
+            new, new_seconds = _timed(lambda: test.rolling_stats(self.events))
+        return self._result('rolling stats: {} processes'.format(self.processes), base_seconds, new_seconds,
+                            worst_error(base[STAT_VALUES], new[STAT_VALUES], 0))
+
+    def check_result_cache(self):
+        """Uncached vs a warm result cache, which returns the stored results"""
+        base, base_seconds = self.baseline()
+        cache = ResultCache(os.path.join(self.out_dir, 'cache.db'))
+        with _kernel_backend('numpy'):
+            self.make_test(result_cache=cache).rolling_stats(self.events)
+            new, new_seconds = _timed(lambda: self.make_test(result_cache=cache).rolling_stats(self.events))
+        return self._result('rolling stats: warm result cache', base_seconds, new_seconds,
+                            worst_error(base[STAT_VALUES], new[STAT_VALUES], 0))
+
+    def check_poisson_bootstrap(self):
+        """The resampling bootstrap vs the single-pass Poisson bootstrap.
+
+        Both CIs estimate the same percentiles of the mean difference. Their
+        p-values test different null models (permuting the pooled events vs the
+        bootstrap distribution of the difference), so only the CIs are compared.
+        """
+        base, base_seconds = self.baseline()
+        with _kernel_backend('numpy'):
+            new, new_seconds = _timed(lambda: self.make_test('poisson').rolling_stats(self.events))
+        return self._result('rolling stats: Poisson bootstrap', base_seconds, new_seconds,
+                            compare_stats(base, new, self.continuous, self.iterations, p_values=False))
+
+    def check_kernels(self, backend):
+        """The NumPy kernels vs another backend, which makes the same draws.
+
+        The sums only differ by rounding, which may move a replicate across the
+        observed statistic, so p-values get one replicate of slack.
+        """
+        base, base_seconds = self.baseline()
+        test = self.make_test()
+        with _kernel_backend(backend):
+            # the first call compiles the kernels
+            test.rolling_stats(self.events)
+            new, new_seconds = _timed(lambda: test.rolling_stats(self.events))
+        return self._result('rolling stats: {} kernels'.format(backend), base_seconds, new_seconds,
+                            compare_stats(base, new, p_slack=1 / self.iterations))
+
+    def check_hosts(self):
+        """Local processes vs run_worker.py workers, which make the same draws.
+
+        The workers pick their own kernel backend, so this allows for rounding
+        like check_kernels.
+        """
+        base, base_seconds = self.baseline()
+        new, new_seconds = _timed(lambda: self.make_test(hosts=self.hosts).rolling_stats(self.events))
+        return self._result('rolling stats: {} remote workers'.format(len(self.hosts)), base_seconds,
+                            new_seconds, compare_stats(base, new, p_slack=1 / self.iterations))
+
+    def check_storage_engine(self, kind):
+        """The pandas sufficient statistics vs a storage backend's engine"""
+        test = self.make_test()
+        columns, products = test._suffstat_columns()
+        reference, engine = StorageBackend(), BACKENDS[kind](os.path.join(self.out_dir, kind))
+
+        def run(backend):
+            daily = backend.aggregate_suffstats(self.events, columns, products)
+            return backend.cumulate_suffstats(daily).sort_values(['DT', 'TEST_CELL']).reset_index(drop=True)
+
+        (ref, ref_seconds), (new, new_seconds) = _timed(lambda: run(reference)), _timed(lambda: run(engine))
+        stat_columns = [c for c in ref.columns if c not in ['DT', 'TEST_CELL']]
+        if list(ref[['DT', 'TEST_CELL']].astype(str).values.ravel()) != \
+                list(new[['DT', 'TEST_CELL']].astype(str).values.ravel()):
+            error = np.inf
+        else:
+            # counts are integers, sums of squares may be summed in another order
+            error = max(worst_error(ref['COUNT'], new['COUNT'], 0),
+                        worst_error(ref[stat_columns], new[stat_columns], float_tolerance(ref[stat_columns])))
+        return self._result('suffstats: {} engine'.format(kind), ref_seconds, new_seconds, error)
+
+    def run(self):
+        """Runs every check that can run here
+
+        Returns:
+            list: A Result per check
+        """
+        checks = [self.check_binary_eval, self.check_continuous_eval,
+                  lambda: self.check_continuous_eval(LARGE_MEAN), self.check_multi_test_eval, self.check_rolling_stats,
+                  self.check_processes, self.check_result_cache, self.check_poisson_bootstrap]
+        checks.extend(lambda b=b: self.check_kernels(b) for b in available_backends() if b != 'numpy')
+        checks.extend(lambda k=k: self.check_storage_engine(k) for k in ['duckdb', 'parquet']
+                      if engine_available(k))
+        if self.hosts:
+            checks.append(self.check_hosts)
+        return [check() for check in checks]
+
+
+def engine_available(kind):
+    """Whether the package a storage backend's engine needs is installed"""
+    return importlib.util.find_spec({'duckdb': 'duckdb', 'parquet': 'pyarrow'}[kind]) is not None
@@ -1 +1,64 @@
-from .. import ab_testing_import
+"""Generates events with the columns of tests/test_event_data.csv and writes them to a CSV file.
+
+Run from the repo root: python -m tests.generate_fake_data [--out FILE] [--rows N]
+The control cell is "control", so use a config with control_cell: control.
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+def _setup_args():
+    parser = argparse.ArgumentParser(description='Write generated test events to a CSV file')
+    parser.add_argument('--out', type=str, default='fake_event_data.csv',
+                        help='the CSV file to write (default: fake_event_data.csv)')
+    parser.add_argument('--rows', type=int, default=20000,
+                        help='the number of events (default: 20000)')
+    parser.add_argument('--days', type=int, default=14,
+                        help='the number of days (default: 14)')
+    parser.add_argument('--cells', type=int, default=2,
+                        help='the number of test cells, control included (default: 2)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='the seed of the events (default: 0)')
+    return parser.parse_args()
+
+
+def generate_events(n_rows=20000, n_days=14, n_cells=3, seed=0, effect=.05):
+    """Generates events with the columns of tests/test_event_data.csv the metrics use.
+
+    Every test cell lifts the metrics by effect more than the one before it, the
+    control ("control") by nothing.
+
+    Args:
+        n_rows (int): The number of events
+        n_days (int): The number of days they're spread over
+        n_cells (int): The number of test cells, control included
+        seed (int): The seed of the events
+        effect (float): The lift per test cell
+    Returns:
+        DataFrame: The events, in DT order
+    """
+    rng = np.random.default_rng(seed)
+    cells = np.array(['control'] + ['test_{}'.format(i) for i in range(1, n_cells)])
+    cell = rng.integers(0, n_cells, n_rows)
+    lift = 1 + effect * cell
+    closed = rng.binomial(3, .5, n_rows)
+    call_tracking = rng.poisson(1.5, n_rows)
+
+    df = pd.DataFrame({
+        'TEST_CELL': cells[cell],
+        'DT': pd.Timestamp('2018-07-01') + pd.to_timedelta(rng.uniform(0, n_days, n_rows), unit='D').floor('s'),
+        'MATCH_TYPE': rng.choice(['Instant Connect', 'Market Match', 'Same-Day Booking'], n_rows),
+        'ACCEPTS': rng.poisson(2 * lift),
+        'CLOSED_LEADS': closed,
+        'WON_LEADS': rng.binomial(closed, np.minimum(.3 * lift, 1)),
+        'CALL_TRACKING_LEADS': call_tracking,
+        'CONNECTIONS': rng.binomial(call_tracking, .6),
+        'NET_REV': np.round(rng.lognormal(3, 1, n_rows) * lift, 2)})
+    return df.sort_values('DT', kind='stable').reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    args = _setup_args()
+    generate_events(args.rows, args.days, args.cells, args.seed).to_csv(args.out, index=False)
@@ -0,0 +1,91 @@
+from ab_test_evaluator.api import *
+from ab_test_evaluator.ab_test import ABTest
+from ab_test_evaluator.storage import SQLiteBackend
+import ab_test_evaluator.sql_writer as sw
+
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import flask
+
+
+class TestAPI(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.backend = SQLiteBackend(os.path.join(cls.tmp_dir, 'ab_testing_data.db'))
+        cls.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1, cls.backend)
+        cls.test.load_test_data()
+
+    def setUp(self):
+        app = flask.Flask(__name__)
+        app.register_blueprint(create_api(self.backend))
+        self.client = app.test_client()
+
+    def get_json(self, url, **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response, json.loads(response.data)
+
+    def test_test_list(self):
+        _, data = self.get_json('/api/tests')
+
+        self.assertEqual(data['columns']['test_name'], ['Unit_Test'])
+        self.assertGreaterEqual(data['columns']['load_version'][0], 1)
+
+    def test_stats_are_columnar(self):
+        _, data = self.get_json('/api/tests/Unit_Test/stats?metric=win_rate')
+        columns = data['columns']
+
+        self.assertEqual(set(columns['METRIC_NAME']), {'win_rate'})
+        self.assertEqual(len(columns['DT']), len(columns['P_VALUE']))
+        self.assertRegex(columns['DT'][0], r'^\d{4}-\d{2}-\d{2}$')
+
+    def test_unknown_test_or_metric(self):
+        self.assertEqual(self.client.get('/api/tests/Nope/daily').status_code, 404)
+        self.assertEqual(self.client.get('/api/tests/Unit_Test/stats?metric=nope').status_code, 404)
+
+    def test_gzip(self):
+        response = self.client.get('/api/tests/Unit_Test/daily', headers={'Accept-Encoding': 'gzip'})
+        plain, data = self.get_json('/api/tests/Unit_Test/daily')
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.data)), data)
+        self.assertNotEqual(response.headers['ETag'], plain.headers['ETag'])
+
+    def test_not_modified_until_next_load(self):
+        response, _ = self.get_json('/api/tests/Unit_Test/daily')
+        etag = response.headers['ETag']
+
+        response = self.client.get('/api/tests/Unit_Test/daily', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        sw.bump_load_version(self.test, self.backend)
+        response = self.client.get('/api/tests/Unit_Test/daily', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_adds_load_version_to_old_test_list(self):
+        db_path = os.path.join(self.tmp_dir, 'old.db')
+        conn = sqlite3.connect(db_path)
+        conn.execute('create table ab_tests (test_name text primary key, active_fg text, '
+                     'description text, config_file text not null)')
+        conn.execute("insert into ab_tests values ('old_test', 'Y', 'old', 'old.yml')")
+        conn.commit()
+        conn.close()
+
+        df = SQLiteBackend(db_path).read_test_list()
+        self.assertEqual(df['load_version'].tolist(), [0])
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,37 +1,54 @@
-from ab_testing_import.dash_data_helper import *
-import ab_testing_import.sql_writer as sw
-
+from ab_test_evaluator.dash_data_helper import *
+from ab_test_evaluator.ab_test import ABTest
+from ab_test_evaluator.storage import SQLiteBackend
+import ab_test_evaluator.sql_writer as sw
+
+import os
+import shutil
+import tempfile
 import unittest
 
 import pandas as pd
 
 
-class TestGetActiveTestList(unittest.TestCase):
+class HelperTests(object):
+    """Writes a test to a temporary SQLite file and reads it with a DashDataHelper"""
 
     def setUp(self):
-        self.test_name = 'test1'
-        self.helper = DashDataHelper()
-        # add a test to the list
-        sw._verify_test_in_list(self.test_name)
+        self.tmp_dir = tempfile.mkdtemp()
+        db_path = os.path.join(self.tmp_dir, 'ab_testing_data.db')
+        self.backend = SQLiteBackend(db_path)
+        self.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1, self.backend)
+        self.test_name = sw.sqlify_test_name(self.test.test_name)
+        self.helper = DashDataHelper(db_path)
+
+    def tearDown(self):
+        self.helper.backend._read_pool.close()
+        shutil.rmtree(self.tmp_dir)
+
+
+class TestGetActiveTestList(HelperTests, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        sw._verify_test_in_list(self.test_name, self.test.config_file, self.test.description, self.backend)
 
     def test_returns_test_lists(self):
         test_list = self.helper.get_active_test_list()
-        test_list = test_list.values
-        self.assertIn(self.test_name, test_list)
+        self.assertIn(self.test_name, test_list['test_name'].values)
 
-    def tearDown(self):
-        # remove the test from the list
-        sw.deactivate_test(self.test_name)
+    def test_leaves_out_deactivated_tests(self):
+        sw.deactivate_test(self.test_name, self.backend)
+        test_list = self.helper.get_active_test_list()
+        self.assertNotIn(self.test_name, test_list['test_name'].values)
 
 
-class TestGetDailyRollup(unittest.TestCase):
+class TestGetDailyRollup(HelperTests, unittest.TestCase):
 
     def setUp(self):
-        # create rollup table
-        self.test_name = 'test1'
-        self.helper = DashDataHelper()
+        super().setUp()
         self.df = pd.read_csv('tests/test_rollup_data.csv', parse_dates=['DT'])
-        sw.insert_daily_rollup_data(self.df, self.test_name)
+        sw.insert_daily_rollup_data(self.df, self.test, self.backend)
 
     def test_returns_table(self):
         df = self.helper.get_daily_rollup(self.test_name)
@@ -50,34 +67,54 @@ class TestGetDailyRollup(unittest.TestCase):
             if col not in ['TEST_CELL', 'DT']:
                 self.assertTrue(pd.api.types.is_numeric_dtype(df[col]))
 
-    def tearDown(self):
-        # remove rollup table
-        sw.deactivate_test(self.test_name)
-        table_name = self.test_name + sw.DAILY_ROLLUP_EXT
-        query = "drop table {}".format(table_name)
-        with sw.sqlite_connection(sw.DATABASE_FILE) as conn:
-            conn.execute(query)
-            conn.commit()
-
 
-class TestGetRollingStats(unittest.TestCase):
+class TestGetRollingStats(HelperTests, unittest.TestCase):
 
     def setUp(self):
-        # read in test stats file, create table
-        pass
+        super().setUp()
+        events = self.test.read_events()
+        events = events[events['DT'] < '2018-07-03']
+        self.test.test_cells = self.test._order_cells(events['TEST_CELL'].unique())
+        self.df = self.test.rolling_stats(events)
+        sw.insert_rolling_stats_data(self.df, self.test, self.backend)
 
     def test_returns_table(self):
-        pass
+        df = self.helper.get_rolling_stats(self.test_name)
+        self.assertIsInstance(df, pd.DataFrame)
 
     def test_table_matches_df(self):
-        pass
+        df = self.helper.get_rolling_stats(self.test_name)
+        self.assertEqual(df.shape, self.df.shape)
+        self.assertEqual(set(df.columns), set(self.df.columns))
 
     def test_data_types(self):
-        pass
+        df = self.helper.get_rolling_stats(self.test_name)
 
-    def tearDown(self):
-        # remove stats table
-        pass
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(df['DT']))
+        for col in ['TEST_CELL', 'METRIC_NAME']:
+            self.assertTrue(pd.api.types.is_string_dtype(df[col]))
+        for col in ['METRIC_VALUE', 'P_VALUE', 'LOWER_CI', 'UPPER_CI']:
+            self.assertTrue(pd.api.types.is_numeric_dtype(df[col]))
+
+
+class TestGetTestCells(HelperTests, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        events = self.test.read_events()
+        events = events[events['DT'] < '2018-07-01']
+        # without a control_cell, the control is the first cell in the events
+        self.test.test_cells = self.test._order_cells(events['TEST_CELL'].unique())
+        self.test._insert_stats(self.test.rolling_stats(events), self.test.daily_suffstats(events))
+
+    def test_saved_cells(self):
+        self.assertEqual(self.helper.get_test_cells(self.test_name), ['Test', 'Ctrl'])
+
+    def test_imported_before_cells_were_saved(self):
+        self.backend.drop_table(self.test_name + sw.CELLS_EXT)
+
+        # not sorted, that would make Ctrl the control
+        self.assertEqual(self.helper.get_test_cells(self.test_name), ['Test', 'Ctrl'])
 
 
 if __name__ == '__main__':
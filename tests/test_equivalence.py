@@ -0,0 +1,94 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from ab_test_evaluator.kernels import available_backends
+from tests.equivalence import LARGE_MEAN, EquivalenceHarness, compare_stats, engine_available, worst_error
+from tests.generate_fake_data import generate_events
+
+
+class TestEquivalence(unittest.TestCase):
+    """The equivalence checks on a dataset small enough for the unit tests"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.harness = EquivalenceHarness(generate_events(3000, 5, 3, seed=1), cls.tmp_dir,
+                                         iterations=200, seed=1, processes=2)
+
+    def assertPasses(self, result):
+        self.assertTrue(result.passed, '{} is off by {:.2f} tolerances'.format(result.check, result.worst_error))
+
+    def test_binary_eval(self):
+        self.assertPasses(self.harness.check_binary_eval())
+
+    def test_continuous_eval(self):
+        self.assertPasses(self.harness.check_continuous_eval())
+
+    def test_continuous_eval_large_mean(self):
+        self.assertPasses(self.harness.check_continuous_eval(LARGE_MEAN))
+
+    def test_multi_test_eval(self):
+        self.assertPasses(self.harness.check_multi_test_eval())
+
+    def test_rolling_stats(self):
+        self.assertPasses(self.harness.check_rolling_stats())
+
+    def test_processes(self):
+        self.assertPasses(self.harness.check_processes())
+
+    def test_result_cache(self):
+        self.assertPasses(self.harness.check_result_cache())
+
+    def test_poisson_bootstrap(self):
+        self.assertPasses(self.harness.check_poisson_bootstrap())
+
+    def test_kernels(self):
+        for backend in available_backends():
+            if backend != 'numpy':
+                with self.subTest(backend=backend):
+                    self.assertPasses(self.harness.check_kernels(backend))
+
+    def test_storage_engines(self):
+        engines = [kind for kind in ['duckdb', 'parquet'] if engine_available(kind)]
+        if not engines:
+            self.skipTest('neither duckdb nor pyarrow is installed')
+        for kind in engines:
+            with self.subTest(engine=kind):
+                self.assertPasses(self.harness.check_storage_engine(kind))
+
+    def test_catches_a_shifted_ci(self):
+        reference, _ = self.harness.baseline()
+        continuous = reference['METRIC_NAME'].isin(self.harness.continuous) & reference['P_VALUE'].notnull()
+        shifted = reference.copy()
+        # the tolerance of 200 replicates is about 1.2 bootstrap standard deviations,
+        # half the CI width is 1.96 of them
+        shifted.loc[continuous, 'LOWER_CI'] += (reference['UPPER_CI'] - reference['LOWER_CI'])[continuous] / 2
+
+        self.assertLessEqual(compare_stats(reference, reference, self.harness.continuous, 200), 1)
+        self.assertGreater(compare_stats(reference, shifted, self.harness.continuous, 200), 1)
+
+    def test_catches_missing_rows(self):
+        reference, _ = self.harness.baseline()
+
+        self.assertEqual(compare_stats(reference, reference.iloc[1:]), np.inf)
+
+    def test_nan_must_match(self):
+        self.assertEqual(worst_error([np.nan, 1.], [np.nan, 1.], 0), 0)
+        self.assertEqual(worst_error([np.nan, 1.], [0., 1.], 1), np.inf)
+        self.assertEqual(worst_error([1.], [1. + 1e-12], 0), np.inf)
+
+    def test_generated_events_are_reproducible(self):
+        pd.testing.assert_frame_equal(generate_events(500, 3, 2, seed=4), generate_events(500, 3, 2, seed=4))
+        self.assertEqual(set(generate_events(500, 3, 4)['TEST_CELL']), {'control', 'test_1', 'test_2', 'test_3'})
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
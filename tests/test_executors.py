@@ -0,0 +1,131 @@
+from ab_test_evaluator.executors import *
+from ab_test_evaluator.ab_test import ABTest
+
+import multiprocessing
+from multiprocessing.connection import Client
+import socket
+import time
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+AUTHKEY = 'unit-test-key'
+
+
+def _square(x):
+    return x * x
+
+
+def _fail(x):
+    raise ValueError('task {} failed'.format(x))
+
+
+_initialized = {}
+
+
+def _initialize(value):
+    _initialized['value'] = value
+
+
+def _initialized_value(_):
+    return _initialized['value']
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for(address):
+    """Waits for a worker to listen on address"""
+    for _ in range(100):
+        try:
+            conn = Client(address, authkey=AUTHKEY.encode('utf-8'))
+        except ConnectionRefusedError:
+            time.sleep(0.05)
+            continue
+        conn.send(('close',))
+        conn.close()
+        return
+    raise RuntimeError('No worker on {}'.format(address))
+
+
+class TestSocketExecutor(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.addresses = [('127.0.0.1', _free_port()) for _ in range(2)]
+        context = multiprocessing.get_context('fork')
+        cls.workers = [context.Process(target=serve, args=(address, AUTHKEY), daemon=True)
+                       for address in cls.addresses]
+        for worker in cls.workers:
+            worker.start()
+        for address in cls.addresses:
+            _wait_for(address)
+        cls.hosts = ['{}:{}'.format(*address) for address in cls.addresses]
+
+    def get_executor(self, initializer=None, initargs=()):
+        return create_executor(self.hosts, initializer=initializer, initargs=initargs, authkey=AUTHKEY)
+
+    def test_parse_hosts(self):
+        self.assertEqual(parse_hosts(['a:6000-6002', 'b:7000']),
+                         [('a', 6000), ('a', 6001), ('a', 6002), ('b', 7000)])
+        self.assertEqual(parse_hosts('a:6000,b:7000'), [('a', 6000), ('b', 7000)])
+        with self.assertRaises(ValueError):
+            parse_hosts(['6000'])
+
+    def test_map_keeps_order(self):
+        with self.get_executor() as executor:
+            self.assertEqual(executor.max_workers, 2)
+            for chunksize in [1, 3, 100]:
+                self.assertEqual(list(executor.map(_square, range(20), chunksize=chunksize)),
+                                 [x * x for x in range(20)])
+
+    def test_submit(self):
+        with self.get_executor() as executor:
+            futures = [executor.submit(pow, 2, x) for x in range(10)]
+            self.assertEqual([f.result() for f in futures], [2 ** x for x in range(10)])
+
+    def test_initializer_runs_on_every_worker(self):
+        with self.get_executor(_initialize, ('shared',)) as executor:
+            self.assertEqual(set(executor.map(_initialized_value, range(10))), {'shared'})
+
+    def test_task_errors_are_raised(self):
+        with self.get_executor() as executor:
+            with self.assertRaisesRegex(ValueError, 'task 3 failed'):
+                executor.submit(_fail, 3).result()
+            # the worker is still usable
+            self.assertEqual(executor.submit(_square, 3).result(), 9)
+
+    def test_requires_authkey(self):
+        with self.assertRaises(Exception):
+            create_executor(self.hosts, authkey='wrong-key')
+        # the workers keep serving after refusing a client
+        with self.get_executor() as executor:
+            self.assertEqual(executor.submit(_square, 4).result(), 16)
+
+    def test_rolling_stats_match_local_run(self):
+        df = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        df['COUNT'] = 1
+        df = df[df['DT'] < '2018-07-03']
+
+        local = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1)
+        remote = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1, hosts=self.hosts)
+        for test in [local, remote]:
+            test.test_cells = df['TEST_CELL'].unique()
+
+        with mock.patch.dict('os.environ', {AUTHKEY_ENV: AUTHKEY}):
+            distributed = remote.rolling_stats(df)
+        pd.testing.assert_frame_equal(local.rolling_stats(df), distributed)
+
+    @classmethod
+    def tearDownClass(cls):
+        for worker in cls.workers:
+            worker.terminate()
+            worker.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
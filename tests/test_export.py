@@ -0,0 +1,102 @@
+from ab_test_evaluator.export import *
+from ab_test_evaluator.ab_test import ABTest
+from ab_test_evaluator import sql_writer
+from ab_test_evaluator.storage import SQLiteBackend
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class TestExport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp_dir = tempfile.mkdtemp()
+        cls.backend = SQLiteBackend(os.path.join(cls.tmp_dir, 'ab_testing_data.db'))
+        cls.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1, cls.backend)
+        cls.test.load_test_data()
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        self.backend.verify_test_in_list('Unit_Test', 'test_config.yaml', 'a test')
+
+    def test_html_report(self):
+        result = export_reports(self.backend, self.out_dir, 'html', processes=1)
+
+        self.assertEqual(result['exported'], ['Unit_Test'])
+        with open(os.path.join(self.out_dir, 'Unit_Test.html')) as f:
+            page = f.read()
+        # daily, p-value and CI charts for every metric, plus quantiles for continuous ones
+        self.assertEqual(page.count('Plotly.newPlot'), 4 * 3 + 2)
+        self.assertTrue(os.path.exists(os.path.join(self.out_dir, PLOTLY_JS_FILE)))
+        with open(os.path.join(self.out_dir, INDEX_FILE)) as f:
+            self.assertIn('Unit_Test.html', f.read())
+
+    def test_json_report(self):
+        export_reports(self.backend, self.out_dir, 'json', processes=1)
+
+        with open(os.path.join(self.out_dir, 'Unit_Test.json')) as f:
+            report = json.load(f)
+        self.assertEqual([m['metric_name'] for m in report['metrics']], list(self.test.metric_definitions))
+        self.assertTrue(os.path.exists(os.path.join(self.out_dir, VIEWER_FILE)))
+
+    def test_skips_unchanged_tests(self):
+        export_reports(self.backend, self.out_dir, 'html', processes=1)
+        self.assertEqual(export_reports(self.backend, self.out_dir, 'html', processes=1)['skipped'],
+                         ['Unit_Test'])
+
+        self.backend.bump_load_version('Unit_Test')
+        self.assertEqual(export_reports(self.backend, self.out_dir, 'html', processes=1)['exported'],
+                         ['Unit_Test'])
+        # a different format is a different export
+        self.assertEqual(export_reports(self.backend, self.out_dir, 'json', processes=1)['exported'],
+                         ['Unit_Test'])
+
+    def test_removes_inactive_tests(self):
+        export_reports(self.backend, self.out_dir, 'html', processes=1)
+        self.backend.deactivate_test('Unit_Test')
+        result = export_reports(self.backend, self.out_dir, 'html', processes=1)
+
+        self.assertEqual(result['removed'], ['Unit_Test'])
+        self.assertFalse(os.path.exists(os.path.join(self.out_dir, 'Unit_Test.html')))
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp_dir)
+
+
+class TestExportWithoutMetrics(unittest.TestCase):
+    """Tests imported before the metric definitions were saved"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.out_dir = os.path.join(self.tmp_dir, 'reports')
+        self.backend = SQLiteBackend(os.path.join(self.tmp_dir, 'ab_testing_data.db'))
+        self.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1, self.backend)
+        self.test.load_test_data()
+        self.backend.verify_test_in_list('Unit_Test', 'test_config.yaml', 'a test')
+        self.backend.drop_table('Unit_Test' + sql_writer.METRICS_EXT)
+        self.backend.bump_load_version('Unit_Test')
+
+    def test_metrics_from_rolling_stats(self):
+        result = export_reports(self.backend, self.out_dir, 'json', processes=1)
+
+        self.assertEqual(result['exported'], ['Unit_Test'])
+        with open(os.path.join(self.out_dir, 'Unit_Test.json')) as f:
+            report = json.load(f)
+        self.assertEqual(sorted(m['metric_name'] for m in report['metrics']), sorted(self.test.metric_definitions))
+        # daily, p-value and CI charts only, the quantiles need the metric types
+        self.assertTrue(all(len(m['figures']) == 3 for m in report['metrics']))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import subprocess
+import sys
+import unittest
+
+
+# Budget for `import ab_test_evaluator`, in microseconds as reported by -X importtime.
+# The package itself only sets up lazy attributes, so this is generous.
+PACKAGE_IMPORT_BUDGET_US = 50000
+
+HEAVY_MODULES = ['scipy.stats', 'statsmodels.api']
+
+
+def import_times(*args):
+    """Runs python -X importtime with args, returns {module: cumulative microseconds}"""
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + list(args),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+
+    def test_package_import_within_budget(self):
+        times = import_times('-c', 'import ab_test_evaluator')
+        self.assertLess(times['ab_test_evaluator'], PACKAGE_IMPORT_BUDGET_US)
+        self.assertNotIn('pandas', times)
+
+    def test_ab_test_defers_heavy_modules(self):
+        times = import_times('-c', 'from ab_test_evaluator import ABTest')
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, times)
+
+    def test_dash_helper_defers_heavy_modules(self):
+        times = import_times('-c', 'from ab_test_evaluator import DashDataHelper')
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, times)
+
+    def test_run_import_help_skips_pandas(self):
+        times = import_times('run_import.py', '--help')
+        self.assertNotIn('pandas', times)
+
+
+if __name__ == '__main__':
+    unittest.main()
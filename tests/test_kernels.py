@@ -0,0 +1,67 @@
+from ab_test_evaluator.kernels import *
+from ab_test_evaluator.stats import _t_stat_from_moments
+
+import importlib.util
+import os
+import unittest
+from unittest import mock
+
+import numpy as np
+from scipy import stats
+
+
+class TestKernels(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = rng.lognormal(3, 1, 500)
+        self.matrix = np.column_stack([self.values, rng.normal(0, 1, 500)])
+        self.row_ids = np.arange(1000, 1500)
+
+    def test_resample_moments_draws_from_stream(self):
+        sums, sumsqs = resample_moments(self.values, 300, 20, seed=7, backend='numpy')
+
+        counters = np.arange(20 * 300, dtype=np.uint64)
+        draws = self.values[random_bits(seed_key(7), counters) % np.uint64(500)].reshape(20, 300)
+        np.testing.assert_allclose(sums, draws.sum(axis=1))
+        np.testing.assert_allclose(sumsqs, (draws ** 2).sum(axis=1))
+
+    def test_resample_moments_blocks_dont_change_draws(self):
+        expected = resample_moments(self.values, 500, 50, seed=7, backend='numpy')
+        with mock.patch('ab_test_evaluator.kernels.BOOTSTRAP_BLOCK_SIZE', 1200):
+            blocked = resample_moments(self.values, 500, 50, seed=7, backend='numpy')
+
+        np.testing.assert_allclose(blocked, expected)
+
+    def test_poisson_accumulate_matches_weights(self):
+        sums, weights = poisson_accumulate(self.matrix, self.row_ids, 40, seed=3, backend='numpy')
+
+        w = poisson_weights(self.row_ids, 40, seed=3)
+        np.testing.assert_allclose(sums, self.matrix.T @ w)
+        np.testing.assert_array_equal(weights, w.sum(axis=0))
+
+    def test_t_stat_from_moments(self):
+        a, b = self.values[:200], self.values[200:]
+        t = _t_stat_from_moments((a.sum(), (a ** 2).sum()), 200, (b.sum(), (b ** 2).sum()), 300)
+
+        self.assertAlmostEqual(t, stats.ttest_ind(a, b)[0])
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            get_backend('fortran')
+
+    def test_environment_picks_backend(self):
+        with mock.patch.dict(os.environ, {'AB_TEST_KERNELS': 'numpy'}):
+            self.assertEqual(get_backend(), 'numpy')
+
+    @unittest.skipUnless(importlib.util.find_spec('numba'), 'numba is not installed')
+    def test_numba_matches_numpy(self):
+        for args in [(self.values, 300, 20, 7), (self.values, 500, 64, 1)]:
+            np.testing.assert_allclose(resample_moments(*args, backend='numba'),
+                                       resample_moments(*args, backend='numpy'))
+        np.testing.assert_allclose(poisson_accumulate(self.matrix, self.row_ids, 40, 3, backend='numba')[0],
+                                   poisson_accumulate(self.matrix, self.row_ids, 40, 3, backend='numpy')[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
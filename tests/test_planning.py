@@ -0,0 +1,57 @@
+from ab_test_evaluator.planning import *
+from ab_test_evaluator.ab_test import ABTest
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+class TestPlanning(unittest.TestCase):
+
+    def setUp(self):
+        self.events = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        self.events['COUNT'] = 1
+        self.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1)
+        suffstats = self.test.daily_suffstats(self.events)
+        self.baselines = metric_baselines(suffstats, self.test.metric_definitions)
+        self.n_days = self.events['DT'].dt.floor('D').nunique()
+
+    def test_baselines_match_events(self):
+        net_rev = self.baselines.loc['net_rev_per_sr']
+        self.assertAlmostEqual(net_rev['BASELINE'], self.events['NET_REV'].mean())
+        self.assertAlmostEqual(net_rev['VARIANCE'] / self.events['NET_REV'].var(), 1)
+        self.assertAlmostEqual(net_rev['UNITS_PER_DAY'], self.events.shape[0] / self.n_days)
+
+        win_rate = self.baselines.loc['win_rate']
+        p = self.events['WON_LEADS'].sum() / self.events['CLOSED_LEADS'].sum()
+        self.assertAlmostEqual(win_rate['VARIANCE'], p * (1 - p))
+        self.assertAlmostEqual(win_rate['UNITS_PER_DAY'], self.events['CLOSED_LEADS'].sum() / self.n_days)
+
+    def test_grid_covers_every_scenario(self):
+        grid = planning_grid(self.baselines, [7, 14, 28], [.5, 1], [.2, .5, .8])
+
+        self.assertEqual(grid.shape[0], 4 * 3 * 2 * 3)
+        self.assertEqual(grid.groupby(['METRIC_NAME', 'DAYS', 'TRAFFIC', 'SPLIT']).ngroups, grid.shape[0])
+        # longer tests detect smaller effects
+        by_days = grid[(grid['TRAFFIC'] == 1) & (grid['SPLIT'] == .5)].pivot(
+            index='METRIC_NAME', columns='DAYS', values='MDE')
+        self.assertTrue((by_days.diff(axis=1).iloc[:, 1:] < 0).all().all())
+
+    def test_power_at_mde(self):
+        grid = planning_grid(self.baselines, [14], power=.8)
+        row = grid[grid['METRIC_NAME'] == 'win_rate'].iloc[0]
+        n = row['SAMPLE_SIZE'] / 2
+        variance = self.baselines.loc['win_rate', 'VARIANCE']
+
+        self.assertAlmostEqual(power_of_test(row['MDE'], variance, n, n), .8, places=3)
+
+    def test_power_column(self):
+        grid = planning_grid(self.baselines, [7, 28], relative_effect=.1)
+
+        self.assertTrue(grid['POWER'].between(0, 1).all())
+        self.assertTrue((grid.groupby('METRIC_NAME')['POWER'].diff().dropna() > 0).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
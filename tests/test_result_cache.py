@@ -0,0 +1,104 @@
+from ab_test_evaluator.result_cache import *
+from ab_test_evaluator.ab_test import ABTest
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.tmp_dir, 'cache.db'))
+
+    def test_round_trip(self):
+        df = pd.DataFrame({'TEST_CELL': ['Ctrl', 'Test'], 'P_VALUE': [.05, np.nan]})
+        self.cache.put('a', df)
+
+        pd.testing.assert_frame_equal(self.cache.get('a'), df)
+        self.assertIsNone(self.cache.get('b'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']), (1, 1, 1))
+
+    def test_counts_persist(self):
+        self.cache.put('a', 1)
+        self.cache.get('a')
+        reopened = ResultCache(self.cache.path)
+        reopened.get('a')
+
+        stats = reopened.stats()
+        self.assertEqual(stats['hits'], 1)
+        self.assertEqual(stats['total_hits'], 2)
+
+    def test_evicts_least_recently_used(self):
+        value = 'x' * 1000
+        self.cache.max_bytes = 3500
+        for key in 'abc':
+            self.cache.put(key, value)
+        self.cache.get('a')
+        self.cache.put('d', value)
+
+        self.assertEqual(set(self.cache.get_many('abcd')), {'a', 'c', 'd'})
+        self.assertLessEqual(self.cache.stats()['bytes'], 3500)
+
+    def test_key_depends_on_every_part(self):
+        key = result_key(metric='m', seed=0)
+        self.assertEqual(key, result_key(seed=0, metric='m'))
+        self.assertNotEqual(key, result_key(metric='m', seed=1))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+class TestCachedRollingStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.tmp_dir, 'cache.db'))
+        self.events = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        self.events['COUNT'] = 1
+        self.events = self.events[self.events['DT'] < '2018-07-03']
+
+    def get_test(self, result_cache=None):
+        test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1, result_cache=result_cache)
+        test.test_cells = self.events['TEST_CELL'].unique()
+        return test
+
+    def test_cached_results_match(self):
+        expected = self.get_test().rolling_stats(self.events)
+        first = self.get_test(self.cache).rolling_stats(self.events)
+        second = self.get_test(self.cache).rolling_stats(self.events)
+
+        pd.testing.assert_frame_equal(first, expected)
+        pd.testing.assert_frame_equal(second, expected)
+        # continuous metrics are cached, the closed-form binary and ratio metrics aren't
+        n_days = self.events['DT'].dt.floor('D').nunique()
+        self.assertEqual(self.cache.hits, 2 * n_days)
+
+    def test_new_day_only_runs_new_day(self):
+        last_day = self.events['DT'].dt.floor('D').max()
+        self.get_test(self.cache).rolling_stats(self.events[self.events['DT'] < last_day])
+        self.get_test(self.cache).rolling_stats(self.events)
+
+        self.assertEqual(self.cache.misses, 2 * self.events['DT'].dt.floor('D').nunique())
+
+    def test_changed_metric_only_runs_that_metric(self):
+        self.get_test(self.cache).rolling_stats(self.events)
+        test = self.get_test(self.cache)
+        test.metric_definitions['accepts_per_sr']['numerator_column'] = 'CONNECTIONS'
+        test.rolling_stats(self.events)
+
+        n_days = self.events['DT'].dt.floor('D').nunique()
+        self.assertEqual(self.cache.hits, n_days)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
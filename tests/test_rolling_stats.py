@@ -0,0 +1,177 @@
+from ab_test_evaluator.ab_test import *
+from ab_test_evaluator.dash_data_helper import DashDataHelper
+from ab_test_evaluator.storage import SQLiteBackend
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import yaml
+
+
+class TestRollingStats(unittest.TestCase):
+
+    def setUp(self):
+        self.base_df = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        self.base_df['COUNT'] = 1
+        # keep the bootstraps small, this is about scheduling, not stats
+        self.base_df = self.base_df[self.base_df['DT'] < '2018-07-03']
+
+    def get_test(self, processes):
+        test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', processes)
+        test.test_cells = self.base_df['TEST_CELL'].unique()
+        return test
+
+    def test_one_row_per_day_cell_metric(self):
+        df = self.get_test(1).rolling_stats(self.base_df)
+        n_days = self.base_df['DT'].dt.floor('D').nunique()
+
+        self.assertEqual(df.shape[0], n_days * 2 * 4)
+        self.assertEqual(df['DT'].nunique(), n_days)
+
+    def test_includes_last_day(self):
+        df = self.get_test(1).rolling_stats(self.base_df)
+
+        self.assertEqual(df['DT'].max(), self.base_df['DT'].max().floor('D'))
+
+    def test_same_result_for_any_worker_count(self):
+        sequential = self.get_test(1).rolling_stats(self.base_df)
+        parallel = self.get_test(3).rolling_stats(self.base_df)
+
+        pd.testing.assert_frame_equal(sequential, parallel)
+
+    def test_ratio_metric_matches_daily_sums(self):
+        df = self.get_test(1).rolling_stats(self.base_df)
+        df = df[df['METRIC_NAME'] == 'connection_rate']
+
+        last_day = df[df['DT'] == df['DT'].max()].set_index('TEST_CELL')['METRIC_VALUE']
+        sums = self.base_df.groupby('TEST_CELL')[['CONNECTIONS', 'CALL_TRACKING_LEADS']].sum()
+        expected = sums['CONNECTIONS'] / sums['CALL_TRACKING_LEADS']
+        for cell in expected.index:
+            self.assertAlmostEqual(last_day[cell], expected[cell])
+        # the first cell is the control, which the other cell is compared with
+        control = df['TEST_CELL'] == self.base_df['TEST_CELL'].iloc[0]
+        self.assertTrue(df.loc[control, 'P_VALUE'].isna().all())
+        self.assertTrue(df.loc[~control, 'P_VALUE'].between(0, 1).all())
+        self.assertTrue((df.loc[~control, 'LOWER_CI'] < df.loc[~control, 'UPPER_CI']).all())
+
+    def test_poisson_bootstrap_matches_resampling(self):
+        resampled = self.get_test(1).rolling_stats(self.base_df)
+        test = self.get_test(1)
+        test.bootstrap = 'poisson'
+        poisson = test.rolling_stats(self.base_df)
+
+        self.assertEqual(poisson.shape, resampled.shape)
+        for metric in ['accepts_per_sr', 'net_rev_per_sr']:
+            r = resampled[resampled['METRIC_NAME'] == metric].reset_index(drop=True)
+            p = poisson[poisson['METRIC_NAME'] == metric].reset_index(drop=True)
+            np.testing.assert_allclose(p['METRIC_VALUE'], r['METRIC_VALUE'])
+            # different bootstraps of the same data, so only roughly the same width
+            width = r['UPPER_CI'] - r['LOWER_CI']
+            np.testing.assert_allclose(p['UPPER_CI'] - p['LOWER_CI'], width, rtol=.25)
+
+    def test_daily_suffstats(self):
+        suffstats = self.get_test(1).daily_suffstats(self.base_df)
+
+        self.assertEqual(suffstats['COUNT'].sum(), self.base_df.shape[0])
+        self.assertAlmostEqual(suffstats['SUMSQ_NET_REV'].sum(), (self.base_df['NET_REV'] ** 2).sum())
+        self.assertAlmostEqual(suffstats['SUMXY_CONNECTIONS_CALL_TRACKING_LEADS'].sum(),
+                               (self.base_df['CONNECTIONS'] * self.base_df['CALL_TRACKING_LEADS']).sum())
+
+    def test_task_seed_depends_on_metric_and_day(self):
+        test = self.get_test(1)
+        day1, day2 = pd.Timestamp('2018-06-29'), pd.Timestamp('2018-06-30')
+
+        seed = test._task_seed(day1, 'win_rate').generate_state(1)
+        self.assertEqual(seed, test._task_seed(day1, 'win_rate').generate_state(1))
+        self.assertNotEqual(seed, test._task_seed(day2, 'win_rate').generate_state(1))
+        self.assertNotEqual(seed, test._task_seed(day1, 'accepts_per_sr').generate_state(1))
+
+
+class TestMultiCellRollingStats(unittest.TestCase):
+    """Splits the test cell of the test events into Test and Test_B"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        events = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        events.loc[(events['TEST_CELL'] == 'Test') & (events.index % 2 == 1), 'TEST_CELL'] = 'Test_B'
+        self.csv_file = os.path.join(self.tmp_dir, 'events.csv')
+        events.to_csv(self.csv_file, index=False)
+        events['COUNT'] = 1
+        self.events = events[events['DT'] < '2018-07-03']
+
+        with open('tests/test_config.yaml') as f:
+            config = yaml.safe_load(f)
+        config['control_cell'] = 'Ctrl'
+        self.config_file = os.path.join(self.tmp_dir, 'config.yaml')
+        with open(self.config_file, 'w') as f:
+            yaml.safe_dump(config, f)
+
+    def get_test(self, events, config_file=None):
+        test = ABTest(config_file or self.config_file, self.csv_file, 1)
+        test.test_cells = test._order_cells(events['TEST_CELL'].unique())
+        return test
+
+    def test_control_first(self):
+        test = self.get_test(self.events)
+        self.assertEqual(list(test.test_cells), ['Ctrl', 'Test', 'Test_B'])
+
+        test.control_cell = 'Test_B'
+        self.assertEqual(list(test._order_cells(np.array(['Ctrl', 'Test', 'Test_B']))),
+                         ['Test_B', 'Ctrl', 'Test'])
+
+    def test_needs_a_control_cell(self):
+        test = ABTest('tests/test_config.yaml', self.csv_file, 1)
+        with self.assertRaises(ValueError):
+            test._order_cells(np.array(['Ctrl', 'Test', 'Test_B']))
+        test.control_cell = 'Missing'
+        with self.assertRaises(ValueError):
+            test._order_cells(np.array(['Ctrl', 'Test']))
+
+    def test_each_cell_against_control(self):
+        df = self.get_test(self.events).rolling_stats(self.events)
+        n_days = self.events['DT'].dt.floor('D').nunique()
+
+        self.assertEqual(df.shape[0], n_days * 3 * 4)
+        self.assertTrue(df.loc[df['TEST_CELL'] == 'Ctrl', 'P_VALUE'].isna().all())
+        self.assertTrue(df.loc[df['TEST_CELL'] != 'Ctrl', 'P_VALUE'].between(0, 1).all())
+
+        # the closed-form stats match a two-cell test of the same cells
+        pair_events = self.events[self.events['TEST_CELL'] != 'Test']
+        pair = self.get_test(pair_events).rolling_stats(pair_events)
+        for metric in ['win_rate', 'connection_rate']:
+            got = df[(df['METRIC_NAME'] == metric) & (df['TEST_CELL'] == 'Test_B')]
+            want = pair[(pair['METRIC_NAME'] == metric) & (pair['TEST_CELL'] == 'Test_B')]
+            np.testing.assert_allclose(got['P_VALUE'].values, want['P_VALUE'].values)
+            np.testing.assert_allclose(got['LOWER_CI'].values, want['LOWER_CI'].values)
+
+    def test_poisson_bootstrap(self):
+        test = self.get_test(self.events)
+        test.bootstrap = 'poisson'
+        df = test.rolling_stats(self.events)
+        df = df[df['METRIC_NAME'] == 'net_rev_per_sr']
+
+        self.assertEqual(set(df['TEST_CELL']), {'Ctrl', 'Test', 'Test_B'})
+        self.assertTrue(df.loc[df['TEST_CELL'] != 'Ctrl', 'P_VALUE'].between(0, 1).all())
+
+    def test_load_saves_cells(self):
+        backend = SQLiteBackend(os.path.join(self.tmp_dir, 'ab_testing_data.db'))
+        ABTest(self.config_file, self.csv_file, 1, backend).load_test_data()
+        helper = DashDataHelper(backend=backend)
+
+        self.assertEqual(helper.get_test_cells('Unit_Test'), ['Ctrl', 'Test', 'Test_B'])
+        window = helper.get_window_stats('Unit_Test')
+        self.assertEqual(window.shape[0], 3 * 4)
+        self.assertTrue(window.loc[window['TEST_CELL'] == 'Ctrl', 'P_VALUE'].isna().all())
+        quantiles = helper.get_quantiles('Unit_Test')
+        self.assertEqual(set(quantiles['TEST_CELL']), {'Ctrl', 'Test', 'Test_B'})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+from ab_test_evaluator.scheduler import *
+from ab_test_evaluator.storage import SQLiteBackend, open_backend
+
+import importlib.util
+import os
+import shutil
+import tempfile
+import unittest
+
+import pandas as pd
+
+
+class TestScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.drop_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.drop_dir, 'ab_testing_data.db')
+        self.drop('unit_test', priority=0)
+
+    def drop(self, name, priority):
+        with open('tests/test_config.yaml') as f:
+            config = f.read()
+        with open(os.path.join(self.drop_dir, name + '.yml'), 'w') as f:
+            f.write(config + '\npriority: {}\n'.format(priority))
+        shutil.copy('tests/test_event_data.csv', os.path.join(self.drop_dir, name + '.csv'))
+
+    def get_scheduler(self, settle_seconds=0):
+        return Scheduler(self.drop_dir, self.db_path, max_workers=1, poll_interval=.1,
+                         settle_seconds=settle_seconds)
+
+    def record(self, scheduler):
+        for name, config_file, csv_file, signature, digest in scheduler.changed_tests():
+            scheduler.state[name] = {'signature': signature, 'hash': digest}
+
+    def test_finds_pairs(self):
+        open(os.path.join(self.drop_dir, 'no_config.csv'), 'w').close()
+
+        self.assertEqual(list(find_pairs(self.drop_dir)), ['unit_test'])
+
+    def test_waits_for_files_to_settle(self):
+        self.assertEqual(self.get_scheduler(settle_seconds=60).changed_tests(), [])
+        self.assertEqual(len(self.get_scheduler().changed_tests()), 1)
+
+    def test_only_changed_contents(self):
+        scheduler = self.get_scheduler()
+        self.record(scheduler)
+        self.assertEqual(scheduler.changed_tests(), [])
+
+        # a new modification time with the same contents isn't a change
+        csv_file = os.path.join(self.drop_dir, 'unit_test.csv')
+        os.utime(csv_file, (0, 0))
+        self.assertEqual(scheduler.changed_tests(), [])
+
+        with open(csv_file, 'a') as f:
+            f.write('\n')
+        self.assertEqual([t[0] for t in scheduler.changed_tests()], ['unit_test'])
+
+    def test_priority_order(self):
+        self.drop('urgent_test', priority=10)
+        scheduler = self.get_scheduler()
+        scheduler.poll()
+
+        self.assertEqual(scheduler._next_job()[0], 'urgent_test')
+        self.assertEqual(scheduler._next_job()[0], 'unit_test')
+        self.assertIsNone(scheduler._next_job())
+
+    def test_run_once_imports_and_records(self):
+        scheduler = self.get_scheduler()
+        scheduler.run(once=True)
+
+        self.assertEqual(scheduler.state['unit_test']['status'], 'ok')
+        df = SQLiteBackend(self.db_path).read_test_list()
+        self.assertEqual(df['load_version'].tolist(), [1])
+
+        # nothing changed, so a new scheduler has nothing to do
+        self.assertEqual(self.get_scheduler().changed_tests(), [])
+
+    def tearDown(self):
+        shutil.rmtree(self.drop_dir)
+
+
+class ConcurrentImportTests(object):
+    """Imports several tests at once into one store, mixed into a TestCase per backend"""
+
+    def setUp(self):
+        self.drop_dir = tempfile.mkdtemp()
+        self.names = ['test_{}'.format(i) for i in range(3)]
+        # a day of events keeps the imports short, it's the writes that collide
+        events = pd.read_csv('tests/test_event_data.csv')
+        events = events[events['DT'] < '2018-07-01']
+        with open('tests/test_config.yaml') as f:
+            config = f.read()
+        for name in self.names:
+            events.to_csv(os.path.join(self.drop_dir, name + '.csv'), index=False)
+            with open(os.path.join(self.drop_dir, name + '.yml'), 'w') as f:
+                f.write(config.replace('test_name: Unit Test', 'test_name: ' + name))
+
+    def test_concurrent_imports(self):
+        spec = self.get_storage(self.drop_dir)
+        scheduler = Scheduler(self.drop_dir, spec, max_workers=3, poll_interval=.1, settle_seconds=0)
+        scheduler.run(once=True)
+
+        self.assertEqual({name: state['status'] for name, state in scheduler.state.items()},
+                         {name: 'ok' for name in self.names})
+        backend = open_backend(spec)
+        tests = backend.read_test_list().set_index('test_name').sort_index()
+        self.assertEqual(tests.index.tolist(), self.names)
+        self.assertEqual(tests['config_file'].tolist(), [name + '.yml' for name in self.names])
+        self.assertEqual(tests['load_version'].tolist(), [1] * len(self.names))
+        self.assertEqual(sorted(backend.read_latest_results()['test_name'].unique()), self.names)
+
+    def tearDown(self):
+        shutil.rmtree(self.drop_dir)
+
+
+class TestConcurrentSQLiteImports(ConcurrentImportTests, unittest.TestCase):
+
+    def get_storage(self, tmp_dir):
+        return 'sqlite:' + os.path.join(tmp_dir, 'ab_testing_data.db')
+
+
+@unittest.skipUnless(importlib.util.find_spec('duckdb'), 'duckdb is not installed')
+class TestConcurrentDuckDBImports(ConcurrentImportTests, unittest.TestCase):
+
+    def get_storage(self, tmp_dir):
+        return 'duckdb:' + os.path.join(tmp_dir, 'ab_testing_data.duckdb')
+
+
+@unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+class TestConcurrentParquetImports(ConcurrentImportTests, unittest.TestCase):
+
+    def get_storage(self, tmp_dir):
+        return 'parquet:' + os.path.join(tmp_dir, 'ab_testing_data')
+
+
+if __name__ == '__main__':
+    unittest.main()
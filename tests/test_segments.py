@@ -0,0 +1,88 @@
+from ab_test_evaluator.suffstats import *
+from ab_test_evaluator.ab_test import ABTest
+from ab_test_evaluator.dash_data_helper import DashDataHelper
+from ab_test_evaluator.storage import SQLiteBackend
+import ab_test_evaluator.sql_writer as sw
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+class TestSegmentStats(unittest.TestCase):
+
+    def setUp(self):
+        self.events = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        self.events['COUNT'] = 1
+        self.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1)
+        self.test.test_cells = np.array(['Ctrl', 'Test'])
+        self.suffstats = self.test.segment_suffstats(self.events)
+
+    def test_segments_sum_to_total(self):
+        total = self.test.daily_suffstats(self.events).set_index(['DT', 'TEST_CELL'])
+        for segment in ['match_type', 'booking']:
+            df = self.suffstats[self.suffstats['SEGMENT_NAME'] == segment]
+            summed = df.drop(columns=SEGMENT_KEYS).groupby(['DT', 'TEST_CELL']).sum()
+            pd.testing.assert_frame_equal(summed, total, check_dtype=False)
+
+    def test_pattern_extracts_value(self):
+        values = self.suffstats[self.suffstats['SEGMENT_NAME'] == 'booking']['SEGMENT_VALUE']
+        self.assertEqual(set(values), {'Booking', 'Match', '(none)'})
+
+    def test_matches_stats_of_filtered_events(self):
+        segment = 'Instant Connect'
+        df = segment_stats(self.suffstats, self.test.metric_definitions, self.test.test_cells)
+        df = df[(df['SEGMENT_VALUE'] == segment) & (df['DT'] == df['DT'].max())]
+
+        filtered = self.events[self.events['MATCH_TYPE'] == segment]
+        expected = window_stats(self.test.daily_suffstats(filtered), self.test.metric_definitions,
+                                self.test.test_cells)
+
+        for col in ['METRIC_VALUE', 'P_VALUE', 'LOWER_CI', 'UPPER_CI']:
+            np.testing.assert_allclose(df[col].values.astype(float), expected[col].values.astype(float))
+
+    def test_one_row_per_day_segment_cell_metric(self):
+        df = segment_stats(self.suffstats, self.test.metric_definitions, self.test.test_cells)
+        n_segments = self.suffstats[SEGMENT_KEYS].drop_duplicates().shape[0]
+        n_days = self.suffstats['DT'].nunique()
+
+        self.assertEqual(df.shape[0], n_segments * n_days * 2 * 4)
+
+
+class TestGetSegments(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.backend = SQLiteBackend(os.path.join(self.tmp_dir, 'ab_testing_data.db'))
+        events = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        events['COUNT'] = 1
+        self.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1, self.backend)
+        self.test.test_cells = np.array(['Ctrl', 'Test'])
+        suffstats = self.test.segment_suffstats(events)
+        sw.insert_segment_rollup_data(self.test.segment_rollup(suffstats), self.test, self.backend)
+        sw.insert_segment_stats_data(
+            segment_stats(suffstats, self.test.metric_definitions, self.test.test_cells), self.test, self.backend)
+        self.helper = DashDataHelper(backend=self.backend)
+
+    def test_lists_segments(self):
+        df = self.helper.get_segments('Unit_Test')
+        self.assertEqual(df[df['SEGMENT_NAME'] == 'booking'].shape[0], 3)
+
+    def test_reads_one_segment(self):
+        df = self.helper.get_rolling_stats('Unit_Test', ('booking', 'Match'))
+        self.assertEqual(set(df['METRIC_NAME']), set(self.test.metric_definitions))
+        self.assertNotIn('SEGMENT_NAME', df.columns)
+
+        df = self.helper.get_daily_rollup('Unit_Test', ('booking', 'Match'))
+        self.assertEqual(df['DT'].nunique() * 2, df.shape[0])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
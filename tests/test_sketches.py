@@ -0,0 +1,67 @@
+from ab_test_evaluator.sketches import *
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+class TestQuantileSketch(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.values = np.concatenate((rng.lognormal(3, 2, 20000),
+                                      -rng.exponential(5, 500),
+                                      np.zeros(1000)))
+        rng.shuffle(self.values)
+        self.quantiles = np.array([0, .01, .1, .3, .5, .7, .9, .99, 1])
+
+    def exact(self, values):
+        return np.sort(values)[np.floor(self.quantiles * (values.shape[0] - 1)).astype(int)]
+
+    def test_within_relative_accuracy(self):
+        estimate = QuantileSketch.from_values(self.values).quantile(self.quantiles)
+        exact = self.exact(self.values)
+
+        error = np.abs(estimate - exact)
+        self.assertTrue(np.all(error <= DEFAULT_RELATIVE_ACCURACY * np.abs(exact) + 1e-12))
+
+    def test_merge_matches_single_sketch(self):
+        first = QuantileSketch.from_values(self.values[:10000])
+        second = QuantileSketch.from_values(self.values[10000:])
+        merged = first.merge(second)
+
+        self.assertEqual(merged.count, self.values.shape[0])
+        np.testing.assert_array_equal(merged.quantile(self.quantiles),
+                                      QuantileSketch.from_values(self.values).quantile(self.quantiles))
+
+    def test_cannot_merge_different_accuracy(self):
+        with self.assertRaises(ValueError):
+            QuantileSketch.from_values(self.values).merge(QuantileSketch.from_values(self.values, .05))
+
+    def test_empty_sketch(self):
+        self.assertTrue(np.all(np.isnan(QuantileSketch().quantile([.5]))))
+
+
+class TestWindowQuantiles(unittest.TestCase):
+
+    def setUp(self):
+        self.events = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        self.sketches = build_sketches(self.events, {'net_rev_per_sr': 'NET_REV'})
+
+    def test_counts_every_event(self):
+        self.assertEqual(self.sketches['COUNT'].sum(), self.events.shape[0])
+
+    def test_window_median(self):
+        df = window_quantiles(self.sketches, ['Ctrl', 'Test'], [.5], '2018-07-02', '2018-07-08')
+        window = self.events[(self.events['DT'] >= '2018-07-02') & (self.events['DT'] < '2018-07-09')]
+
+        for cell in ['Ctrl', 'Test']:
+            values = np.sort(window[window['TEST_CELL'] == cell]['NET_REV'].values)
+            exact = values[(values.shape[0] - 1) // 2]
+            estimate = df[df['TEST_CELL'] == cell]['VALUE'].iloc[0]
+            self.assertLessEqual(abs(estimate - exact), DEFAULT_RELATIVE_ACCURACY * abs(exact))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+from ab_test_evaluator.sources import *
+from ab_test_evaluator.ab_test import ABTest
+from ab_test_evaluator.dash_data_helper import DashDataHelper
+from ab_test_evaluator.result_cache import ResultCache
+from ab_test_evaluator.storage import SQLiteBackend
+
+import importlib.util
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+import yaml
+
+
+class TestSQLSource(unittest.TestCase):
+    """Uses a SQLite file of the test events as the source database"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.source_db = os.path.join(self.tmp_dir, 'events.db')
+        self.events = pd.read_csv('tests/test_event_data.csv')
+        with sqlite3.connect(self.source_db) as conn:
+            self.events.to_sql('events', conn, index=False)
+        self.events['DT'] = pd.to_datetime(self.events['DT'])
+        self.events['COUNT'] = 1
+        self.backend = SQLiteBackend(os.path.join(self.tmp_dir, 'ab_testing_data.db'))
+
+    def make_config(self, **source):
+        with open('tests/test_config.yaml') as f:
+            config = yaml.safe_load(f)
+        config['source'] = dict({'driver': 'sqlite3', 'connect': {'database': self.source_db},
+                                 'query': 'select * from events;'}, **source)
+        path = os.path.join(self.tmp_dir, 'config.yaml')
+        with open(path, 'w') as f:
+            yaml.safe_dump(config, f)
+        return path
+
+    def make_test(self, **source):
+        return ABTest(self.make_config(**source), None, 1, self.backend)
+
+    def test_suffstats_match_pandas(self):
+        test = self.make_test()
+        columns, products = test._suffstat_columns()
+        expected = test.daily_suffstats(self.events)
+        result = test.source.read_suffstats('DT', 'TEST_CELL', columns, products)
+
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    def test_streams_events(self):
+        test = self.make_test(aggregate=False, fetch_size=1000)
+        df = test.source.read_events()
+
+        self.assertEqual(df.shape, self.events.drop(columns='COUNT').shape)
+        np.testing.assert_allclose(df['NET_REV'], self.events['NET_REV'])
+
+    def test_aggregated_load(self):
+        test = self.make_test()
+        test.segments = {}
+        test.load_test_data()
+        helper = DashDataHelper(backend=self.backend)
+        stats = helper.get_rolling_stats('Unit_Test')
+
+        reference = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1)
+        reference.test_cells = stats['TEST_CELL'].unique()
+        expected = reference.rolling_stats(self.events[self.events['DT'] < '2018-07-03'])
+        # the closed-form stats match the event-level import, except for the bootstrap
+        for metric in ['win_rate', 'connection_rate']:
+            got = stats[(stats['METRIC_NAME'] == metric) & (stats['DT'] < '2018-07-03')]
+            want = expected[expected['METRIC_NAME'] == metric]
+            np.testing.assert_allclose(got['P_VALUE'].values, want['P_VALUE'].values)
+            np.testing.assert_allclose(got['METRIC_VALUE'].values, want['METRIC_VALUE'].values)
+
+        self.assertFalse(self.backend.table_exists('Unit_Test_sketches'))
+        self.assertTrue(helper.get_quantiles('Unit_Test').empty)
+
+    def test_aggregated_segments(self):
+        test = self.make_test()
+        del test.segments['booking']
+        test.load_test_data()
+
+        segments = DashDataHelper(backend=self.backend).get_segments('Unit_Test')
+        self.assertEqual(set(segments['SEGMENT_VALUE']), set(self.events['MATCH_TYPE']))
+
+    def test_pattern_segments_need_events(self):
+        with self.assertRaises(ValueError):
+            self.make_test().load_test_data()
+
+    def test_event_load(self):
+        self.make_test(aggregate=False).load_test_data()
+        self.assertTrue(self.backend.table_exists('Unit_Test_sketches'))
+
+    @unittest.skipUnless(importlib.util.find_spec('sqlalchemy'), 'sqlalchemy is not installed')
+    def test_sqlalchemy_url(self):
+        source = SQLSource('select * from events', url='sqlite:///' + self.source_db)
+        self.assertEqual(source.read_events().shape[0], self.events.shape[0])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+class TestPartitionedCSVSource(unittest.TestCase):
+    """Splits the test events into one gzipped CSV per day"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.partition_dir = os.path.join(self.tmp_dir, 'events')
+        os.mkdir(self.partition_dir)
+        events = pd.read_csv('tests/test_event_data.csv')
+        events = events.sort_values('DT', kind='stable').reset_index(drop=True)
+        for day, day_events in events.groupby(events['DT'].str[:10]):
+            day_events.to_csv(os.path.join(self.partition_dir, day + '.csv.gz'), index=False)
+        self.events = events
+        self.backend = SQLiteBackend(os.path.join(self.tmp_dir, 'ab_testing_data.db'))
+        self.cache = ResultCache(os.path.join(self.tmp_dir, 'cache.db'))
+
+    def make_test(self, csv_file, processes=2):
+        return ABTest('tests/test_config.yaml', csv_file, processes, self.backend, self.cache)
+
+    def test_list_partitions(self):
+        partitions = list_partitions(self.partition_dir)
+        self.assertEqual(partitions, sorted(partitions))
+        self.assertEqual(partitions, list_partitions(os.path.join(self.partition_dir, '*.csv.gz')))
+        self.assertEqual(partitions, list_partitions(partitions[::-1]))
+        with self.assertRaises(ValueError):
+            list_partitions(os.path.join(self.partition_dir, '*.parquet'))
+
+    def test_open_source(self):
+        self.assertIsInstance(open_source('tests/test_event_data.csv'), CSVSource)
+        self.assertIsInstance(open_source(self.partition_dir), PartitionedCSVSource)
+        source = open_source(source_config={'path': self.partition_dir, 'aggregate': True})
+        self.assertTrue(source.aggregated)
+
+    def test_reads_events_in_order(self):
+        df = self.make_test(self.partition_dir).source.read_events()
+        pd.testing.assert_frame_equal(df, self.events)
+
+    def test_suffstats_merge_by_day(self):
+        test = self.make_test(self.partition_dir)
+        columns, products = test._suffstat_columns()
+        events = self.events.assign(DT=pd.to_datetime(self.events['DT']), COUNT=1)
+        expected = test.daily_suffstats(events)
+        result = test.source.read_suffstats('DT', 'TEST_CELL', columns, products)
+
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    def test_skips_unchanged_partitions(self):
+        source = self.make_test(self.partition_dir).source
+        columns, products = self.make_test(self.partition_dir)._suffstat_columns()
+        n_partitions = len(list_partitions(self.partition_dir))
+        first = source.read_suffstats('DT', 'TEST_CELL', columns, products)
+        self.assertEqual(self.cache.misses, n_partitions)
+
+        # rewrite one day with a different size
+        path = list_partitions(self.partition_dir)[0]
+        day = pd.read_csv(path)
+        day.iloc[:1].to_csv(path, index=False)
+        second = source.read_suffstats('DT', 'TEST_CELL', columns, products)
+
+        self.assertEqual(self.cache.hits, n_partitions - 1)
+        self.assertEqual(self.cache.misses, n_partitions + 1)
+        self.assertEqual(second['COUNT'].sum(), first['COUNT'].sum() - len(day) + 1)
+
+    def test_load_matches_single_file(self):
+        self.make_test(self.partition_dir).load_test_data()
+        helper = DashDataHelper(backend=self.backend)
+        partitioned = helper.get_rolling_stats('Unit_Test')
+
+        # the same events in one file, in the same order
+        single_file = os.path.join(self.tmp_dir, 'events.csv')
+        self.events.to_csv(single_file, index=False)
+        ABTest('tests/test_config.yaml', single_file, 1, self.backend).load_test_data()
+        single = helper.get_rolling_stats('Unit_Test')
+
+        pd.testing.assert_frame_equal(partitioned, single)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
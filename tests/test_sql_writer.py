@@ -1,7 +1,10 @@
-from ab_testing_import.sql_writer import *
+from ab_test_evaluator.sql_writer import *
+from ab_test_evaluator.ab_test import ABTest
 
+import os
+import shutil
+import tempfile
 import unittest
-import sqlite3
 
 import pandas as pd
 
@@ -10,32 +13,35 @@ class TestInsertRollupData(unittest.TestCase):
 
     def setUp(self):
         self.base_df = pd.read_csv('tests/test_rollup_data.csv', parse_dates=['DT'])
-        self.test_name = 'fake_test_1'
+        self.tmp_dir = tempfile.mkdtemp()
+        self.backend = SQLiteBackend(self.get_database_path())
+        self.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1, self.backend)
+        self.test_name = sqlify_test_name(self.test.test_name)
 
     def get_database_path(self):
-        return DATABASE_FILE
+        return os.path.join(self.tmp_dir, DATABASE_FILE)
 
     def test_fails_on_missing_date(self):
         df = self.base_df.drop('DT', axis=1)
 
         with self.assertRaises(KeyError):
-            insert_daily_rollup_data(df, self.test_name)
+            insert_daily_rollup_data(df, self.test, self.backend)
 
     def test_fails_on_missing_test_cell(self):
         df = self.base_df.drop('TEST_CELL', axis=1)
 
         with self.assertRaises(KeyError):
-            insert_daily_rollup_data(df, self.test_name)
+            insert_daily_rollup_data(df, self.test, self.backend)
 
     def test_fails_on_extra_str_col(self):
         df = self.base_df.copy()
         df['extra_string'] = 'not a test cell'
 
         with self.assertRaises(TypeError):
-            insert_daily_rollup_data(df, self.test_name)
+            insert_daily_rollup_data(df, self.test, self.backend)
 
     def test_creates_table(self):
-        insert_daily_rollup_data(self.base_df, self.test_name)
+        insert_daily_rollup_data(self.base_df, self.test, self.backend)
 
         with sqlite_connection(self.get_database_path()) as conn:
             query = "select count(*) from sqlite_master where type = 'table' and name = ?"
@@ -47,7 +53,7 @@ class TestInsertRollupData(unittest.TestCase):
         self.assertEqual(result, 1)
     
     def test_inserts_all_data(self):
-        insert_daily_rollup_data(self.base_df, self.test_name)
+        insert_daily_rollup_data(self.base_df, self.test, self.backend)
 
         with sqlite_connection(self.get_database_path()) as conn:
             table_name = self.test_name + DAILY_ROLLUP_EXT
@@ -60,7 +66,7 @@ class TestInsertRollupData(unittest.TestCase):
         
 
     def test_sets_test_active(self):
-        insert_daily_rollup_data(self.base_df, self.test_name)
+        insert_daily_rollup_data(self.base_df, self.test, self.backend)
 
         with sqlite_connection(self.get_database_path()) as conn:
             query = "select count(*) from {} where test_name = ? and active_fg = 'Y'".format(TEST_LIST_TABLE)
@@ -71,16 +77,8 @@ class TestInsertRollupData(unittest.TestCase):
         self.assertEqual(result, 1)
 
     def tearDown(self):
-        # remove table from db and remove test from list
-        with sqlite_connection(self.get_database_path()) as conn:
-            query = "delete from {} where test_name = ?".format(TEST_LIST_TABLE)
-            conn.execute(query, (self.test_name,))
-
-            table_name = self.test_name + DAILY_ROLLUP_EXT
-            query = "drop table if exists {}".format(table_name)
-            conn.execute(query)
-
-            conn.commit()
+        # the whole database is temporary
+        shutil.rmtree(self.tmp_dir)
 
 
 if __name__ == '__main__':
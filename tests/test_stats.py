@@ -0,0 +1,140 @@
+from ab_test_evaluator.stats import *
+from ab_test_evaluator.stats import _center, _t_stat_from_moments
+
+import unittest
+
+import numpy as np
+
+
+def sufficient_stats(x, y):
+    return {'n': x.shape[0], 'sum_x': x.sum(), 'sum_y': y.sum(),
+            'sum_xx': (x * x).sum(), 'sum_yy': (y * y).sum(), 'sum_xy': (x * y).sum()}
+
+
+class TestRatioTestEval(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.control = (rng.random(5000) < .30).astype(float)
+        self.test = (rng.random(5000) < .32).astype(float)
+        ones = np.ones(5000)
+        self.ratio = RatioTestEval(sufficient_stats(self.control, ones),
+                                   sufficient_stats(self.test, ones))
+
+    def test_matches_binary_for_one_trial_per_row(self):
+        # with a denominator of 1 per row the delta method reduces to the
+        # binomial variance (up to the n / (n - 1) correction)
+        binary = BinaryTestEval(self.control, self.test)
+
+        np.testing.assert_allclose(self.ratio.ratio_ci(.9), binary.binary_ci(.9), rtol=1e-3)
+        # the proportions z-test pools the variance, so the p-values only roughly agree
+        np.testing.assert_allclose(self.ratio.ratio_pval(), binary.binary_pval(), rtol=.05)
+
+    def test_accepts_arrays(self):
+        stats_c = {k: np.array([v, v]) for k, v in self.ratio.control.items()}
+        stats_t = {k: np.array([v, v]) for k, v in self.ratio.test.items()}
+        lower, upper = RatioTestEval(stats_c, stats_t).ratio_ci()
+
+        self.assertEqual(lower.shape, (2,))
+        self.assertTrue(np.all(lower < upper))
+
+
+class TestPoissonBootstrap(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.control = rng.normal(10, 3, 4000)
+        self.test = rng.normal(10.5, 3, 4000)
+
+    def accumulate(self, values, first_id=0):
+        return PoissonBootstrap(500, seed=1).update(values, np.arange(first_id, first_id + values.shape[0]))
+
+    def test_weights_depend_only_on_row_id(self):
+        weights = poisson_weights(np.arange(1000), 50, seed=1)
+
+        np.testing.assert_array_equal(weights[600:], poisson_weights(np.arange(600, 1000), 50, seed=1))
+        self.assertAlmostEqual(weights.mean(), 1, delta=.02)
+        self.assertAlmostEqual(weights.var(), 1, delta=.05)
+
+    def test_chunks_merge_by_addition(self):
+        whole = self.accumulate(self.control)
+        merged = self.accumulate(self.control[:1500]) + self.accumulate(self.control[1500:], 1500)
+
+        np.testing.assert_allclose(merged.replicate_sums, whole.replicate_sums)
+        np.testing.assert_allclose(merged.replicate_weights, whole.replicate_weights)
+        self.assertAlmostEqual(merged.mean, self.control.mean())
+
+    def test_ci_close_to_normal_approximation(self):
+        b = PoissonBootstrapTestEval(self.accumulate(self.control), self.accumulate(self.test, 4000))
+        lower, upper = b.mean_diff_ci(.95)
+
+        diff = self.test.mean() - self.control.mean()
+        se = np.sqrt(self.control.var() / 4000 + self.test.var() / 4000)
+        self.assertAlmostEqual(lower, diff - 1.96 * se, delta=.3 * se)
+        self.assertAlmostEqual(upper, diff + 1.96 * se, delta=.3 * se)
+        self.assertLess(b.bootstrap_pval(), .05)
+
+
+class TestContinuousMultiTestEval(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.control = rng.normal(10, 3, 2000)
+        self.tests = [rng.normal(10.5, 3, 2000), rng.normal(10, 3, 1500)]
+
+    def test_one_test_cell_matches_two_cell_eval(self):
+        single = ContinuousTestEval(self.control, self.tests[0], seed=7)
+        multi = ContinuousMultiTestEval(self.control, self.tests[:1], seed=7)
+
+        self.assertEqual(multi.continuous_pvals(200)[0], single.continuous_pval(200))
+        lower, upper = multi.mean_diff_continuous_cis(200)
+        self.assertEqual((lower[0], upper[0]), single.mean_diff_continuous_ci(200))
+
+    def test_one_result_per_test_cell(self):
+        multi = ContinuousMultiTestEval(self.control, self.tests, seed=7)
+        p_vals = multi.continuous_pvals(200)
+        lower, upper = multi.mean_diff_continuous_cis(200)
+
+        self.assertEqual(p_vals.shape, (2,))
+        self.assertTrue(np.all(lower < upper))
+        for test, lb, ub in zip(self.tests, lower, upper):
+            diff = test.mean() - self.control.mean()
+            self.assertTrue(lb < diff < ub)
+
+
+class TestLargeMean(unittest.TestCase):
+    """A mean far above the spread, where sums of squares of the raw values cancel"""
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.control = rng.normal(0, .01, 5000)
+        self.test = rng.normal(.001, .01, 5000)
+        self.offset = 1e8
+
+    def test_t_stat_matches_ttest(self):
+        control, test = self.control + self.offset, self.test + self.offset
+        pooled = np.append(control, test)
+        moments = [(np.array([x.sum()]), np.array([(x * x).sum()])) for x in (_center(control, pooled.mean()),
+                                                                          _center(test, pooled.mean()))]
+
+        t_stat = _t_stat_from_moments(moments[0], 5000, moments[1], 5000)[0]
+        # without centering this is -0.05. Against the unshifted data, as at 1e8 even
+        # ttest_ind's difference of means keeps only about 5 digits
+        self.assertAlmostEqual(t_stat, stats.ttest_ind(self.control, self.test)[0], places=4)
+
+    def test_p_value_and_ci_ignore_the_offset(self):
+        for shifted in [False, True]:
+            offset = self.offset if shifted else 0
+            single = ContinuousTestEval(self.control + offset, self.test + offset, seed=7)
+            multi = ContinuousMultiTestEval(self.control + offset, [self.test + offset], seed=7)
+            with self.subTest(offset=offset):
+                # t is about -6, no permutation of the pooled events gets near it
+                self.assertEqual(single.continuous_pval(500), 0)
+                self.assertEqual(multi.continuous_pvals(500)[0], 0)
+                lower, upper = single.mean_diff_continuous_ci(500)
+                self.assertTrue(lower < self.test.mean() - self.control.mean() < upper)
+                self.assertGreater(lower, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,261 @@
+from ab_test_evaluator.storage import *
+from ab_test_evaluator.ab_test import ABTest
+import ab_test_evaluator.sql_writer as sw
+
+import copy
+import importlib.util
+import os
+import pickle
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import pandas as pd
+
+
+class BackendTests(object):
+    """Tests run against every backend, mixed into a TestCase per backend"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.backend = self.make_backend(self.tmp_dir)
+        self.events = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        self.events['COUNT'] = 1
+        self.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1,
+                           SQLiteBackend(os.path.join(self.tmp_dir, 'reference.db')))
+
+    def test_round_trip(self):
+        df = pd.read_csv('tests/test_rollup_data.csv', parse_dates=['DT'])
+        self.backend.write_table(df, 'fake_test_1_daily')
+
+        self.assertTrue(self.backend.table_exists('fake_test_1_daily'))
+        result = self.backend.read_table('fake_test_1_daily', parse_dates=['DT'])
+        self.assertEqual(result.shape, df.shape)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(result['DT']))
+
+        self.backend.drop_table('fake_test_1_daily')
+        self.assertFalse(self.backend.table_exists('fake_test_1_daily'))
+
+    def test_test_list(self):
+        self.backend.verify_test_in_list('fake_test_1', 'config.yml', 'a test')
+        self.backend.verify_test_in_list('fake_test_2', 'config.yml', 'another test')
+        self.backend.deactivate_test('fake_test_1')
+
+        df = self.backend.read_test_list().set_index('test_name')
+        self.assertEqual(df.loc['fake_test_1', 'active_fg'], 'N')
+        self.assertEqual(df.loc['fake_test_2', 'active_fg'], 'Y')
+
+    def test_load_version(self):
+        self.backend.verify_test_in_list('fake_test_1', 'config.yml', 'a test')
+        self.backend.bump_load_version('fake_test_1')
+        self.backend.bump_load_version('fake_test_1')
+        # re-verifying the test (as every table insert does) keeps the version
+        self.backend.verify_test_in_list('fake_test_1', 'config.yml', 'a test')
+
+        df = self.backend.read_test_list().set_index('test_name')
+        self.assertEqual(df.loc['fake_test_1', 'load_version'], 2)
+
+    def test_latest_results(self):
+        stats = pd.DataFrame({'DT': pd.to_datetime(['2018-07-01'] * 2 + ['2018-07-02'] * 2),
+                              'TEST_CELL': ['Ctrl', 'Test'] * 2,
+                              'METRIC_NAME': 'win_rate',
+                              'METRIC_VALUE': [.1, .2, .3, .4],
+                              'P_VALUE': [.5, .5, .01, .01],
+                              'LOWER_CI': [-.1, -.1, .05, .05],
+                              'UPPER_CI': [.1, .1, .15, .15]})
+        sw.update_latest_results(stats, self.test, self.backend)
+        self.backend.verify_test_in_list('Unit_Test', 'config.yml', 'a test')
+        # a reload replaces the test's rows
+        sw.update_latest_results(stats, self.test, self.backend)
+
+        df = self.backend.read_latest_results()
+        self.assertEqual(list(df.columns), LATEST_RESULTS_COLUMNS)
+        self.assertEqual(list(df['test_cell']), ['Ctrl', 'Test'])
+        self.assertEqual(list(df['dt']), ['2018-07-02'] * 2)
+        self.assertEqual(list(df['metric_value']), [.3, .4])
+
+        self.backend.deactivate_test('Unit_Test')
+        self.assertEqual(self.backend.read_latest_results().shape[0], 0)
+
+    def test_suffstats_match_pandas(self):
+        expected = self.test.daily_suffstats(self.events)
+        result = self.backend.aggregate_suffstats(self.events, ['NET_REV', 'CONNECTIONS', 'CALL_TRACKING_LEADS'],
+                                                  [('CONNECTIONS', 'CALL_TRACKING_LEADS')])
+
+        for col in result.columns:
+            pd.testing.assert_series_equal(result[col], expected[col], check_dtype=False)
+
+    def test_grouped_suffstats_match_pandas(self):
+        columns = ['NET_REV', 'CONNECTIONS', 'CALL_TRACKING_LEADS']
+        products = [('CONNECTIONS', 'CALL_TRACKING_LEADS')]
+        expected = StorageBackend.aggregate_suffstats(self.backend, self.events, columns, products, ['MATCH_TYPE'])
+        result = self.backend.aggregate_suffstats(self.events, columns, products, ['MATCH_TYPE'])
+
+        self.assertEqual(list(result.columns), list(expected.columns))
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    def test_cumulative_suffstats_match_pandas(self):
+        daily = self.test.daily_suffstats(self.events)
+        # drop a day from one cell, it should still get a cumulative row
+        daily = daily.drop(index=3)
+        expected = StorageBackend.cumulate_suffstats(self.backend, daily)
+        result = self.backend.cumulate_suffstats(daily)
+
+        self.assertEqual(result.shape[0], daily['DT'].nunique() * 2)
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+class TestSQLiteBackend(BackendTests, unittest.TestCase):
+
+    def make_backend(self, tmp_dir):
+        return SQLiteBackend(os.path.join(tmp_dir, 'ab_testing_data.db'))
+
+
+@unittest.skipUnless(importlib.util.find_spec('duckdb'), 'duckdb is not installed')
+class TestDuckDBBackend(BackendTests, unittest.TestCase):
+
+    def make_backend(self, tmp_dir):
+        return DuckDBBackend(os.path.join(tmp_dir, 'ab_testing_data.duckdb'))
+
+
+@unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'pyarrow is not installed')
+class TestParquetBackend(BackendTests, unittest.TestCase):
+
+    def make_backend(self, tmp_dir):
+        return ParquetBackend(os.path.join(tmp_dir, 'ab_testing_data'))
+
+
+class TestReadOnlySQLiteBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'ab_testing_data.db')
+        self.writer = SQLiteBackend(self.path)
+        self.writer.verify_test_in_list('fake_test_1', 'config.yml', 'a test')
+        self.writer.write_table(pd.read_csv('tests/test_rollup_data.csv', parse_dates=['DT']), 'fake_test_1_daily')
+        self.backend = SQLiteBackend(self.path, read_only=True)
+
+    def test_reads_match_writer(self):
+        pd.testing.assert_frame_equal(self.backend.read_table('fake_test_1_daily', parse_dates=['DT']),
+                                      self.writer.read_table('fake_test_1_daily', parse_dates=['DT']))
+        pd.testing.assert_frame_equal(self.backend.read_test_list(), self.writer.read_test_list())
+        self.assertEqual(len(self.backend.read_latest_results()), 0)
+
+    def test_refuses_writes(self):
+        with self.assertRaises(sqlite3.OperationalError):
+            self.backend.drop_table('fake_test_1_daily')
+        self.assertTrue(self.writer.table_exists('fake_test_1_daily'))
+
+    def test_sees_later_writes(self):
+        self.backend.read_table('fake_test_1_daily')
+        self.writer.bump_load_version('fake_test_1')
+        self.assertEqual(self.backend.read_test_list()['load_version'].tolist(), [1])
+
+    def test_missing_file_reads_empty(self):
+        backend = SQLiteBackend(os.path.join(self.tmp_dir, 'missing.db'), read_only=True)
+        self.assertEqual(len(backend.read_test_list()), 0)
+        self.assertEqual(len(backend.read_latest_results()), 0)
+        self.assertFalse(os.path.exists(backend.db_path))
+
+    def test_one_connection_per_thread(self):
+        pool = self.backend._read_pool
+        with pool.connection() as first, pool.connection() as second:
+            self.assertIs(first, second)
+
+        other = []
+        thread = threading.Thread(target=lambda: other.append(pool.connection().__enter__()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(other[0], first)
+        self.assertEqual(first.execute('pragma query_only').fetchone()[0], 1)
+
+    def test_connection_survives_errors(self):
+        with self.backend._read_pool.connection() as conn:
+            pass
+        with self.assertRaises(Exception):
+            self.backend.read_table('no_such_table')
+        with self.backend._read_pool.connection() as after:
+            self.assertIs(after, conn)
+        self.assertEqual(len(self.backend.read_table('fake_test_1_daily')), 42)
+
+    def test_pickles_without_connections(self):
+        self.backend.read_table('fake_test_1_daily')
+        backend = pickle.loads(pickle.dumps(self.backend))
+        self.assertEqual(backend._read_pool._connections, [])
+        pd.testing.assert_frame_equal(backend.read_table('fake_test_1_daily'),
+                                      self.backend.read_table('fake_test_1_daily'))
+
+    def test_close(self):
+        with self.backend._read_pool.connection() as conn:
+            pass
+        self.backend._read_pool.close()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute('select 1')
+        # the next query opens a new connection
+        self.assertTrue(self.backend.table_exists('fake_test_1_daily'))
+
+    def test_sqlite_connection_closes_on_error(self):
+        with self.assertRaises(ValueError):
+            with sqlite_connection(self.path) as conn:
+                raise ValueError()
+        with self.assertRaises(sqlite3.ProgrammingError):
+            conn.execute('select 1')
+
+    def tearDown(self):
+        self.backend._read_pool.close()
+        shutil.rmtree(self.tmp_dir)
+
+
+class TestOpenBackend(unittest.TestCase):
+
+    def test_parses_kind(self):
+        self.assertIsInstance(open_backend('duckdb:results.duckdb'), DuckDBBackend)
+        self.assertIsInstance(open_backend('parquet:results/'), ParquetBackend)
+
+    def test_plain_path_is_sqlite(self):
+        backend = open_backend('ab_testing_data.db')
+        self.assertIsInstance(backend, SQLiteBackend)
+        self.assertEqual(backend.db_path, 'ab_testing_data.db')
+
+    def test_read_only(self):
+        self.assertTrue(open_backend('sqlite:ab_testing_data.db', read_only=True).read_only)
+        self.assertFalse(open_backend('ab_testing_data.db').read_only)
+
+
+class TestLockedBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lock = threading.Lock()
+        self.backend = LockedBackend(SQLiteBackend(os.path.join(self.tmp_dir, 'ab_testing_data.db')), self.lock)
+
+    def test_calls_hold_the_lock(self):
+        held = []
+        self.backend.backend.table_exists = lambda table_name: held.append(self.lock.locked())
+
+        self.backend.table_exists(TEST_LIST_TABLE)
+        self.assertEqual(held, [True])
+        self.assertFalse(self.lock.locked())
+
+    def test_passes_calls_through(self):
+        self.backend.verify_test_in_list('test_1', 'test_1.yml', 'A test')
+        self.backend.bump_load_version('test_1')
+
+        df = self.backend.read_test_list()
+        self.assertEqual(df['load_version'].tolist(), [1])
+        self.assertEqual(self.backend.db_path, self.backend.backend.db_path)
+
+    def test_copies(self):
+        self.assertIs(copy.copy(self.backend).backend, self.backend.backend)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+from ab_test_evaluator.suffstats import *
+from ab_test_evaluator.ab_test import ABTest
+from ab_test_evaluator.dash_data_helper import DashDataHelper
+from ab_test_evaluator.stats import BinaryTestEval
+from ab_test_evaluator.storage import SQLiteBackend
+import ab_test_evaluator.sql_writer as sw
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+
+class TestWindowStats(unittest.TestCase):
+
+    def setUp(self):
+        self.events = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        self.events['COUNT'] = 1
+        self.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1)
+        self.suffstats = self.test.daily_suffstats(self.events)
+        self.cells = ['Ctrl', 'Test']
+        self.start, self.end = pd.Timestamp('2018-07-02'), pd.Timestamp('2018-07-08')
+        self.window = self.events[(self.events['DT'] >= self.start) &
+                                  (self.events['DT'] < self.end + pd.Timedelta(days=1))]
+
+    def get_stats(self, metric):
+        df = window_stats(self.suffstats, self.test.metric_definitions, self.cells, self.start, self.end)
+        return df[df['METRIC_NAME'] == metric].set_index('TEST_CELL')
+
+    def test_values_match_events(self):
+        df = self.get_stats('net_rev_per_sr')
+        means = self.window.groupby('TEST_CELL')['NET_REV'].mean()
+
+        for cell in self.cells:
+            self.assertAlmostEqual(df.loc[cell, 'METRIC_VALUE'], means[cell])
+
+    def test_binary_matches_trials(self):
+        df = self.get_stats('win_rate')
+        trials = {}
+        for cell in self.cells:
+            sums = self.window[self.window['TEST_CELL'] == cell][['WON_LEADS', 'CLOSED_LEADS']].sum()
+            trials[cell] = np.concatenate((np.ones(int(sums['WON_LEADS'])),
+                                           np.zeros(int(sums['CLOSED_LEADS'] - sums['WON_LEADS']))))
+        b = BinaryTestEval(trials['Ctrl'], trials['Test'])
+
+        self.assertAlmostEqual(df.loc['Test', 'P_VALUE'], b.binary_pval())
+        np.testing.assert_allclose(df.loc['Test', ['LOWER_CI', 'UPPER_CI']].values.astype(float),
+                                   b.binary_ci())
+
+    def test_continuous_is_welch(self):
+        df = self.get_stats('accepts_per_sr')
+        groups = [self.window[self.window['TEST_CELL'] == cell]['ACCEPTS'] for cell in self.cells]
+        se = np.sqrt(sum(g.var() / g.shape[0] for g in groups))
+        diff = groups[1].mean() - groups[0].mean()
+
+        self.assertAlmostEqual(df.loc['Test', 'LOWER_CI'], diff - 1.959963984540054 * se)
+
+    def test_full_window_matches_rolling_ratio(self):
+        self.test.test_cells = np.array(self.cells)
+        rolling = self.test.rolling_stats(self.events[self.events['DT'] < '2018-07-01'])
+        rolling = rolling[(rolling['DT'] == rolling['DT'].max()) & (rolling['METRIC_NAME'] == 'connection_rate')]
+        df = window_stats(self.suffstats, self.test.metric_definitions, self.cells, None, '2018-06-30')
+        df = df[df['METRIC_NAME'] == 'connection_rate']
+
+        np.testing.assert_allclose(df['P_VALUE'].values, rolling['P_VALUE'].values)
+
+
+class TestEvaluateCells(unittest.TestCase):
+
+    def setUp(self):
+        events = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        events['COUNT'] = 1
+        # split the test cell in two
+        events.loc[(events['TEST_CELL'] == 'Test') & (events.index % 2 == 1), 'TEST_CELL'] = 'Test_B'
+        self.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1)
+        suffstats = self.test.daily_suffstats(events)
+        self.cell_stats = [suffstats[suffstats['TEST_CELL'] == cell].reset_index(drop=True)
+                           for cell in ['Ctrl', 'Test', 'Test_B']]
+
+    def test_matches_pairwise_comparisons(self):
+        for metric, m_dict in self.test.metric_definitions.items():
+            result = evaluate_cells(m_dict, self.cell_stats)
+            self.assertEqual(result['P_VALUE'].shape, (3, len(self.cell_stats[0])))
+            self.assertTrue(np.isnan(result['P_VALUE'][0]).all())
+            for i in [1, 2]:
+                pair = evaluate_metric(m_dict, self.cell_stats[0], self.cell_stats[i])
+                np.testing.assert_allclose(result['P_VALUE'][i], pair['P_VALUE'])
+                np.testing.assert_allclose(result['LOWER_CI'][i], pair['LOWER_CI'])
+                np.testing.assert_allclose(result['METRIC_VALUE'][i], pair['TEST_VALUE'])
+                np.testing.assert_allclose(result['METRIC_VALUE'][0], pair['CONTROL_VALUE'])
+
+    def test_window_stats_has_a_row_per_cell(self):
+        suffstats = pd.concat(self.cell_stats, ignore_index=True)
+        df = window_stats(suffstats, self.test.metric_definitions, ['Test_B', 'Ctrl', 'Test'])
+
+        self.assertEqual(df.shape[0], 3 * 4)
+        self.assertTrue(df.loc[df['TEST_CELL'] == 'Test_B', 'P_VALUE'].isna().all())
+        self.assertTrue(df.loc[df['TEST_CELL'] != 'Test_B', 'P_VALUE'].between(0, 1).all())
+
+
+class TestGetWindowStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.backend = SQLiteBackend(os.path.join(self.tmp_dir, 'ab_testing_data.db'))
+        events = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
+        events['COUNT'] = 1
+        self.test = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1, self.backend)
+        sw.insert_suffstats_data(self.test.daily_suffstats(events), self.test, self.backend)
+        sw.insert_metric_definitions(self.test, self.backend)
+        self.helper = DashDataHelper(backend=self.backend)
+
+    def test_reads_metric_definitions(self):
+        definitions = self.helper.get_metric_definitions('Unit_Test')
+        self.assertEqual(definitions['win_rate']['type'], 'binary')
+        self.assertEqual(definitions['connection_rate']['denominator_column'], 'CALL_TRACKING_LEADS')
+
+    def test_one_row_per_cell_and_metric(self):
+        df = self.helper.get_window_stats('Unit_Test', '2018-07-02', '2018-07-08')
+        self.assertEqual(df.shape[0], 2 * 4)
+        # without a cells table or rolling stats, the first cell of the suffstats is the control
+        self.assertTrue(df.loc[df['TEST_CELL'] == 'Ctrl', 'P_VALUE'].isna().all())
+        self.assertTrue(df.loc[df['TEST_CELL'] == 'Test', 'P_VALUE'].between(0, 1).all())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,4 @@
-from ab_testing_import.test_setup import *
+from ab_test_evaluator.ab_test import *
 
 import unittest
 
@@ -8,17 +8,32 @@ import pandas as pd
 class TestDailyRollup(unittest.TestCase):
 
     def setUp(self):
-        self.base_df = pd.read_csv('tests/test_event_data.csv', parse_dates=['DT'])
-        self.test_obj = ABTest('tests/test_config.yaml')
+        self.test_obj = ABTest('tests/test_config.yaml', 'tests/test_event_data.csv', 1)
+        self.base_df = self.test_obj.read_events()
+        self.test_obj.test_cells = self.test_obj._order_cells(self.base_df['TEST_CELL'].unique())
 
-    @unittest.skip
     def test_daily_rollup(self):
-        self.test_obj.daily_rollup(self.base_df)
-        self.base_df
+        df = self.test_obj.daily_rollup(self.base_df)
+        # tests/test_rollup_data.csv is the same rollup, made outside this package
+        expected = pd.read_csv('tests/test_rollup_data.csv', parse_dates=['DT'])
+        expected = expected.rename(columns={'ACCEPTS/SR': 'accepts_per_sr', 'WIN_RATE': 'win_rate',
+                                            'NREV/SR': 'net_rev_per_sr', 'CONNECTION_RATE': 'connection_rate'})
+
+        merged = df.merge(expected, on=['DT', 'TEST_CELL'], suffixes=('', '_expected'))
+        self.assertEqual(len(merged), len(df))
+        for metric in self.test_obj.metric_definitions:
+            pd.testing.assert_series_equal(merged[metric], merged[metric + '_expected'],
+                                           check_names=False)
 
     def test_rolling_stats(self):
-        print(self.test_obj.rolling_stats(self.base_df))
-        
+        df = self.base_df[self.base_df['DT'] < '2018-07-03']
+        stats = self.test_obj.rolling_stats(df)
+
+        self.assertEqual(stats['DT'].max(), df['DT'].max().floor('D'))
+        control = stats['TEST_CELL'] == self.test_obj.test_cells[0]
+        self.assertTrue(stats.loc[control, 'P_VALUE'].isnull().all())
+        self.assertTrue(stats.loc[~control, 'P_VALUE'].between(0, 1).all())
+        self.assertTrue((stats.loc[~control, 'LOWER_CI'] <= stats.loc[~control, 'UPPER_CI']).all())
 
 
 if __name__ == '__main__':